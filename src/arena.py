@@ -0,0 +1,337 @@
+from argparse import ArgumentParser
+from json import dump, dumps
+from math import sqrt
+from multiprocessing import get_context
+from os import cpu_count
+from random import Random, seed as seed_random
+from sys import stdout
+from time import perf_counter
+
+from logic import Logic
+from model_file import load_model
+from logics import BadMoves, ChaiseTail, Eat, IncreaseBoardControl, Kill, PathDistances
+from simulator import MOVES, Simulator
+from utils.game_state import GameState
+from utils.vector import directions
+
+"""
+Battlesnake arena, for comparing strategies and models over many local games.
+"""
+
+STRATEGIES = ("greedy", "search", "mcts")
+
+# The logics each baseline tries in order, by the name of their method
+BASELINES = {
+    "eat": ("eat", "chase_tail"),
+    "tail": ("chase_tail",),
+    "kill": ("possible_kill", "eat", "chase_tail"),
+    "control": ("increase_board_control",),
+}
+
+
+class Baseline(BadMoves, Eat, PathDistances, ChaiseTail, Kill, IncreaseBoardControl):
+    """
+    A simple bot that plays the first of its logics to give a safe move.
+
+    Moves that collide are never played, and moves that risk a head-to-head only when no
+    logic gives a better one.
+    """
+
+    def __init__(self, logics):
+        """
+        logics: Names of the methods to try in order, e.g. ("eat", "chase_tail").
+        """
+        self.logics = logics
+
+    def choose_start(self, data):
+        pass
+
+    def choose_move(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: The move, "up", "down", "left" or "right"
+        """
+        gs = GameState(data)
+
+        # The logics were written for other snakes, and some fail on boards they did not expect
+        moves = []
+        for name in self.logics:
+            try:
+                moves.append(getattr(self, name)(gs))
+            except (IndexError, TypeError, ValueError):
+                moves.append(None)
+        moves += directions
+
+        for move in moves:
+            if not self.death_move(move, gs) and not self.risky_move(move, gs):
+                return self._direction(move)
+        for move in moves:
+            if not self.death_move(move, gs):
+                return self._direction(move)
+        return "up"
+
+    def choose_end(self, data):
+        pass
+
+    def _direction(self, move):
+        # Vectors are named for the old API, in which "up" decreased y, so only offsets count
+        return {(0, 1): "up", (0, -1): "down", (-1, 0): "left", (1, 0): "right"}[
+            (move.x, move.y)
+        ]
+
+
+def create_player(spec, model_path=None, search_budget=50):
+    """
+    spec: A strategy of Logic, "greedy", "search" or "mcts", optionally followed by
+            "=" and the path of its model, or the name of a baseline.
+    model_path: The path of the model of strategies that name none.
+    search_budget: Milliseconds Logic may search for.
+    return: The player, with choose_start, choose_move and choose_end like Logic
+    """
+    name, _, path = spec.partition("=")
+    if name in BASELINES:
+        return Baseline(BASELINES[name])
+    if name not in STRATEGIES:
+        raise ValueError(f"unknown player {spec!r}")
+
+    path = path or model_path
+    model = load_model(path) if path else None
+    return Logic(model, strategy=name, search_budget=search_budget)
+
+
+def play_game(players, names, game_id, size=11, max_turns=500, seed=0, observe=None):
+    """
+    players: The players of the game, one snake each.
+    names: The names of the players, for the results.
+    game_id: The id of the game.
+    size: Width and height of the board.
+    max_turns: Turn after which the game is a draw between the snakes left.
+    seed: Seed of the starting positions, food and random choices of players.
+    observe: Function of (simulator, index, move) called before every move is played,
+            e.g. to record positions.
+    return: List of (name, outcome, move milliseconds) of every player, where the outcome
+            is "win", "loss" or "draw"
+    """
+    rng = Random(seed)
+    seed_random(seed)
+    simulator = Simulator.start(size, size, len(players), rng)
+    game = {
+        "id": game_id,
+        "ruleset": {"name": "standard", "version": "v1.0.0"},
+        "timeout": 500,
+    }
+
+    requests = [simulator.to_request(index, game) for index in range(len(players))]
+    for player, data in zip(players, requests):
+        player.choose_start(data)
+
+    times = [[] for _ in players]
+    eliminated = [None] * len(players)
+    while not simulator.is_over() and simulator.turn < max_turns:
+        moves = [0] * len(players)
+        for index in simulator.alive_snakes:
+            requests[index] = simulator.to_request(index, game)
+            start = perf_counter()
+            move = players[index].choose_move(requests[index])
+            times[index].append((perf_counter() - start) * 1000)
+            moves[index] = MOVES.index(move)
+            if observe is not None:
+                observe(simulator, index, moves[index])
+
+        simulator.make(moves)
+        simulator.history.clear()
+        simulator.spawn_food(rng)
+
+        for index, alive in enumerate(simulator.alive):
+            if not alive and eliminated[index] is None:
+                eliminated[index] = simulator.turn
+
+    for player, data in zip(players, requests):
+        player.choose_end(data)
+
+    # Snakes eliminated on the last turn draw when none are left, as do the survivors
+    alive = simulator.alive_snakes
+    if len(alive) == 1:
+        outcomes = [
+            "win" if index in alive else "loss" for index in range(len(players))
+        ]
+    else:
+        last = simulator.turn
+        outcomes = [
+            (
+                "draw"
+                if index in alive or (not alive and eliminated[index] == last)
+                else "loss"
+            )
+            for index in range(len(players))
+        ]
+
+    return list(zip(names, outcomes, times))
+
+
+def calc_wilson_interval(successes, n, z=1.96):
+    """
+    successes: Number of successes.
+    n: Number of trials.
+    z: The standard score of the confidence, 1.96 for 95%.
+    return: The (lower, upper) bounds of the Wilson score interval of the success rate
+    """
+    if n == 0:
+        return 0.0, 1.0
+
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def run_arena(
+    specs,
+    n_games=100,
+    processes=None,
+    size=11,
+    max_turns=500,
+    seed=0,
+    model_path=None,
+    search_budget=50,
+):
+    """
+    specs: The players of every game, as given to create_player.
+    n_games: Number of games.
+    processes: Number of worker processes, one for every core by default.
+    size: Width and height of the board.
+    max_turns: Turn after which a game is a draw between the snakes left.
+    seed: Seed of the first game, the others count up from it.
+    model_path: The path of the model of strategies that name none.
+    search_budget: Milliseconds Logic may search for.
+    return: Dictionary of the results of every player
+    """
+    # Players that appear more than once are told apart by their seat
+    names = [
+        spec if specs.count(spec) == 1 else f"{spec}#{seat}"
+        for seat, spec in enumerate(specs)
+    ]
+    processes = processes or cpu_count()
+
+    # Models are loaded once, here, so that a bad one fails before any worker starts. The
+    # forked workers inherit the players instead of loading their own
+    players = [create_player(spec, model_path, search_budget) for spec in specs]
+
+    # Games only send their small results back, so workers never wait on each other
+    context = get_context("fork")
+    start = perf_counter()
+    with context.Pool(
+        processes,
+        initializer=_start_worker,
+        initargs=(players, names, size, max_turns),
+    ) as pool:
+        games = list(
+            pool.imap_unordered(
+                _play_game,
+                range(seed, seed + n_games),
+                chunksize=max(1, n_games // (processes * 8)),
+            )
+        )
+    seconds = perf_counter() - start
+
+    results = {}
+    for game in games:
+        for name, outcome, times in game:
+            result = results.setdefault(
+                name, {"win": 0, "loss": 0, "draw": 0, "times": []}
+            )
+            result[outcome] += 1
+            result["times"] += times
+
+    players = {}
+    for name in names:
+        result = results[name]
+        times = sorted(result["times"])
+        lower, upper = calc_wilson_interval(result["win"], n_games)
+        players[name] = {
+            "games": n_games,
+            "wins": result["win"],
+            "losses": result["loss"],
+            "draws": result["draw"],
+            "win_rate": round(result["win"] / n_games, 4),
+            "win_rate_95": [round(lower, 4), round(upper, 4)],
+            "moves": len(times),
+            "mean_move_ms": round(sum(times) / len(times), 3) if times else None,
+            "p95_move_ms": (
+                round(times[min(len(times) - 1, len(times) * 95 // 100)], 3)
+                if times
+                else None
+            ),
+        }
+
+    return {
+        "games": n_games,
+        "processes": processes,
+        "seconds": round(seconds, 3),
+        "games_per_second": round(n_games / seconds, 2),
+        "players": players,
+    }
+
+
+_worker = None
+
+
+def _start_worker(players, names, size, max_turns):
+    # Forked workers get the parent's players without pickling, and reuse them for every game
+    global _worker
+    _worker = (players, names, size, max_turns)
+
+
+def _play_game(seed):
+    players, names, size, max_turns = _worker
+
+    # Rotating the seats spreads the advantage of any starting square over every player
+    shift = seed % len(players)
+    seats = list(range(shift, len(players))) + list(range(shift))
+    return play_game(
+        [players[seat] for seat in seats],
+        [names[seat] for seat in seats],
+        f"arena-{seed}",
+        size,
+        max_turns,
+        seed,
+    )
+
+
+if __name__ == "__main__":
+    # python src/arena.py greedy eat --games 1000
+    # python src/arena.py greedy=src/model.nnue greedy=src/new_model.nnue
+    parser = ArgumentParser(description="Play strategies against each other locally.")
+    parser.add_argument(
+        "players",
+        nargs="+",
+        help=f"{', '.join(STRATEGIES)}, optionally =MODEL, or {', '.join(BASELINES)}",
+    )
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--processes", type=int, help="one for every core by default")
+    parser.add_argument("--size", type=int, default=11)
+    parser.add_argument("--max-turns", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--model", help="model of strategies that name none, none by default"
+    )
+    parser.add_argument("--search-budget", type=float, default=50)
+    parser.add_argument("--output", help="file to write, stdout by default")
+    args = parser.parse_args()
+
+    report = run_arena(
+        args.players,
+        args.games,
+        args.processes,
+        args.size,
+        args.max_turns,
+        args.seed,
+        args.model,
+        args.search_budget,
+    )
+    if args.output:
+        with open(args.output, "w") as output:
+            dump(report, output, indent=2)
+    else:
+        stdout.write(dumps(report, indent=2) + "\n")
@@ -0,0 +1,311 @@
+from argparse import ArgumentParser
+from json import dump, dumps, load, loads
+from platform import python_version
+from random import Random
+from sys import exit, stderr, stdout
+from time import perf_counter_ns
+
+from numpy import float32
+from numpy.random import default_rng
+
+from features import FeatureSpace
+from logic import Logic
+from logics.increase_board_control import IncreaseBoardControl
+from model_file import load_model
+from nnue import NNUE
+from simulator import Simulator
+from src.board import build_board
+from src.floodfill import calc_open_space, calc_neighbors
+from src.pathfinding import calc_next_move, calc_possible_moves
+from src.targeting import calc_targets
+from utils.game_state import GameState
+
+"""
+Battlesnake move pipeline benchmarks.
+"""
+
+SIZES = (7, 11, 19, 25)
+SNAKE_COUNTS = (2, 4, 8)
+LENGTHS = (3, 10, 30)
+
+
+def generate_board(width, height, n_snakes, length, rng):
+    """
+    width: Width of the board.
+    height: Height of the board.
+    n_snakes: Number of snakes.
+    length: Length of every snake.
+    rng: A random.Random to draw from.
+    return: A move request for the first snake, or None if the snakes do not fit
+    """
+    simulator = Simulator(width, height)
+    for index in range(n_snakes):
+        body = _random_body(simulator, length, rng)
+        if body is None:
+            return None
+        simulator.add_snake(f"snake-{index}", body, rng.randint(1, 100))
+
+    simulator.spawn_food(rng, minimum=max(1, width * height // 40), chance=0.0)
+    simulator.turn = length * 2
+    game = {
+        "id": f"benchmark-{width}x{height}-{n_snakes}-{length}-{rng.random()}",
+        "ruleset": {"name": "standard", "version": "v1.0.0"},
+        "timeout": 500,
+    }
+    return simulator.to_request(0, game)
+
+
+def generate_boards(
+    sizes=SIZES, snake_counts=SNAKE_COUNTS, lengths=LENGTHS, n=5, seed=0
+):
+    """
+    sizes: Widths of the square boards.
+    snake_counts: Numbers of snakes on a board.
+    lengths: Lengths of the snakes.
+    n: Number of boards of every size, snake count and length.
+    seed: Seed of the boards.
+    return: The list of move requests. Combinations that do not fit on a board are left out
+    """
+    rng = Random(seed)
+    boards = []
+    for size in sizes:
+        for n_snakes in snake_counts:
+            for length in lengths:
+                # Boards more than half full are rarely reached in real games
+                if n_snakes * length > size * size // 2:
+                    continue
+                for _ in range(n):
+                    board = generate_board(size, size, n_snakes, length, rng)
+                    if board is not None:
+                        boards.append(board)
+    return boards
+
+
+def load_boards(path):
+    """
+    path: A JSON lines file of move requests, or of log records with a "request" field as
+            written at the DEBUG level.
+    return: The list of move requests
+    """
+    boards = []
+    with open(path) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            record = loads(line)
+            request = record.get("request", record)
+            if "board" in request and "you" in request:
+                boards.append(request)
+    return boards
+
+
+def random_model(n_features, hidden=256, seed=0):
+    """
+    n_features: Number of input features.
+    hidden: Number of neurons of both hidden layers.
+    seed: Seed of the weights.
+    return: An NNUE with random weights, which is as fast as a trained one
+    """
+    rng = default_rng(seed)
+    return NNUE(
+        rng.normal(0, 0.01, size=(hidden, n_features)).astype(float32),
+        rng.normal(0, 0.01, size=hidden).astype(float32),
+        rng.normal(0, 0.1, size=(hidden, hidden)).astype(float32),
+        rng.normal(0, 0.1, size=hidden).astype(float32),
+        rng.normal(0, 0.1, size=(4, hidden)).astype(float32),
+        rng.normal(0, 0.1, size=4).astype(float32),
+    )
+
+
+def benchmark(boards, logic, repeat=20):
+    """
+    boards: Move requests to time every function on.
+    logic: The Logic to time choose_move and the model of.
+    repeat: Number of times every function is called on every board.
+    return: Dictionary of timings in microseconds, by board group and then function
+    """
+    board_control = IncreaseBoardControl()
+    samples = {}
+
+    for data in boards:
+        cases = _cases(data, logic, board_control)
+        group = samples.setdefault(_group(data), {})
+        for name, function in cases.items():
+            times = group.setdefault(name, [])
+            for _ in range(repeat):
+                start = perf_counter_ns()
+                function()
+                times.append(perf_counter_ns() - start)
+
+    return {
+        group: {name: _summarize(times) for name, times in sorted(functions.items())}
+        for group, functions in sorted(samples.items())
+    }
+
+
+def compare(baseline, results, tolerance=0.2):
+    """
+    baseline: The results of an earlier run.
+    results: The results of this run.
+    tolerance: Fraction by which a median may grow before it is a regression.
+    return: List of (group, function, baseline median, median) of every regression
+    """
+    regressions = []
+    for group, functions in results.items():
+        for name, summary in functions.items():
+            before = baseline.get(group, {}).get(name)
+            if before is None:
+                continue
+            if summary["median_us"] > before["median_us"] * (1 + tolerance):
+                regressions.append(
+                    (group, name, before["median_us"], summary["median_us"])
+                )
+    return regressions
+
+
+def _random_body(simulator, length, rng, attempts=100):
+    # A random self-avoiding walk over free cells, from the head to the tail
+    for _ in range(attempts):
+        free = [
+            cell for cell, occupied in enumerate(simulator.occupied) if not occupied
+        ]
+        if not free:
+            return None
+
+        body = [rng.choice(free)]
+        seen = {body[0]}
+        while len(body) < length:
+            neighbors = [
+                cell
+                for cell in simulator.move_table[body[-1]]
+                if cell >= 0 and not simulator.occupied[cell] and cell not in seen
+            ]
+            if not neighbors:
+                break
+            body.append(rng.choice(neighbors))
+            seen.add(body[-1])
+
+        if len(body) == length:
+            return body
+    return None
+
+
+def _group(data):
+    # Recorded boards have snakes of every length, which fall in the nearest generated one
+    board = data["board"]
+    longest = max(len(snake["body"]) for snake in board["snakes"])
+    length = max([LENGTHS[0], *(length for length in LENGTHS if length <= longest)])
+    return (
+        f"{board['width']}x{board['height']}/{len(board['snakes'])} snakes"
+        f"/length {length}"
+    )
+
+
+def _cases(data, logic, board_control):
+    # Everything a function is given is built beforehand, unless the function caches in it
+    board = build_board(data["board"])
+    head = data["you"]["head"]
+    neighbors = [
+        coords
+        for coords in calc_neighbors(head)
+        if board.in_bounds(coords["x"], coords["y"])
+    ]
+    target = calc_targets(data)[0]
+
+    cases = {
+        "calc_possible_moves": lambda: calc_possible_moves(data),
+        "calc_open_space": lambda: [
+            calc_open_space(board, coords) for coords in neighbors
+        ],
+        "calc_targets": lambda: calc_targets(data),
+        "calc_next_move": lambda: calc_next_move(data, head, target, board),
+        "GameState.travel_times": lambda: _travel_times(data),
+        "IncreaseBoardControl.board_control": lambda: board_control.board_control(
+            GameState(data)
+        ),
+        "Logic.choose_move": lambda: logic.choose_move(data),
+    }
+
+    # The feature space, and so the model, only covers standard 11x11 boards
+    space = logic.feature_space
+    if logic.model is not None and (
+        data["board"]["width"],
+        data["board"]["height"],
+    ) == (space.width, space.height):
+        accumulator = logic.model.new_accumulator(logic._get_active_features(data))
+        cases["Logic._get_active_features"] = lambda: logic._get_active_features(data)
+        cases["NNUE.forward"] = lambda: logic.model.forward(accumulator)
+
+    return cases
+
+
+def _travel_times(data):
+    game_state = GameState(data)
+    return game_state.travel_times(game_state.me.head)
+
+
+def _summarize(times):
+    times = sorted(times)
+    return {
+        "calls": len(times),
+        "min_us": round(times[0] / 1000, 3),
+        "median_us": round(times[len(times) // 2] / 1000, 3),
+        "mean_us": round(sum(times) / len(times) / 1000, 3),
+        "p95_us": round(times[min(len(times) - 1, len(times) * 95 // 100)] / 1000, 3),
+    }
+
+
+if __name__ == "__main__":
+    # python src/benchmark.py --output before.json
+    # python src/benchmark.py --baseline before.json
+    parser = ArgumentParser(description="Time every step of choosing a move.")
+    parser.add_argument("--boards", help="JSON lines of recorded move requests")
+    parser.add_argument("--model", help="model file, random weights by default")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--snakes", type=int, nargs="+", default=SNAKE_COUNTS)
+    parser.add_argument("--lengths", type=int, nargs="+", default=LENGTHS)
+    parser.add_argument("--n", type=int, default=5, help="boards of every kind")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strategy", default="greedy")
+    parser.add_argument("--output", help="file to write, stdout by default")
+    parser.add_argument("--baseline", help="results of an earlier run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.boards:
+        boards = load_boards(args.boards)
+    else:
+        boards = generate_boards(
+            args.sizes, args.snakes, args.lengths, args.n, args.seed
+        )
+
+    if args.model:
+        model = load_model(args.model)
+    else:
+        model = random_model(len(FeatureSpace()), seed=args.seed)
+
+    logic = Logic(model, strategy=args.strategy)
+    report = {
+        "python": python_version(),
+        "boards": len(boards),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "strategy": args.strategy,
+        "results": benchmark(boards, logic, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            dump(report, output, indent=2, sort_keys=True)
+    else:
+        stdout.write(dumps(report, indent=2, sort_keys=True) + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(
+                load(baseline)["results"], report["results"], args.tolerance
+            )
+        for group, name, before, after in regressions:
+            print(f"{group} {name}: {before}us -> {after}us", file=stderr)
+        exit(1 if regressions else 0)
@@ -0,0 +1,373 @@
+from numpy import array, concatenate, diff, int64, select, unique, zeros
+
+"""
+Battlesnake efficiently updatable neural network features.
+"""
+
+
+class FeatureSpace:
+    """
+    The (square, piece) input features of the efficiently updatable neural network.
+
+    Indices are computed arithmetically in the same order as Logic._get_feature_mapping:
+    squares are x-major, and every square holds food, 100 healths, 2 body types, lengths
+    from 3 up to the number of squares, 5 directions and 2 players.
+    """
+
+    PIECES = ["body", "head"]
+    DIRECTIONS = ["up", "down", "left", "right", "noop"]
+    PLAYERS = ["you", "snake"]
+
+    FOOD = 0
+    HEALTH = 1
+    PIECE = HEALTH + 100
+    LENGTH = PIECE + len(PIECES)
+
+    def __init__(self, width=11, height=11):
+        self.width = width
+        self.height = height
+        self.max_length = width * height
+
+        self.direction = self.LENGTH + self.max_length - 2
+        self.player = self.direction + len(self.DIRECTIONS)
+        self.square_features = self.player + len(self.PLAYERS)
+        self.n_features = width * height * self.square_features
+
+        # A square holds food or segments, with a health, both pieces when stacked, a length,
+        # a player, and a direction plus "noop" when stacked
+        self.max_active_features = width * height * (len(self.PIECES) + 5)
+
+        self.offsets = {"food": self.FOOD}
+        for i, piece in enumerate(self.PIECES):
+            self.offsets[piece] = self.PIECE + i
+        for i, direction in enumerate(self.DIRECTIONS):
+            self.offsets[direction] = self.direction + i
+        for i, player in enumerate(self.PLAYERS):
+            self.offsets[player] = self.player + i
+
+    def __getitem__(self, key):
+        return self.index(*key)
+
+    def __len__(self):
+        return self.n_features
+
+    def descriptor(self):
+        """
+        return: Dictionary of everything that decides the index of every feature, so that
+                two feature spaces with equal descriptors are the same
+        """
+        return {
+            "width": self.width,
+            "height": self.height,
+            "features": self.n_features,
+            "square_features": self.square_features,
+            "order": "x-major",
+            "healths": [1, 100],
+            "pieces": self.PIECES,
+            "lengths": [3, self.max_length],
+            "directions": self.DIRECTIONS,
+            "players": self.PLAYERS,
+        }
+
+    def index(self, square, kind):
+        """
+        square: Tuple of x/y coordinates, e.g. (0, 0)
+        kind: "food", ("health", health), "body", "head", ("length", length), a direction
+                or a player.
+        return: The index of the feature
+        """
+        x, y = square
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise KeyError((square, kind))
+        offset = (x * self.height + y) * self.square_features
+
+        if type(kind) is tuple:
+            name, value = kind
+            if name == "health" and 1 <= value <= 100:
+                return offset + self.HEALTH + value - 1
+            if name == "length" and 3 <= value <= self.max_length:
+                return offset + self.LENGTH + value - 3
+            raise KeyError((square, kind))
+
+        return offset + self.offsets[kind]
+
+    def snake_features(self, xs, ys, health, length, player):
+        """
+        xs: Array of the x coordinates of every body segment, head first.
+        ys: Array of the y coordinates of every body segment, head first.
+        health: The health of the snake, clipped to 1 to 100.
+        length: The length of the snake, clipped to 3 to the number of squares.
+        player: "you" or "snake".
+        return: The array of feature indices of the snake, with repeats for stacked segments
+        """
+        squares = (xs * self.height + ys) * self.square_features
+
+        pieces = zeros(len(squares), dtype=int64)
+        pieces[:1] = 1
+        health = min(max(health, 1), 100)
+        length = min(max(length, 3), self.max_length)
+
+        dx = diff(xs)
+        dy = diff(ys)
+        directions = select([dx < 0, dx > 0, dy < 0, dy > 0], [2, 3, 1, 0], default=4)
+
+        return concatenate(
+            [
+                squares + (self.HEALTH + health - 1),
+                squares + self.PIECE + pieces,
+                squares + (self.LENGTH + length - 3),
+                squares + self.offsets[player],
+                squares[:-1] + self.direction + directions,
+            ]
+        )
+
+    def extract(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: The sorted array of active feature indices
+        """
+        my_id = data["you"]["id"]
+        foods = data["board"]["food"]
+
+        features = [
+            array(
+                [
+                    (food["x"] * self.height + food["y"]) * self.square_features
+                    for food in foods
+                ],
+                dtype=int64,
+            )
+        ]
+
+        for snake in data["board"]["snakes"]:
+            coords = array(
+                [(segment["x"], segment["y"]) for segment in snake["body"]],
+                dtype=int64,
+            ).reshape(-1, 2)
+
+            player = "you" if snake["id"] == my_id else "snake"
+            features.append(
+                self.snake_features(
+                    coords[:, 0], coords[:, 1], snake["health"], snake["length"], player
+                )
+            )
+
+        return unique(concatenate(features))
+
+    def extract_simulator(self, simulator, me):
+        """
+        simulator: A Simulator on a board of this feature space's size.
+        me: Index of our snake.
+        return: The sorted array of active feature indices
+        """
+        width = simulator.width
+
+        food = array([c for c, f in enumerate(simulator.food) if f], dtype=int64)
+        features = [(food % width * self.height + food // width) * self.square_features]
+
+        for index in simulator.alive_snakes:
+            cells = array(simulator.bodies[index], dtype=int64)
+            player = "you" if index == me else "snake"
+            features.append(
+                self.snake_features(
+                    cells % width,
+                    cells // width,
+                    simulator.health[index],
+                    len(cells),
+                    player,
+                )
+            )
+
+        return unique(concatenate(features))
+
+
+class FeatureTracker:
+    """
+    Tracks the active features of one game, turn by turn.
+
+    Features are reference counted, since stacked body segments share a square. update()
+    only touches the features of segments that changed: the new head, the old head, the
+    popped tail, a grown tail, and every segment when health or length change.
+    """
+
+    def __init__(self, feature_space):
+        self.feature_space = feature_space
+
+        self.counts = {}
+        self.snakes = {}
+        self.food = set()
+
+    @property
+    def active_features(self):
+        return tuple(feature for feature, count in self.counts.items() if count > 0)
+
+    def refresh(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: The tuple of active features
+        """
+        self.counts = {}
+        self.snakes = {}
+        self.food = set()
+
+        changes = {}
+        self._set_food(data, changes)
+        for snake in data["board"]["snakes"]:
+            state = self._snake_state(data, snake)
+            self.snakes[snake["id"]] = state
+            self._add_snake(state, changes)
+
+        return self.active_features
+
+    def update(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: The lists of removed and added features since the previous turn
+        """
+        # Every touched feature remembers whether it was active before this turn
+        changes = {}
+
+        self._set_food(data, changes)
+
+        snakes = {}
+        for snake in data["board"]["snakes"]:
+            state = self._snake_state(data, snake)
+            snakes[snake["id"]] = state
+
+            previous = self.snakes.get(snake["id"])
+            if previous is None:
+                self._add_snake(state, changes)
+            elif not self._step_snake(previous, state, changes):
+                self._remove_snake(previous, changes)
+                self._add_snake(state, changes)
+
+        for snake_id, previous in list(self.snakes.items()):
+            if snake_id not in snakes:
+                self._remove_snake(previous, changes)
+        self.snakes = snakes
+
+        removed_features = []
+        added_features = []
+        for feature, was_active in changes.items():
+            is_active = self.counts.get(feature, 0) > 0
+            if was_active and not is_active:
+                removed_features.append(feature)
+            elif is_active and not was_active:
+                added_features.append(feature)
+
+        return removed_features, added_features
+
+    def _snake_state(self, data, snake):
+        body = [(coords["x"], coords["y"]) for coords in snake["body"]]
+        player = "you" if snake["id"] == data["you"]["id"] else "snake"
+        return (body, snake["health"], snake["length"], player)
+
+    def _change(self, feature, delta, changes):
+        count = self.counts.get(feature, 0)
+        if feature not in changes:
+            changes[feature] = count > 0
+        self.counts[feature] = count + delta
+
+    def _segment(self, state, index, delta, changes):
+        body, health, length, player = state
+        square = body[index]
+        space = self.feature_space
+
+        self._change(space.index(square, ("health", health)), delta, changes)
+        self._change(
+            space.index(square, "head" if index == 0 else "body"), delta, changes
+        )
+        self._change(space.index(square, ("length", length)), delta, changes)
+        self._change(space.index(square, player), delta, changes)
+
+    def _direction(self, state, index, delta, changes):
+        body = state[0]
+        square = body[index]
+        next_square = body[index + 1]
+
+        if next_square[0] < square[0]:
+            direction = "left"
+        elif next_square[0] > square[0]:
+            direction = "right"
+        elif next_square[1] < square[1]:
+            direction = "down"
+        elif next_square[1] > square[1]:
+            direction = "up"
+        else:
+            direction = "noop"
+
+        self._change(self.feature_space.index(square, direction), delta, changes)
+
+    def _add_snake(self, state, changes):
+        self._apply_snake(state, 1, changes)
+
+    def _remove_snake(self, state, changes):
+        self._apply_snake(state, -1, changes)
+
+    def _apply_snake(self, state, delta, changes):
+        body = state[0]
+        for index in range(len(body)):
+            self._segment(state, index, delta, changes)
+        for index in range(len(body) - 1):
+            self._direction(state, index, delta, changes)
+
+    def _step_snake(self, previous, state, changes):
+        """
+        previous: The state of a snake on the previous turn.
+        state: The state of the same snake on this turn.
+        return: False if the snake did not make exactly one move, so that it needs a rebuild
+        """
+        previous_body = previous[0]
+        body = state[0]
+        grown = len(body) - len(previous_body)
+
+        if len(previous_body) < 2 or grown not in (0, 1):
+            return False
+        if body[1] != previous_body[0] or body[-1] != previous_body[-2]:
+            return False
+        if grown and body[-2] != previous_body[-2]:
+            return False
+
+        space = self.feature_space
+        previous_health, previous_length = previous[1], previous[2]
+        health, length = state[1], state[2]
+
+        # The tail left its square, and the segment before it no longer points at it
+        self._segment(previous, len(previous_body) - 1, -1, changes)
+        self._direction(previous, len(previous_body) - 2, -1, changes)
+
+        # The old head is now the neck
+        neck = previous_body[0]
+        self._change(space.index(neck, "head"), -1, changes)
+        self._change(space.index(neck, "body"), 1, changes)
+
+        # Segments that stayed in place only change with health and length
+        for square in previous_body[:-1]:
+            if health != previous_health:
+                self._change(
+                    space.index(square, ("health", previous_health)), -1, changes
+                )
+                self._change(space.index(square, ("health", health)), 1, changes)
+            if length != previous_length:
+                self._change(
+                    space.index(square, ("length", previous_length)), -1, changes
+                )
+                self._change(space.index(square, ("length", length)), 1, changes)
+
+        self._segment(state, 0, 1, changes)
+        self._direction(state, 0, 1, changes)
+        if grown:
+            self._segment(state, len(body) - 1, 1, changes)
+            self._direction(state, len(body) - 2, 1, changes)
+
+        return True
+
+    def _set_food(self, data, changes):
+        food = {(coords["x"], coords["y"]) for coords in data["board"]["food"]}
+
+        for square in self.food - food:
+            self._change(self.feature_space.index(square, "food"), -1, changes)
+        for square in food - self.food:
+            self._change(self.feature_space.index(square, "food"), 1, changes)
+
+        self.food = food
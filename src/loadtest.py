@@ -0,0 +1,403 @@
+from argparse import ArgumentParser
+from asyncio import (
+    IncompleteReadError,
+    Semaphore,
+    gather,
+    get_running_loop,
+    open_connection,
+    run,
+)
+from concurrent.futures import ThreadPoolExecutor
+from json import dump, dumps, loads
+from random import Random
+from sys import stdout
+from threading import local
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from simulator import MOVES, Simulator
+
+"""
+Battlesnake load testing, by replaying or self-playing whole games against the server.
+"""
+
+
+class HTTPClient:
+    """
+    Sends requests to a server with asyncio, over raw HTTP/1.1.
+
+    Connections are kept alive and reused, so there are only as many as there are requests
+    in flight at once.
+    """
+
+    def __init__(self, url):
+        """
+        url: The URL of the server, e.g. "http://127.0.0.1:8080".
+        """
+        url = urlsplit(url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.connections = []
+
+    async def post(self, path, body):
+        """
+        path: The path to post to, e.g. "/move".
+        body: The encoded JSON body.
+        return: The (status, content) of the response
+        """
+        request = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode() + body
+
+        # A kept-alive connection may have been closed by the server, so retry once
+        for attempt in range(2):
+            if self.connections:
+                reader, writer = self.connections.pop()
+            else:
+                reader, writer = await open_connection(self.host, self.port)
+
+            try:
+                writer.write(request)
+                status, keep_alive, content = await self._read(reader)
+            except (OSError, IncompleteReadError, ValueError):
+                writer.close()
+                if attempt:
+                    raise
+                continue
+
+            if keep_alive:
+                self.connections.append((reader, writer))
+            else:
+                writer.close()
+            return status, content
+
+    async def close(self):
+        for _, writer in self.connections:
+            writer.close()
+        self.connections = []
+
+    async def _read(self, reader):
+        version, status, _ = (await reader.readuntil(b"\r\n")).decode().split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, value = line.decode().split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+        if "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        return int(status), keep_alive, content
+
+
+class AppClient:
+    """
+    Sends requests to a Flask app in this process, through its test client, so that no
+    network is needed. Requests are handled on a pool of threads, as a threaded server would.
+    """
+
+    def __init__(self, app, threads=32):
+        """
+        app: The Flask app, e.g. main.app.
+        threads: Number of requests handled at once.
+        """
+        self.app = app
+        self.pool = ThreadPoolExecutor(threads)
+        self.clients = local()
+
+    async def post(self, path, body):
+        return await get_running_loop().run_in_executor(
+            self.pool, self._post, path, body
+        )
+
+    async def close(self):
+        self.pool.shutdown()
+
+    def _post(self, path, body):
+        client = getattr(self.clients, "client", None)
+        if client is None:
+            client = self.clients.client = self.app.test_client()
+
+        # Closing the response, as a server does once it is sent, lets Logic start pondering
+        with client.post(path, data=body, content_type="application/json") as response:
+            return response.status_code, response.get_data()
+
+
+class LoadReport:
+    "Latencies of every request of a load test"
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.games = 0
+        # Every entry is (turn, seconds, timed out)
+        self.moves = []
+
+    async def post(self, client, path, body, turn=None, timeout=0.5):
+        """
+        client: The HTTPClient or AppClient to send the request with.
+        path: The path to post to.
+        body: The encoded JSON body.
+        turn: The turn of a move request, recorded with its latency.
+        timeout: Seconds after which a move is too late for the engine.
+        return: The decoded response of a successful request, or None
+        """
+        self.requests += 1
+        start = perf_counter()
+        try:
+            status, content = await client.post(path, body)
+        except (OSError, IncompleteReadError, ValueError):
+            status, content = None, b""
+        seconds = perf_counter() - start
+
+        if turn is not None:
+            self.moves.append((turn, seconds, seconds > timeout))
+        if status != 200:
+            self.errors += 1
+            return None
+        return content
+
+    def summarize(self, seconds):
+        """
+        seconds: How long the load test took.
+        return: Dictionary of the throughput, latency percentiles and timeouts, overall and
+                by turn number
+        """
+        by_turn = {}
+        for turn, latency, timed_out in self.moves:
+            by_turn.setdefault(turn, []).append((latency, timed_out))
+
+        turns = {}
+        for turn, samples in sorted(by_turn.items()):
+            turns[str(turn)] = {
+                "moves": len(samples),
+                "timeouts": sum(timed_out for _, timed_out in samples),
+                **_percentiles([latency for latency, _ in samples]),
+            }
+
+        return {
+            "games": self.games,
+            "requests": self.requests,
+            "moves": len(self.moves),
+            "errors": self.errors,
+            "timeouts": sum(timed_out for _, _, timed_out in self.moves),
+            "seconds": round(seconds, 3),
+            "requests_per_second": round(self.requests / seconds, 1) if seconds else 0,
+            "moves_per_second": round(len(self.moves) / seconds, 1) if seconds else 0,
+            "latency": _percentiles([latency for _, latency, _ in self.moves]),
+            "turns": turns,
+        }
+
+
+def load_transcripts(path):
+    """
+    path: A JSON lines file of move requests, or of log records with a "request" field as
+            written at the DEBUG level.
+    return: List of transcripts, the move requests of one snake in one game, in turn order
+    """
+    transcripts = {}
+    with open(path) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            record = loads(line)
+            request = record.get("request", record)
+            if "board" in request and "you" in request:
+                game = (request["game"]["id"], request["you"]["id"])
+                transcripts.setdefault(game, []).append(request)
+
+    return [
+        sorted(requests, key=lambda request: request["turn"])
+        for requests in transcripts.values()
+    ]
+
+
+async def replay(client, report, transcript, game_id):
+    """
+    client: The HTTPClient or AppClient to send requests with.
+    report: The LoadReport to record latencies in.
+    transcript: The move requests of one snake in one game, in turn order.
+    game_id: The id to replay the game as, so that replays of a game do not share state.
+    return: None.
+    """
+    bodies = []
+    for request in transcript:
+        request = {**request, "game": {**request["game"], "id": game_id}}
+        bodies.append((request["turn"], dumps(request).encode()))
+    timeout = transcript[0]["game"].get("timeout", 500) / 1000
+
+    await report.post(client, "/start", bodies[0][1])
+    for turn, body in bodies:
+        await report.post(client, "/move", body, turn, timeout)
+    await report.post(client, "/end", bodies[-1][1])
+    report.games += 1
+
+
+async def self_play(
+    client, report, game_id, size=11, n_snakes=2, max_turns=300, seed=0
+):
+    """
+    client: The HTTPClient or AppClient to send requests with.
+    report: The LoadReport to record latencies in.
+    game_id: The id of the game.
+    size: Width and height of the board.
+    n_snakes: Number of snakes, all played by the server.
+    max_turns: Turn after which the game is ended.
+    seed: Seed of the starting positions and food.
+    return: None.
+
+    Every turn, the moves of all snakes are requested at once, as the engine does. Snakes
+    whose move fails or is too late move at random.
+    """
+    rng = Random(seed)
+    simulator = Simulator.start(size, size, n_snakes, rng)
+    game = {
+        "id": game_id,
+        "ruleset": {"name": "standard", "version": "v1.0.0"},
+        "timeout": 500,
+    }
+
+    # Eliminated snakes are sent their last request again at the end
+    last = {}
+
+    def bodies(indices):
+        for index in indices:
+            last[index] = dumps(simulator.to_request(index, game)).encode()
+        return [last[index] for index in indices]
+
+    await gather(
+        *(report.post(client, "/start", body) for body in bodies(range(n_snakes)))
+    )
+
+    while not simulator.is_over() and simulator.turn < max_turns:
+        alive = simulator.alive_snakes
+        responses = await gather(
+            *(
+                report.post(client, "/move", body, simulator.turn)
+                for body in bodies(alive)
+            )
+        )
+
+        moves = [0] * n_snakes
+        for index, response in zip(alive, responses):
+            try:
+                moves[index] = MOVES.index(loads(response)["move"])
+            except (TypeError, ValueError, KeyError):
+                moves[index] = rng.choice(simulator.legal_moves(index))
+
+        simulator.make(moves)
+        simulator.history.clear()
+        simulator.spawn_food(rng)
+
+    bodies(simulator.alive_snakes)
+    await gather(*(report.post(client, "/end", last[index]) for index in sorted(last)))
+    report.games += 1
+
+
+async def run_games(client, games, concurrency=16):
+    """
+    client: The HTTPClient or AppClient to send requests with.
+    games: List of functions of (client, report) that play one game each.
+    concurrency: Number of games played at once.
+    return: The summary of the LoadReport
+    """
+    report = LoadReport()
+    semaphore = Semaphore(concurrency)
+
+    async def play(game):
+        async with semaphore:
+            await game(client, report)
+
+    start = perf_counter()
+    try:
+        await gather(*(play(game) for game in games))
+    finally:
+        await client.close()
+    return report.summarize(perf_counter() - start)
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {}
+    latencies = sorted(latencies)
+    n = len(latencies)
+    percentiles = {
+        f"p{q}_ms": round(latencies[min(n - 1, n * q // 100)] * 1000, 3)
+        for q in (50, 90, 99)
+    }
+    percentiles["max_ms"] = round(latencies[-1] * 1000, 3)
+    return percentiles
+
+
+if __name__ == "__main__":
+    # python src/loadtest.py --games 64 --concurrency 16
+    # python src/loadtest.py --url http://127.0.0.1:8080 --transcripts moves.jsonl
+    parser = ArgumentParser(description="Play whole games against the server at once.")
+    parser.add_argument(
+        "--url", help="server to test, the app in this process by default"
+    )
+    parser.add_argument("--transcripts", help="JSON lines of recorded move requests")
+    parser.add_argument(
+        "--games", type=int, help="games to play, one per transcript by default"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size", type=int, default=11)
+    parser.add_argument("--snakes", type=int, default=2)
+    parser.add_argument("--max-turns", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write, stdout by default")
+    args = parser.parse_args()
+
+    if args.url:
+        client = HTTPClient(args.url)
+    else:
+        # Only imported in process, so that testing a remote server needs no model
+        import main
+
+        main.logic = main.create_logic()
+        client = AppClient(main.app, threads=args.concurrency * args.snakes)
+
+    if args.transcripts:
+        transcripts = load_transcripts(args.transcripts)
+        n_games = args.games or len(transcripts)
+        games = [
+            lambda client, report, i=i: replay(
+                client,
+                report,
+                transcripts[i % len(transcripts)],
+                f"replay-{args.seed}-{i}",
+            )
+            for i in range(n_games)
+        ]
+    else:
+        games = [
+            lambda client, report, i=i: self_play(
+                client,
+                report,
+                f"self-play-{args.seed}-{i}",
+                args.size,
+                args.snakes,
+                args.max_turns,
+                args.seed + i,
+            )
+            for i in range(args.games or 16)
+        ]
+
+    summary = run(run_games(client, games, args.concurrency))
+    if args.output:
+        with open(args.output, "w") as output:
+            dump(summary, output, indent=2)
+    else:
+        stdout.write(dumps(summary, indent=2) + "\n")
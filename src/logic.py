@@ -1,6 +1,7 @@
+from logging import DEBUG
 from random import choice
-
-from copy import copy
+from threading import Lock
+from time import perf_counter
 
 from logics.bad_moves import BadMoves
 from logics.chaise_tail import ChaiseTail
@@ -15,7 +16,19 @@ from utils.game_state import GameState
 from utils.snake import Snake
 from utils.vector import Vector, up, down, left, right, noop, directions
 
+from features import FeatureSpace, FeatureTracker
+from logs import logger
+from metrics import metrics
+from mcts import MCTS
+from ponder import Activity, Ponderer
+from search import NNUEEvaluator, Search, SpaceEvaluator
+from simulator import MOVES, Simulator
+from state import LocalStore, pack_state, unpack_state
+from transposition import TranspositionTable
+
+from src.board import build_board
 from src.floodfill import is_coords_open, calc_neighbors, calc_open_space
+from src.floodfill import calc_region_sizes
 from src.pathfinding import calc_possible_moves, calc_next_move
 from src.pathfinding import BattlesnakeAStarPathfinder
 from src.targeting import calc_targets
@@ -30,14 +43,45 @@ class Logic:
     from the list of possible moves!
     """
 
-    def __init__(self, model):
+    def __init__(
+        self,
+        model,
+        strategy="greedy",
+        search_budget=350,
+        table_size=1 << 16,
+        state_ttl=300,
+        ponder=False,
+        ponder_limit=1.0,
+        store=None,
+        verify_features=False,
+    ):
         self.model = model
-
-        self.feature_mapping = self._get_feature_mapping()
+        self.strategy = strategy
+        self.search_budget = search_budget
+        self.table_size = table_size
+        self.state_ttl = state_ttl
+        self.ponder = ponder
+        self.ponder_limit = ponder_limit
+        self.store = store if store is not None else LocalStore()
+        self.verify_features = verify_features
+
+        self.feature_space = FeatureSpace()
         self.move_mapping = {0: "left", 1: "right", 2: "down", 3: "up"}
 
         self.models = {}
         self.features = {}
+        self.compute_times = {}
+        self.tables = {}
+        self.trees = {}
+
+        self.last_seen = {}
+        self.last_sweep = perf_counter()
+
+        # Pondering only runs while no request of any game is being handled
+        self.activity = Activity()
+        self.ponder_lock = Lock()
+        self.ponderers = {}
+        self.pending_ponders = {}
 
     def get_info(self):
         """
@@ -67,20 +111,14 @@ class Logic:
         for each move of the game.
 
         """
-        len_snakes = len(data["board"]["snakes"])
-        board_size = data["board"]["height"]
-        game_type = data["game"]["ruleset"]["name"]
-
-        if len_snakes == 2 and board_size == 11 and game_type == "standard":
-            game_id = data["game"]["id"]
-            my_id = data["you"]["id"]
-
-            model = copy(self.model)
-            active_features = self._get_active_features(data)
-            model.refresh_accumulator(active_features)
+        self._sweep(data)
 
-            self.models[(game_id, my_id)] = model
-            self.features[(game_id, my_id)] = active_features
+        if self._uses_nnue(data):
+            start = perf_counter()
+            game = (data["game"]["id"], data["you"]["id"])
+            accumulator, feature_tracker = self._new_nnue_state(data)
+            self._save_nnue_state(game, accumulator, feature_tracker)
+            metrics.since("model_setup", start)
 
     def choose_move(self, data):
         """
@@ -93,6 +131,26 @@ class Logic:
         with as a Python Dictionary, and contains all of the information about the Battlesnake board
         for each move of the game.
 
+        """
+        start = perf_counter()
+        game = (data["game"]["id"], data["you"]["id"])
+
+        self._stop_pondering(game)
+        self._sweep(data)
+        move = self._choose_move(data, start)
+
+        # Pondering starts from end_request(), once the response has been sent
+        if self.ponder:
+            with self.ponder_lock:
+                self.pending_ponders[game] = data
+
+        return move
+
+    def _choose_move(self, data, start):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        start: perf_counter() time at which the move request started being handled.
+        return: A String, the single move to make. One of "up", "down", "left" or "right".
         """
         my_snake = data[
             "you"
@@ -114,16 +172,18 @@ class Logic:
 
         # TODO: Step 1 - Don't hit walls.
         # Use information from `data` and `my_head` to not move beyond the game board.
-        board = data['board']
-        # board_height = board['height']
-        # board_width = board['width']
+        phase_start = perf_counter()
+        board = build_board(data["board"])
+        # board_height = board.height
+        # board_width = board.width
 
         # TODO: Step 2 - Don't hit yourself.
         # Use information from `my_body` to avoid moves that would collide with yourself.
 
         # TODO: Step 3 - Don't collide with others.
         # Use information from `data` to prevent your Battlesnake from colliding with others.
-        possible_moves = calc_possible_moves(data)
+        possible_moves = calc_possible_moves(data, board)
+        phase_start = metrics.since("possible_moves", phase_start)
 
         # TODO: Step 4 - Find food.
         # Use information in `data` to seek out and find food.
@@ -133,7 +193,24 @@ class Logic:
         # move = choice(possible_moves) if possible_moves else "up"
         # TODO: Explore new strategies for picking a move that are better than random
 
-        if possible_moves:
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(
+                "request",
+                extra={"game": data["game"]["id"], "fields": {"request": data}},
+            )
+
+        # Everything worth knowing about how the move was chosen, for the move record
+        fields = {"turn": data["turn"], "possible_moves": possible_moves}
+
+        move = None
+        if possible_moves and self.strategy == "search":
+            move = self._search_move(data, start, fields)
+            phase_start = metrics.since("search", phase_start)
+        elif possible_moves and self.strategy == "mcts":
+            move = self._mcts_move(data, start, fields)
+            phase_start = metrics.since("search", phase_start)
+
+        if move is None and possible_moves:
 
             # Flood fill - Don't limit open space.
             greatest_open_space = 0
@@ -142,9 +219,17 @@ class Logic:
             my_neighbors = calc_neighbors(my_head)
             my_moves = ["up", "down", "right", "left"]
 
-            for my_neighbor, my_move in zip(my_neighbors, my_moves):
+            # One labelling of the board scores every neighbour, even those sharing a region
+            open_spaces = calc_region_sizes(board, my_neighbors)
+            phase_start = metrics.since("flood_fill", phase_start)
+            fields["open_spaces"] = {
+                my_move: open_space
+                for open_space, my_move in zip(open_spaces, my_moves)
+                if my_move in possible_moves
+            }
+
+            for open_space, my_move in zip(open_spaces, my_moves):
                 if my_move in possible_moves:
-                    open_space = calc_open_space(board, my_neighbor)
                     if open_space > greatest_open_space:
                         greatest_open_space = open_space
                         greatest_moves = [my_move]
@@ -157,17 +242,33 @@ class Logic:
                 game_id = data["game"]["id"]
                 my_id = my_snake["id"]
 
-                if (game_id, my_id) in self.models:
-                    prev = self.features[(game_id, my_id)]
-                    next_ = self._get_active_features(data)
-                    removed_features = self._get_removed_features(prev, next_)
-                    added_features = self._get_added_features(prev, next_)
-
-                    model = self.models[(game_id, my_id)]
-                    model.update_accumulator(removed_features, added_features)
-                    sorted_moves = model.forward().argsort()[::-1]
-
-                    self.features[(game_id, my_id)] = next_
+                phase_start = perf_counter()
+                nnue_state = self._load_nnue_state(data)
+                if nnue_state is not None:
+                    accumulator, feature_tracker = nnue_state
+                    removed_features, added_features = feature_tracker.update(data)
+                    phase_start = metrics.since("features", phase_start)
+
+                    if self.verify_features:
+                        assert set(feature_tracker.active_features) == set(
+                            self._get_active_features(data)
+                        ), "feature tracker diverged from a full rebuild"
+
+                    self.model.update_accumulator(
+                        accumulator, removed_features, added_features
+                    )
+                    phase_start = metrics.since("update_accumulator", phase_start)
+                    self._save_nnue_state(
+                        (game_id, my_id), accumulator, feature_tracker
+                    )
+                    phase_start = metrics.since("save_state", phase_start)
+                    outputs = self.model.forward(accumulator)
+                    phase_start = metrics.since("forward", phase_start)
+                    fields["nnue"] = {
+                        self.move_mapping[i]: float(output)
+                        for i, output in enumerate(outputs)
+                    }
+                    sorted_moves = outputs.argsort()[::-1]
 
                     for sorted_move in sorted_moves:
                         mapped_move = self.move_mapping[sorted_move]
@@ -179,12 +280,17 @@ class Logic:
                     move = choice(greatest_moves)
             else:
                 move = greatest_moves[0]
-        else:
+        elif move is None:
             move = choice(["up", "down", "left", "right"])
 
-        print(
-            f"{data['game']['id']} MOVE {data['turn']}: {move} picked from all valid options in {possible_moves}"
-        )
+        game_id = data["game"]["id"]
+        my_id = my_snake["id"]
+        compute_time = (metrics.since("move", start) - start) * 1000
+        self.compute_times[(game_id, my_id)] = compute_time
+
+        fields["move"] = move
+        fields["ms"] = round(compute_time, 3)
+        logger.info("move", extra={"game": game_id, "fields": fields})
 
         return move
 
@@ -221,13 +327,246 @@ class Logic:
         with as a Python Dictionary, and contains all of the information about the Battlesnake board
         for each move of the game.
 
+        """
+        self._forget((data["game"]["id"], data["you"]["id"]))
+
+    def _forget(self, game):
+        """
+        game: The (game id, snake id) of a game.
+        return: None.
+        """
+        self._stop_pondering(game)
+
+        self.models.pop(game, None)
+        self.features.pop(game, None)
+        self.compute_times.pop(game, None)
+        self.tables.pop(game, None)
+        self.trees.pop(game, None)
+        self.last_seen.pop(game, None)
+        self.store.delete(game)
+
+    def _sweep(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: None.
+
+        Marks the game of 'data' as seen, and forgets games that have not been seen for
+        state_ttl seconds, since their /end may never arrive.
+        """
+        now = perf_counter()
+        self.last_seen[(data["game"]["id"], data["you"]["id"])] = now
+
+        if now - self.last_sweep < self.state_ttl / 10:
+            return
+        self.last_sweep = now
+
+        for game, last_seen in list(self.last_seen.items()):
+            if now - last_seen > self.state_ttl:
+                self._forget(game)
+        self.store.sweep(self.state_ttl)
+
+    def _uses_nnue(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: True if the game is one the efficiently updatable neural network plays
+        """
+        len_snakes = len(data["board"]["snakes"])
+        board_size = data["board"]["height"]
+        game_type = data["game"].get("ruleset", {}).get("name")
+
+        # Without a model, e.g. before the first one is trained, no game uses the network
+        return (
+            self.model is not None
+            and len_snakes == 2
+            and board_size == 11
+            and game_type == "standard"
+        )
+
+    def _new_nnue_state(self, data):
+        # The network is shared by every game, each game only owns its accumulator
+        feature_tracker = FeatureTracker(self.feature_space)
+        active_features = feature_tracker.refresh(data)
+        accumulator = self.model.new_accumulator(active_features)
+
+        return accumulator, feature_tracker
+
+    def _load_nnue_state(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: The (Accumulator, FeatureTracker) of the game, or None if the network does
+                not play it
+        """
+        game = (data["game"]["id"], data["you"]["id"])
+        if not self.store.shared and game in self.models:
+            return self.models[game], self.features[game]
+
+        # Another worker may have played the last turn, so the shared store is the truth
+        snapshot = self.store.load(game) if self.store.shared else None
+        if snapshot is not None:
+            nnue_state = unpack_state(snapshot, self.feature_space)
+        elif self._uses_nnue(data):
+            # Rebuilt from the request, when no worker has the state of the game
+            nnue_state = self._new_nnue_state(data)
+        else:
+            return None
+
+        self.models[game], self.features[game] = nnue_state
+        return nnue_state
+
+    def _save_nnue_state(self, game, accumulator, feature_tracker):
+        self.models[game] = accumulator
+        self.features[game] = feature_tracker
+        if self.store.shared:
+            self.store.save(game, pack_state(accumulator, feature_tracker))
+
+    def _deadline(self, data, start):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        start: perf_counter() time at which the move request started being handled.
+        return: The perf_counter() time by which a search must return
+        """
+        game_id = data["game"]["id"]
+        my_id = data["you"]["id"]
+
+        # The latency the engine measured for our last move is our compute time plus the network
+        round_trip = 0.0
+        compute_time = self.compute_times.get((game_id, my_id))
+        try:
+            latency = float(data["you"].get("latency") or 0)
+        except ValueError:
+            latency = 0.0
+        if compute_time is not None and latency > compute_time:
+            round_trip = latency - compute_time
+
+        budget = max(self.search_budget - round_trip, 10)
+        return start + budget / 1000
+
+    def _search_move(self, data, start, fields):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        start: perf_counter() time at which the move request started being handled.
+        fields: Dictionary of the move record, to add the search's results to.
+        return: The move found by searching within the latency budget, or None
+        """
+        game_id = data["game"]["id"]
+        my_id = data["you"]["id"]
+        deadline = self._deadline(data, start)
+
+        simulator = Simulator.from_request(data)
+        me = simulator.ids.index(my_id)
+
+        # The table outlives the move, since consecutive turns share most of their subtrees
+        table = self.tables.get((game_id, my_id))
+        if table is None:
+            table = TranspositionTable(self.table_size)
+            self.tables[(game_id, my_id)] = table
+
+        search = Search(self._evaluator(data), table=table)
+        move = search.search(simulator, me, deadline)
+
+        fields["values"] = {MOVES[m]: value for m, value in search.values.items()}
+        fields["upper_bounds"] = {
+            MOVES[m]: value for m, value in search.upper_bounds.items()
+        }
+        fields["depth"] = search.depth
+        fields["nodes"] = search.nodes
+        return MOVES[move] if move is not None else None
+
+    def _evaluator(self, data):
+        if self._uses_nnue(data):
+            return NNUEEvaluator(self.model, self.feature_space)
+        return SpaceEvaluator()
+
+    def _mcts_move(self, data, start, fields):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        start: perf_counter() time at which the move request started being handled.
+        fields: Dictionary of the move record, to add the search's results to.
+        return: The move found by Monte Carlo tree search within the latency budget
         """
         game_id = data["game"]["id"]
         my_id = data["you"]["id"]
+        deadline = self._deadline(data, start)
 
-        if (game_id, my_id) in self.models:
-            del self.models[(game_id, my_id)]
-            del self.features[(game_id, my_id)]
+        simulator = Simulator.from_request(data)
+        me = simulator.ids.index(my_id)
+
+        # The tree outlives the move, and is re-rooted at the moves made since
+        tree = self.trees.get((game_id, my_id))
+        if tree is None:
+            if self._uses_nnue(data):
+                tree = MCTS(self.model, self.feature_space)
+            else:
+                tree = MCTS()
+            self.trees[(game_id, my_id)] = tree
+
+        move = tree.search(simulator, me, deadline)
+
+        root = tree.root
+        fields["visits"] = {
+            MOVES[m]: visits for m, visits in zip(root.moves[me], root.visits[me])
+        }
+        fields["simulations"] = tree.simulations
+        fields["reused"] = tree.reused
+        return MOVES[move]
+
+    def begin_request(self):
+        """
+        return: None.
+
+        Called as soon as any request arrives, before its body is read, so that pondering
+        parks until it has been answered.
+        """
+        self.activity.begin()
+
+    def end_request(self):
+        """
+        return: None.
+
+        Called once the response to a request has been sent. When no other request is being
+        handled, the games whose moves were chosen in the meantime start pondering.
+        """
+        if not self.activity.end():
+            return
+
+        with self.ponder_lock:
+            pending, self.pending_ponders = self.pending_ponders, {}
+            for data in pending.values():
+                self._start_pondering(data)
+
+    def _start_pondering(self, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: None.
+
+        Keeps searching the position of 'data' on a worker thread, until the next request of
+        the game arrives or ponder_limit seconds have passed. The next search of the game
+        starts from the tree or transposition table that pondering filled in. Must be called
+        holding ponder_lock.
+        """
+        game = (data["game"]["id"], data["you"]["id"])
+        deadline = perf_counter() + self.ponder_limit
+        ponderer = Ponderer(self.activity)
+
+        if game in self.trees:
+            ponderer.start(self.trees[game].ponder, deadline)
+        elif game in self.tables:
+            simulator = Simulator.from_request(data)
+            me = simulator.ids.index(game[1])
+            search = Search(self._evaluator(data), table=self.tables[game])
+            ponderer.start(search.search, simulator, me, deadline)
+        else:
+            return
+
+        self.ponderers[game] = ponderer
+
+    def _stop_pondering(self, game):
+        # Held while stopping, so that the game cannot start pondering again meanwhile
+        with self.ponder_lock:
+            self.pending_ponders.pop(game, None)
+            ponderer = self.ponderers.pop(game, None)
+            if ponderer is not None:
+                ponderer.stop()
 
     def _avoid_my_neck(self, my_body, possible_moves):
         """
@@ -257,87 +596,11 @@ class Logic:
                 For a full example of 'data', see https://docs.battlesnake.com/references/api/sample-move-request
         return: The list of active features
         """
-        my_id = data["you"]["id"]
-        foods = data["board"]["food"]
-        snakes = data["board"]["snakes"]
-
-        active_features = set()
-
-        for food in foods:
-            square = (food["x"], food["y"])
-            active_features.add(self.feature_mapping[(square, "food")])
-
-        for snake in snakes:
-            player = "you" if snake["id"] == my_id else "snake"
-            health = ("health", snake["health"])
-            length = ("length", snake["length"])
-
-            head = snake["head"]
-            square = (head["x"], head["y"])
-            active_features.add(self.feature_mapping[(square, health)])
-            active_features.add(self.feature_mapping[(square, "head")])
-            active_features.add(self.feature_mapping[(square, length)])
-            active_features.add(self.feature_mapping[(square, player)])
-
-            for body in snake["body"][1:]:
-                square = (body["x"], body["y"])
-                active_features.add(self.feature_mapping[(square, health)])
-                active_features.add(self.feature_mapping[(square, "body")])
-                active_features.add(self.feature_mapping[(square, length)])
-                active_features.add(self.feature_mapping[(square, player)])
-
-            for body, next_body in zip(snake["body"][:-1], snake["body"][1:]):
-                square = (body["x"], body["y"])
-
-                if next_body["x"] < body["x"]:
-                    active_features.add(self.feature_mapping[(square, "left")])
-                elif next_body["x"] > body["x"]:
-                    active_features.add(self.feature_mapping[(square, "right")])
-                elif next_body["y"] < body["y"]:
-                    active_features.add(self.feature_mapping[(square, "down")])
-                elif next_body["y"] > body["y"]:
-                    active_features.add(self.feature_mapping[(square, "up")])
-                else:
-                    active_features.add(self.feature_mapping[(square, "noop")])
-
-        active_features = tuple(active_features)
-        return active_features
-
-    def _get_removed_features(self, previous_features, next_features):
-        """
-        previous_features: List of previous features.
-                e.g. [0, 10, 20]
-        next_features: List of next features.
-                e.g. [0, 10, 20]
-        return: The list of removed features
-        """
-        removed_features = [
-            previous_feature
-            for previous_feature in previous_features
-            if previous_feature not in next_features
-        ]
-
-        return removed_features
-
-    def _get_added_features(self, previous_features, next_features):
-        """
-        previous_features: List of previous features.
-                e.g. [0, 10, 20]
-        next_features: List of next features.
-                e.g. [0, 10, 20]
-        return: The list of added features
-        """
-        added_features = [
-            active_feature
-            for active_feature in next_features
-            if active_feature not in previous_features
-        ]
-
-        return added_features
+        return tuple(self.feature_space.extract(data).tolist())
 
     def _get_feature_mapping(self):
         """
-        return: The dictionary of mapping features to indices
+        return: The dictionary of mapping features to indices, as computed by FeatureSpace
         """
         healths = range(1, 100 + 1)
         pieces = ["body", "head"]
@@ -1,5 +1,12 @@
+from logging import DEBUG, getLogger
+
+from numpy import bincount
+
+from utils.distance_maps import UNREACHABLE
 from utils.vector import directions
 
+logger = getLogger("battlesnake.board_control")
+
 
 class IncreaseBoardControl(object):
     def increase_board_control(self, gs):
@@ -13,7 +20,10 @@ class IncreaseBoardControl(object):
             my_control = board_control.get(gs.me.id)
             my_board_control.append((my_control, d))
         my_board_control.sort(reverse=False)
-        print(", ".join("%s:%s" % (d.direction(), c) for c, d in my_board_control))
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(
+                ", ".join("%s:%s" % (d.direction(), c) for c, d in my_board_control)
+            )
 
         if len(my_board_control) == 0:
             return
@@ -23,44 +33,25 @@ class IncreaseBoardControl(object):
         try:
             return my_board_control[1][1]
         except Exception as e:
-            print(my_board_control)
+            logger.error("no second best board control in %s", my_board_control)
             raise e
 
         # if any of those states has a boarder disappear by the time I get to it, it's infinitely good.
         ## unless... another snake's head is in there as well.
 
     def board_control(self, gs):
-        snake_ids = [s.id for s in gs.all_snakes]
-
-        per_snake_travel_times = {}
-        for snake in gs.all_snakes:
-            per_snake_travel_times[snake.id] = gs.travel_times(snake.head)
+        snakes = gs.all_snakes
+        if len(snakes) == 0:
+            return {}
 
-        def get_travel_times_to_square(coord):
-            travel_times = []
-            for snake_id in snake_ids:
-                travel_time = per_snake_travel_times[snake_id].get(coord)
-                travel_times.append((travel_time, snake_id))
-            travel_times.sort()
-            return travel_times
+        # travel_times[i, y, x] is how many turns snake i needs to reach (x, y)
+        travel_times = gs.travel_time_maps([s.head for s in snakes])
+        fastest = travel_times.min(axis=0)
+        fastest_count = (travel_times == fastest).sum(axis=0)
 
-        all_keys = set()
-        for snake_id in snake_ids:
-            all_keys = set(per_snake_travel_times[snake_id].keys())
-
-        control_count = {}
-        for key in all_keys:
-            time_to_square = get_travel_times_to_square(key)
-            if len(time_to_square) == 0:
-                continue
-            if len(time_to_square) == 1:
-                _, snake_id = time_to_square[0]
-                control_count[snake_id] = control_count.get(snake_id, 0) + 1
-                continue
-            time_1, snake_1_id = time_to_square[0]
-            time_2, snake_2_id = time_to_square[1]
-            if time_1 == time_2:
-                continue
-            control_count[snake_1_id] = control_count.get(snake_1_id, 0) + 1
+        # A square is controlled by the only snake that reaches it first
+        controlled = (fastest != UNREACHABLE) & (fastest_count == 1)
+        controllers = travel_times.argmin(axis=0)[controlled]
+        control_count = bincount(controllers, minlength=len(snakes))
 
-        return control_count
+        return {s.id: int(c) for s, c in zip(snakes, control_count.tolist())}
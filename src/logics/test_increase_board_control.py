@@ -0,0 +1,10 @@
+from utils.test import build_test_gamestate
+from logics import IncreaseBoardControl
+
+
+def test_board_control():
+    gs = build_test_gamestate(6, 1, me=[(1, 0)], opponents=[[(5, 0)]])
+    gs.data["board"]["snakes"][0]["id"] = "opponent"
+
+    control = IncreaseBoardControl().board_control(gs)
+    assert control == {"opponent": 2, gs.me.id: 3}
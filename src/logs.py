@@ -0,0 +1,175 @@
+from json import dumps
+from logging import DEBUG, INFO, Filter, Handler, getLogger
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from random import random
+from sys import stdout
+from threading import Event, Lock, Thread
+
+"""
+Battlesnake structured logging.
+"""
+
+logger = getLogger("battlesnake")
+
+
+class GameFilter(Filter):
+    """
+    Decides on the request thread which records are worth queueing.
+
+    Every game can have its own level, and games without one have their move records, at
+    INFO, sampled so that busy servers only pay for a fraction of them. The start and end
+    records of every game are always kept.
+    """
+
+    SAMPLED = "move"
+
+    def __init__(self, level=INFO, sample_rate=1.0):
+        super().__init__()
+        self.level = level
+        self.sample_rate = sample_rate
+        self.game_levels = {}
+
+    def filter(self, record):
+        game_id = getattr(record, "game", None)
+        if record.levelno < self.game_levels.get(game_id, self.level):
+            return False
+        if game_id in self.game_levels:
+            return True
+        if (
+            record.levelno == INFO
+            and record.msg == self.SAMPLED
+            and self.sample_rate < 1.0
+        ):
+            return random() < self.sample_rate
+        return True
+
+
+class JSONLinesHandler(Handler):
+    """
+    Writes records as JSON lines, in batches.
+
+    Records are buffered until batch_size of them are waiting or flush_interval seconds have
+    passed, so the stream is written to a few times a second at most.
+    """
+
+    def __init__(self, stream=None, batch_size=64, flush_interval=1.0):
+        super().__init__()
+        self.stream = stream if stream is not None else stdout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.batch = []
+        self.batch_lock = Lock()
+        self.stopped = Event()
+        self.flusher = Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def emit(self, record):
+        line = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "game", None) is not None:
+            line["game"] = record.game
+        line.update(getattr(record, "fields", {}))
+
+        with self.batch_lock:
+            self.batch.append(dumps(line, default=str))
+            if len(self.batch) < self.batch_size:
+                return
+        self.flush()
+
+    def flush(self):
+        with self.batch_lock:
+            batch, self.batch = self.batch, []
+        if batch:
+            self.stream.write("\n".join(batch) + "\n")
+            self.stream.flush()
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+        super().close()
+
+    def _flush_periodically(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+
+class GameLogs:
+    """
+    The logging of the server: records are filtered and queued on the request thread, then
+    formatted and written by a background thread.
+    """
+
+    def __init__(self, handler, level=INFO, sample_rate=1.0, verbose_rate=0.0):
+        """
+        handler: The Handler that writes records, e.g. a JSONLinesHandler.
+        level: The level of games without their own.
+        sample_rate: The fraction of move records to keep.
+        verbose_rate: The fraction of games that log everything, with every move.
+        """
+        self.filter = GameFilter(level, sample_rate)
+        self.verbose_rate = verbose_rate
+        self.levels_lock = Lock()
+        self.queue = SimpleQueue()
+
+        self.queue_handler = QueueHandler(self.queue)
+        self.queue_handler.addFilter(self.filter)
+        self.listener = QueueListener(self.queue, handler)
+
+    def start(self):
+        logger.addHandler(self.queue_handler)
+        with self.levels_lock:
+            self._set_logger_level()
+        logger.propagate = False
+        self.listener.start()
+
+    def stop(self):
+        logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+    def set_game_level(self, game_id, level):
+        """
+        game_id: The id of a game.
+        level: The level of the game's records, e.g. logging.DEBUG to see everything.
+        return: None.
+        """
+        with self.levels_lock:
+            self.filter.game_levels[game_id] = level
+            self._set_logger_level()
+
+    def start_game(self, game_id):
+        # A few whole games are worth more for debugging than many scattered moves
+        if random() < self.verbose_rate:
+            self.set_game_level(game_id, DEBUG)
+
+    def end_game(self, game_id):
+        # Once the last verbose game ends, debug records are dropped before they are built
+        with self.levels_lock:
+            if self.filter.game_levels.pop(game_id, None) is not None:
+                self._set_logger_level()
+
+    def _set_logger_level(self):
+        logger.setLevel(min([self.filter.level, *self.filter.game_levels.values()]))
+
+
+def open_logs(path=None, level=INFO, sample_rate=1.0, verbose_rate=0.0, batch_size=64):
+    """
+    path: The JSONL file to append to, or None for stdout.
+    level: The level of games without their own.
+    sample_rate: The fraction of move records to keep.
+    verbose_rate: The fraction of games that log everything, with every move.
+    batch_size: Number of records written at once.
+    return: The started GameLogs
+    """
+    stream = open(path, "a", buffering=1 << 16) if path else None
+    handler = JSONLinesHandler(stream, batch_size)
+    logs = GameLogs(handler, level, sample_rate, verbose_rate)
+    logs.start()
+    return logs
@@ -1,17 +1,86 @@
-from logging import getLogger, ERROR
+from logging import getLevelName, getLogger, ERROR
 from os import environ
+from os.path import exists, splitext
+from time import perf_counter
 
 from flask import Flask
 from flask import request
+from werkzeug.wsgi import ClosingIterator
 
-from pickle import load
-
-from nnue import NNUE
 from logic import Logic
-
+from logs import logger, open_logs
+from metrics import metrics
+from model_file import convert_model, load_model
+from state import open_store
 
 app = Flask(__name__)
 
+# Set by create_logic() and create_logs() before serving, see serve.py for production
+logic = None
+logs = None
+
+
+class TrackRequests:
+    """
+    WSGI middleware that tells Logic when every request arrives and when its response has
+    been sent, so that pondering only runs while the server has nothing else to do.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        current = logic
+        current.begin_request()
+        try:
+            response = self.wsgi_app(environ, start_response)
+        except BaseException:
+            current.end_request()
+            raise
+        # The server closes the response once it has been written to the socket
+        return ClosingIterator(response, current.end_request)
+
+
+app.wsgi_app = TrackRequests(app.wsgi_app)
+
+
+def create_logic():
+    """
+    return: The Logic configured by the environment, with its model loaded
+    """
+    # Point MODEL at a file written by `python src/nnue.py` to serve the quantized network
+    path = environ.get("MODEL", "src/model.nnue")
+
+    # Deployments from before model files only have the pickle, which is converted once
+    pickle_path = splitext(path)[0] + ".pth"
+    if not exists(path) and exists(pickle_path):
+        convert_model(pickle_path, path)
+    model = load_model(path)
+
+    return Logic(
+        model,
+        strategy=environ.get("STRATEGY", "greedy"),
+        search_budget=float(environ.get("SEARCH_BUDGET", "350")),
+        ponder=environ.get("PONDER", "") == "1",
+        # Set STATE_STORE to "shm" or "redis" to let any worker serve any turn of a game
+        store=open_store(
+            environ.get("STATE_STORE", "local"), environ.get("STATE_LOCATION")
+        ),
+    )
+
+
+def create_logs():
+    """
+    return: The started GameLogs configured by the environment
+    """
+    # Set LOG_PATH to write JSON lines to a file instead of stdout
+    return open_logs(
+        environ.get("LOG_PATH"),
+        level=getLevelName(environ.get("LOG_LEVEL", "INFO")),
+        sample_rate=float(environ.get("LOG_SAMPLE_RATE", "1")),
+        verbose_rate=float(environ.get("LOG_VERBOSE_RATE", "0")),
+    )
+
 
 @app.get("/")
 def handle_info():
@@ -19,7 +88,7 @@ def handle_info():
     This function is called when you register your Battlesnake on play.battlesnake.com
     See https://docs.battlesnake.com/guides/getting-started#step-4-register-your-battlesnake
     """
-    print("INFO")
+    logger.info("info")
     return logic.get_info()
 
 
@@ -32,9 +101,11 @@ def handle_start():
     """
     data = request.get_json()
 
+    if logs is not None:
+        logs.start_game(data["game"]["id"])
     logic.choose_start(data)
 
-    print(f"{data['game']['id']} START")
+    logger.info("start", extra={"game": data["game"]["id"]})
     return "ok"
 
 
@@ -44,7 +115,9 @@ def handle_move():
     This function is called on every turn and is how your Battlesnake decides where to move.
     Valid moves are "up", "down", "left", or "right".
     """
+    start = perf_counter()
     data = request.get_json()
+    metrics.since("parse", start)
 
     # TODO - look at the logic.py file to see how we decide what move to return!
     move = logic.choose_move(data)
@@ -63,10 +136,20 @@ def handle_end():
 
     logic.choose_end(data)
 
-    print(f"{data['game']['id']} END")
+    logger.info("end", extra={"game": data["game"]["id"]})
+    if logs is not None:
+        logs.end_game(data["game"]["id"])
     return "ok"
 
 
+@app.get("/metrics")
+def handle_metrics():
+    """
+    This function is called by Prometheus to scrape how long each phase of a request takes.
+    """
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
 @app.after_request
 def identify_server(response):
     response.headers["Server"] = "BattlesnakeOfficial/starter-snake-python"
@@ -74,10 +157,9 @@ def identify_server(response):
 
 
 if __name__ == "__main__":
-    with open("src/model.pth", "rb") as model:
-        model = load(model)
-
-    logic = Logic(model)
+    # The development server, run `python src/serve.py` in production
+    logic = create_logic()
+    logs = create_logs()
 
     getLogger("werkzeug").setLevel(ERROR)
 
@@ -85,5 +167,4 @@ if __name__ == "__main__":
     port = int(environ.get("PORT", "8080"))
 
     print(f"\nRunning Battlesnake server at http://{host}:{port}")
-    app.env = 'development'
-    app.run(host=host, port=port, debug=True)
+    app.run(host=host, port=port, debug=environ.get("DEBUG", "") == "1")
@@ -0,0 +1,343 @@
+from math import exp, inf, sqrt
+from random import Random
+from time import perf_counter
+
+from search import calc_simulator_regions, calc_space_values
+
+"""
+Battlesnake Monte Carlo tree search.
+"""
+
+# Outputs of the efficiently updatable neural network for up, down, left and right
+NNUE_OUTPUTS = (3, 2, 0, 1)
+
+
+class Node:
+    """
+    A position of the tree, with separate move statistics for every snake.
+
+    Moves are simultaneous, so every snake picks its own move from its own statistics, and
+    the children are keyed by the joint move. Eliminated snakes only have the move 0.
+    """
+
+    __slots__ = ("moves", "priors", "visits", "values", "children", "n")
+
+    def __init__(self):
+        self.moves = None
+        self.priors = None
+        self.visits = None
+        self.values = None
+        self.children = {}
+        self.n = 0
+
+    @property
+    def expanded(self):
+        return self.moves is not None
+
+    def expand(self, moves, priors):
+        self.moves = moves
+        self.priors = priors
+        self.visits = [[0] * len(options) for options in moves]
+        self.values = [[0.0] * len(options) for options in moves]
+
+    def select(self, exploration):
+        """
+        exploration: Weight of the prior and visit count bonus, as in PUCT.
+        return: The joint move, and the index of every snake's move in its options
+        """
+        joint_move = []
+        choices = []
+        scale = exploration * sqrt(max(self.n, 1))
+
+        for options, priors, visits, values in zip(
+            self.moves, self.priors, self.visits, self.values
+        ):
+            best = 0
+            if len(options) > 1:
+                best_score = -inf
+                for k in range(len(options)):
+                    q = values[k] / visits[k] if visits[k] else 0.5
+                    score = q + scale * priors[k] / (1 + visits[k])
+                    if score > best_score:
+                        best_score = score
+                        best = k
+
+            joint_move.append(options[best])
+            choices.append(best)
+
+        return tuple(joint_move), choices
+
+    def update(self, choices, results):
+        self.n += 1
+        for visits, values, k, result in zip(
+            self.visits, self.values, choices, results
+        ):
+            visits[k] += 1
+            values[k] += result
+
+    def best_move(self, index):
+        visits = self.visits[index]
+        return self.moves[index][max(range(len(visits)), key=visits.__getitem__)]
+
+
+class MCTS:
+    """
+    Decoupled UCT over simultaneous moves, for any number of snakes.
+
+    Every simulation walks down the tree with each snake picking its move from its own
+    statistics, expands one position, and plays a short rollout from it. Results are scored
+    for every snake: 1 for the last snake left, 0 for an eliminated snake, and the space
+    and length heuristic when the rollout stops. With a network, its move outputs for every
+    snake are the priors of a new position. The tree is kept between searches, and re-rooted
+    at the child reached by the joint move observed since the last search, as long as that
+    child is the position that arrived: same heads, tails and food. Otherwise, or when food
+    has spawned, the search starts afresh.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        feature_space=None,
+        exploration=1.0,
+        rollout="floodfill",
+        rollout_depth=8,
+        seed=None,
+    ):
+        """
+        model: An NNUE for the priors, or None for uniform priors.
+        feature_space: The FeatureSpace of the model.
+        exploration: Weight of the exploration bonus.
+        rollout: "random" for uniformly random safe moves, or "floodfill" to prefer moves
+                into regions that can hold the snake.
+        rollout_depth: Number of turns played by every rollout.
+        seed: Seed of the rollout moves.
+        """
+        self.model = model
+        self.feature_space = feature_space
+        self.exploration = exploration
+        self.rollout = rollout
+        self.rollout_depth = rollout_depth
+        self.rng = Random(seed)
+
+        self.root = None
+        self.root_simulator = None
+
+        self.simulations = 0
+        self.reused = 0
+        self.pondered = 0
+
+    def search(self, simulator, me, deadline):
+        """
+        simulator: The Simulator of the current position. It is left as it was found, and
+                kept to match the next search's position against, so must not change.
+        me: Index of our snake.
+        deadline: perf_counter() time by which the search must return.
+        return: The most visited move of our snake
+        """
+        self.me = me
+        self.multiplayer = len(simulator.alive_snakes) > 1
+        self.simulations = 0
+
+        self._reroot(simulator)
+        self.reused = self.root.n
+        if not self.root.expanded:
+            self._expand(self.root, simulator)
+
+        while perf_counter() < deadline:
+            self._simulate(simulator)
+            self.simulations += 1
+
+        self.root_simulator = simulator
+        return self.root.best_move(me)
+
+    def ponder(self, deadline, cancel):
+        """
+        deadline: perf_counter() time at which to stop.
+        cancel: Token whose is_set() is True once pondering must stop, e.g. an Event.
+        return: None.
+
+        Keeps simulating from the root of the last search, so that the children the next
+        search is re-rooted at have already been explored.
+        """
+        simulator = self.root_simulator
+        self.pondered = 0
+        if simulator is None:
+            return
+
+        while perf_counter() < deadline and not cancel.is_set():
+            self._simulate(simulator)
+            self.pondered += 1
+
+    def _reroot(self, simulator):
+        # The new root is the child of the joint move made since the last search, if any
+        root = self.root
+        previous = self.root_simulator
+        self.root = Node()
+        self.root_simulator = None
+
+        if root is None or not root.expanded or previous.ids != simulator.ids:
+            return
+
+        joint_move = []
+        for index, alive in enumerate(previous.alive):
+            move = 0
+            if alive:
+                head = simulator.head(index)
+                move_table = previous.move_table[previous.head(index)]
+                move = next(
+                    (m for m in root.moves[index] if move_table[m] == head), None
+                )
+                if move is None:
+                    return
+            joint_move.append(move)
+
+        child = root.children.get(tuple(joint_move))
+        if child is None:
+            return
+
+        # Food spawns after the turn, so the child is only reused if nothing else changed
+        previous.make(joint_move)
+        if _position(previous) == _position(simulator):
+            self.root = child
+
+    def _simulate(self, simulator):
+        path = []
+        node = self.root
+        made = 0
+
+        try:
+            while True:
+                results = self._terminal(simulator)
+                if results is not None:
+                    break
+
+                if not node.expanded:
+                    self._expand(node, simulator)
+                    results, played = self._rollout(simulator)
+                    made += played
+                    break
+
+                joint_move, choices = node.select(self.exploration)
+                path.append((node, choices))
+                simulator.make(joint_move)
+                made += 1
+
+                child = node.children.get(joint_move)
+                if child is None:
+                    child = node.children[joint_move] = Node()
+                node = child
+        finally:
+            for _ in range(made):
+                simulator.unmake()
+
+        for node, choices in path:
+            node.update(choices, results)
+
+    def _expand(self, node, simulator):
+        moves = []
+        for index, alive in enumerate(simulator.alive):
+            moves.append(simulator.legal_moves(index) if alive else [0])
+
+        node.expand(moves, self._priors(simulator, moves))
+
+    def _priors(self, simulator, moves):
+        uniform = [[1 / len(options)] * len(options) for options in moves]
+        if self.model is None or (simulator.width, simulator.height) != (
+            self.feature_space.width,
+            self.feature_space.height,
+        ):
+            return uniform
+
+        alive = simulator.alive_snakes
+        accumulators = [
+            self.model.new_accumulator(
+                self.feature_space.extract_simulator(simulator, index)
+            )
+            for index in alive
+        ]
+        outputs = self.model.forward_batch(accumulators)
+
+        priors = uniform
+        for index, output in zip(alive, outputs):
+            logits = [float(output[NNUE_OUTPUTS[move]]) for move in moves[index]]
+            greatest = max(logits)
+            weights = [exp(logit - greatest) for logit in logits]
+            total = sum(weights)
+            priors[index] = [weight / total for weight in weights]
+
+        return priors
+
+    def _rollout(self, simulator):
+        played = 0
+        results = None
+
+        while played < self.rollout_depth:
+            regions = None
+            if self.rollout == "floodfill":
+                regions = calc_simulator_regions(simulator)
+
+            joint_move = []
+            for index, alive in enumerate(simulator.alive):
+                joint_move.append(
+                    self._rollout_move(simulator, index, regions) if alive else 0
+                )
+            simulator.make(joint_move)
+            played += 1
+
+            results = self._terminal(simulator)
+            if results is not None:
+                return results, played
+
+        return self._evaluate(simulator), played
+
+    def _rollout_move(self, simulator, index, regions):
+        moves = simulator.legal_moves(index)
+        if regions is None or len(moves) == 1:
+            return self.rng.choice(moves)
+
+        # Prefer moves into regions big enough for the whole snake, else the biggest region
+        labels, sizes = regions
+        move_table = simulator.move_table[simulator.head(index)]
+        spaces = []
+        for move in moves:
+            cell = move_table[move]
+            spaces.append(sizes[labels[cell]] if cell >= 0 and labels[cell] >= 0 else 0)
+
+        length = simulator.length(index)
+        roomy = [move for move, space in zip(moves, spaces) if space >= length]
+        if roomy:
+            return self.rng.choice(roomy)
+        return moves[spaces.index(max(spaces))]
+
+    def _terminal(self, simulator):
+        alive = simulator.alive_snakes
+        if simulator.alive[self.me]:
+            if not self.multiplayer or len(alive) > 1:
+                return None
+        elif len(alive) > 1:
+            # We are out, but the others play on
+            return self._evaluate(simulator)
+
+        results = [
+            1.0 if simulator.alive[i] else 0.0 for i in range(len(simulator.alive))
+        ]
+        if not alive and simulator.history:
+            # Snakes eliminated together on the last turn draw
+            for index in simulator.history[-1][3]:
+                results[index] = 0.5
+        return results
+
+    def _evaluate(self, simulator):
+        values = calc_space_values(simulator)
+        return [values.get(index, 0.0) for index in range(len(simulator.alive))]
+
+
+def _position(simulator):
+    # What a request tells about a position: who is alive, where heads and tails are, and food
+    return (
+        simulator.alive,
+        [simulator.bodies[i][0] for i in simulator.alive_snakes],
+        [simulator.bodies[i][-1] for i in simulator.alive_snakes],
+        [simulator.length(i) for i in simulator.alive_snakes],
+        simulator.food,
+    )
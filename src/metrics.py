@@ -0,0 +1,144 @@
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+"""
+Battlesnake latency metrics, in the Prometheus text format.
+"""
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    "Counts of observations in fixed buckets, cheap enough to update on every request"
+
+    __slots__ = ("counts", "total", "count", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, seconds):
+        bucket = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.total, self.count
+
+    def quantile(self, q, counts=None):
+        """
+        q: The quantile, between 0 and 1.
+        counts: The bucket counts to use, from snapshot().
+        return: The quantile, interpolated within its bucket, or None without observations
+        """
+        counts = counts if counts is not None else self.snapshot()[0]
+        rank = q * sum(counts)
+        if not rank:
+            return None
+
+        seen = 0
+        for bucket, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[bucket - 1] if bucket > 0 else 0.0
+                # Observations past the last bucket are reported at its bound
+                upper = BUCKETS[bucket] if bucket < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+
+class Metrics:
+    """
+    Histograms of how long every phase of handling a request takes.
+
+    Phases are named by the code that times them, e.g. "flood_fill" or "search", and get a
+    histogram the first time they are observed.
+    """
+
+    def __init__(self, labels=None):
+        """
+        labels: Dictionary of labels added to every sample, e.g. {"worker": "0"}.
+        """
+        self.labels = labels or {}
+        self.histograms = {}
+        self.lock = Lock()
+
+    def observe(self, phase, seconds):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(phase, Histogram())
+        histogram.observe(seconds)
+
+    def since(self, phase, start):
+        """
+        phase: Name of the phase.
+        start: perf_counter() time at which the phase started.
+        return: The perf_counter() time now, to start the next phase from
+        """
+        now = perf_counter()
+        self.observe(phase, now - start)
+        return now
+
+    def render(self):
+        """
+        return: The histograms, and their p50, p95 and p99, in the Prometheus text format
+        """
+        lines = [
+            "# HELP battlesnake_phase_seconds Time spent in each phase of a request.",
+            "# TYPE battlesnake_phase_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP battlesnake_phase_quantile_seconds Quantiles of the time spent in each phase, from the histogram buckets.",
+            "# TYPE battlesnake_phase_quantile_seconds gauge",
+        ]
+
+        for phase, histogram in sorted(self.histograms.items()):
+            counts, total, count = histogram.snapshot()
+            labels = self._labels(phase=phase)
+
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = self._labels(phase=phase, le=str(bound))
+                lines.append(f"battlesnake_phase_seconds_bucket{le} {cumulative}")
+            lines.append(f"battlesnake_phase_seconds_sum{labels} {total:.9f}")
+            lines.append(f"battlesnake_phase_seconds_count{labels} {count}")
+
+            for q in QUANTILES:
+                value = histogram.quantile(q, counts)
+                if value is not None:
+                    quantile = self._labels(phase=phase, quantile=str(q))
+                    quantile_lines.append(
+                        f"battlesnake_phase_quantile_seconds{quantile} {value:.9f}"
+                    )
+
+        return "\n".join(lines + quantile_lines) + "\n"
+
+    def _labels(self, **labels):
+        labels = {**self.labels, **labels}
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+metrics = Metrics()
@@ -0,0 +1,185 @@
+from json import dumps, loads
+from os import replace
+from pickle import load
+from struct import Struct
+from sys import argv
+
+from numpy import ascontiguousarray, dtype, memmap, uint8
+
+from features import FeatureSpace
+from nnue import NNUE, QuantizedNNUE
+
+"""
+Battlesnake model files, memory-mapped by the server instead of unpickled.
+
+A file is the magic, the version and the length of a JSON header, then the header, then
+every array, each aligned to ALIGNMENT bytes. The header holds the kind of network, its
+scalars, the dtype, shape and offset of every array, and the descriptor of the feature
+space it was trained on.
+"""
+
+MAGIC = b"BSNNUE\0\0"
+VERSION = 1
+ALIGNMENT = 64
+
+# The magic, the version and the length of the header
+PREAMBLE = Struct("<8sII")
+
+LAYOUTS = {
+    "NNUE": (
+        NNUE,
+        ("feature_weights", "ft_bias", "l1_weight", "l1_bias", "l2_weight", "l2_bias"),
+        (),
+    ),
+    "QuantizedNNUE": (
+        QuantizedNNUE,
+        ("feature_weights", "ft_bias", "l1_weight", "l1_bias", "l2_weight", "l2_bias"),
+        ("ft_multiplier", "l1_multiplier", "l2_scale"),
+    ),
+}
+
+
+def save_model(model, path, feature_space=None):
+    """
+    model: An NNUE or QuantizedNNUE.
+    path: The file to write, replaced atomically.
+    feature_space: The FeatureSpace the model was trained on, 11x11 by default.
+    return: None.
+    """
+    feature_space = feature_space if feature_space is not None else FeatureSpace()
+    kind = type(model).__name__
+    if kind not in LAYOUTS:
+        raise TypeError(f"cannot save a {kind}")
+    _, names, scalar_names = LAYOUTS[kind]
+
+    arrays = [ascontiguousarray(getattr(model, name)) for name in names]
+    if arrays[0].shape[0] != len(feature_space):
+        raise ValueError(
+            f"the model has {arrays[0].shape[0]} features, "
+            f"the feature space {len(feature_space)}"
+        )
+
+    # Offsets are relative to the end of the header, whose length depends on them
+    entries = []
+    offset = 0
+    for name, array in zip(names, arrays):
+        entries.append(
+            {
+                "name": name,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+        )
+        offset = _align(offset + array.nbytes)
+
+    header = dumps(
+        {
+            "kind": kind,
+            "feature_space": feature_space.descriptor(),
+            "scalars": {name: _scalar(getattr(model, name)) for name in scalar_names},
+            "arrays": entries,
+        }
+    ).encode()
+    start = _align(PREAMBLE.size + len(header))
+    header += b" " * (start - PREAMBLE.size - len(header))
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as model_file:
+        model_file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        model_file.write(header)
+        for entry, array in zip(entries, arrays):
+            model_file.seek(start + entry["offset"])
+            model_file.write(array.tobytes())
+    replace(temporary, path)
+
+
+def convert_model(pickle_path, path, feature_space=None):
+    """
+    pickle_path: A pickled NNUE or QuantizedNNUE, e.g. src/model.pth.
+    path: The model file to write, e.g. src/model.nnue.
+    feature_space: The FeatureSpace the model was trained on, 11x11 by default.
+    return: None.
+    """
+    with open(pickle_path, "rb") as model:
+        model = load(model)
+
+    save_model(model, path, feature_space)
+
+
+def load_model(path, feature_space=None):
+    """
+    path: A file written by save_model().
+    feature_space: The FeatureSpace the model must have been trained on, 11x11 by default.
+    return: The NNUE or QuantizedNNUE, with its arrays mapped read-only from the file, so
+            every process that loads it shares the same pages
+    """
+    feature_space = feature_space if feature_space is not None else FeatureSpace()
+
+    raw = memmap(path, dtype=uint8, mode="r")
+    if len(raw) < PREAMBLE.size:
+        raise ValueError(f"{path} is not a model file")
+    magic, version, header_size = PREAMBLE.unpack(bytes(raw[: PREAMBLE.size]))
+    if magic != MAGIC:
+        raise ValueError(
+            f"{path} is not a model file, convert pickles with `python src/model_file.py`"
+        )
+    if version != VERSION:
+        raise ValueError(f"{path} has version {version}, only {VERSION} can be read")
+
+    header = loads(bytes(raw[PREAMBLE.size : PREAMBLE.size + header_size]))
+    if header["feature_space"] != feature_space.descriptor():
+        raise ValueError(
+            f"{path} was trained on the feature space {header['feature_space']}, "
+            f"not {feature_space.descriptor()}"
+        )
+    if header["kind"] not in LAYOUTS:
+        raise ValueError(f"{path} holds an unknown {header['kind']}")
+    model_class, names, _ = LAYOUTS[header["kind"]]
+
+    start = _align(PREAMBLE.size + header_size)
+    arrays = {}
+    for entry in header["arrays"]:
+        array_dtype = dtype(entry["dtype"])
+        offset = start + entry["offset"]
+        size = array_dtype.itemsize
+        for dimension in entry["shape"]:
+            size *= dimension
+        if offset + size > len(raw):
+            raise ValueError(f"{path} is truncated")
+        arrays[entry["name"]] = (
+            raw[offset : offset + size].view(array_dtype).reshape(entry["shape"])
+        )
+
+    if sorted(arrays) != sorted(names):
+        raise ValueError(
+            f"{path} holds the arrays {sorted(arrays)}, not {sorted(names)}"
+        )
+    if arrays["feature_weights"].shape[0] != len(feature_space):
+        raise ValueError(f"{path} has weights for a different number of features")
+
+    if model_class is NNUE:
+        # NNUE takes the (hidden, features) matrix, whose transpose is the mapped array
+        return NNUE(
+            arrays["feature_weights"].T,
+            arrays["ft_bias"],
+            arrays["l1_weight"],
+            arrays["l1_bias"],
+            arrays["l2_weight"],
+            arrays["l2_bias"],
+        )
+    return model_class(**arrays, **header["scalars"])
+
+
+def _scalar(value):
+    # NumPy scalars are not JSON, and the multipliers must stay integers
+    return value.item() if hasattr(value, "item") else value
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+if __name__ == "__main__":
+    # python src/model_file.py src/model.pth src/model.nnue
+    convert_model(argv[1], argv[2])
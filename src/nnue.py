@@ -1,50 +1,374 @@
-from numpy import maximum
+from argparse import ArgumentParser
+
+from numpy import abs as absolute
+from numpy import add, arange, ascontiguousarray, asarray, clip, concatenate, float64
+from numpy import iinfo, int8, int16, int32, int64, intp, maximum, repeat, rint, stack
+from numpy import tile, zeros
+from numpy.random import default_rng
+
+from features import FeatureSpace
 
 """
 Battlesnake efficiently updatable neural network.
 """
 
+INT16 = iinfo(int16)
+
+
+class Accumulator:
+    "The hidden vector of one game's position, kept apart from the shared network weights"
+
+    __slots__ = ("hidden",)
+
+    def __init__(self, hidden):
+        self.hidden = hidden
+
+
+def _freeze(*arrays):
+    """
+    arrays: The weights of a network.
+    return: The list of read-only arrays. Writable arrays are copied first, so that the
+            caller's own arrays stay writable, while read-only ones, e.g. mapped from a
+            model file, are shared as they are
+    """
+    # Networks are shared by every game and thread, so their weights must never change
+    frozen = []
+    for array in arrays:
+        if array.flags.writeable:
+            array = array.copy()
+            array.setflags(write=False)
+        frozen.append(array)
+    return frozen
+
+
+def _sum_deltas(feature_weights, deltas):
+    """
+    feature_weights: The (features, hidden) matrix of the feature transformer.
+    deltas: List of N (removed_features, added_features) pairs.
+    return: The (N, hidden) array of the added minus the removed feature weights of every
+            pair, from one gather and one matrix multiply. Integer weights are summed in
+            float64, which holds their sums exactly
+    """
+    indices = concatenate(
+        [
+            asarray(features, dtype=intp)
+            for removed_features, added_features in deltas
+            for features in (added_features, removed_features)
+        ]
+        + [zeros(0, dtype=intp)]
+    )
+    sizes = asarray(
+        [[len(added), len(removed)] for removed, added in deltas], dtype=intp
+    ).reshape(-1, 2)
+
+    # Row i of the sign matrix adds the weights of pair i's added features and subtracts
+    # those of its removed ones, so that BLAS sums every pair at once
+    n = len(deltas)
+    dtype = feature_weights.dtype if feature_weights.dtype.kind == "f" else float64
+    signs = zeros((n, len(indices)), dtype=dtype)
+    signs[repeat(arange(n), sizes.sum(axis=1)), arange(len(indices))] = repeat(
+        tile([1, -1], n), sizes.ravel()
+    )
+    return signs @ feature_weights[indices]
+
 
 class NNUE:
     "An efficiently updatable neural network for evaluation"
 
     def __init__(self, ft_weight, ft_bias, l1_weight, l1_bias, l2_weight, l2_bias):
-        self.ft_weight = ft_weight
-        self.ft_bias = ft_bias
-        self.l1_weight = l1_weight
-        self.l1_bias = l1_bias
-        self.l2_weight = l2_weight
-        self.l2_bias = l2_bias
-
-        self.accumulator = None
-        self.refresh_accumulator([])
-
-    def forward(self, features=None):
-        accumulator = self._ft(features) if features is not None else self.accumulator
-        l1_x = self._relu(accumulator)
-        l2_x = self._relu(self._l1(l1_x))
+        # Feature-major, so the weights of each feature are one contiguous row
+        (
+            self.feature_weights,
+            self.ft_bias,
+            self.l1_weight,
+            self.l1_bias,
+            self.l2_weight,
+            self.l2_bias,
+        ) = _freeze(
+            ascontiguousarray(ft_weight.T),
+            ft_bias,
+            l1_weight,
+            l1_bias,
+            l2_weight,
+            l2_bias,
+        )
 
-        return self._l2(l2_x)
+    def __setstate__(self, state):
+        # Models pickled before the feature-major layout store the (hidden, features) matrix
+        if "ft_weight" in state:
+            ft_weight = state["ft_weight"]
+        else:
+            ft_weight = state["feature_weights"].T
+
+        self.__init__(
+            ft_weight,
+            state["ft_bias"],
+            state["l1_weight"],
+            state["l1_bias"],
+            state["l2_weight"],
+            state["l2_bias"],
+        )
 
-    def refresh_accumulator(self, active_features):
-        self.accumulator = self.ft_bias.copy()
-        for active_feature in active_features:
-            self.accumulator += self.ft_weight[:, active_feature]
+    @property
+    def ft_weight(self):
+        return self.feature_weights.T
 
-    def update_accumulator(self, removed_features, added_features):
-        for removed_feature in removed_features:
-            self.accumulator -= self.ft_weight[:, removed_feature]
-        for added_feature in added_features:
-            self.accumulator += self.ft_weight[:, added_feature]
+    def new_accumulator(self, active_features=()):
+        accumulator = Accumulator(None)
+        self.refresh_accumulator(accumulator, active_features)
+        return accumulator
+
+    def forward(self, accumulator):
+        return self._evaluate(accumulator.hidden)
+
+    def forward_batch(self, accumulators):
+        """
+        accumulators: List of N accumulators.
+        return: The (N, 4) array of outputs, from one matrix multiply per layer
+        """
+        return self._evaluate(stack([a.hidden for a in accumulators]))
+
+    def forward_deltas(self, accumulator, deltas):
+        """
+        accumulator: The accumulator of a parent position.
+        deltas: List of N (removed_features, added_features) pairs, one per child position.
+        return: The (N, 4) array of outputs of the child positions
+        """
+        return self._evaluate(
+            accumulator.hidden + _sum_deltas(self.feature_weights, deltas)
+        )
+
+    def refresh_accumulator(self, accumulator, active_features):
+        active_features = asarray(active_features, dtype=intp)
+        accumulator.hidden = self.ft_bias + add.reduce(
+            self.feature_weights[active_features], axis=0
+        )
+
+    def update_accumulator(self, accumulator, removed_features, added_features):
+        removed_features = asarray(removed_features, dtype=intp)
+        added_features = asarray(added_features, dtype=intp)
+        accumulator.hidden = (
+            accumulator.hidden
+            + add.reduce(self.feature_weights[added_features], axis=0)
+            - add.reduce(self.feature_weights[removed_features], axis=0)
+        )
+
+    def _evaluate(self, hidden):
+        l1_x = self._relu(hidden)
+        l2_x = self._relu(self._l1(l1_x))
+
+        return self._l2(l2_x)
 
     def _ft(self, features):
-        return self.ft_weight @ features + self.ft_bias
+        return features @ self.feature_weights + self.ft_bias
 
     def _l1(self, features):
-        return self.l1_weight @ features + self.l1_bias
+        return features @ self.l1_weight.T + self.l1_bias
 
     def _l2(self, features):
-        return self.l2_weight @ features + self.l2_bias
+        return features @ self.l2_weight.T + self.l2_bias
 
     def _relu(self, features):
         return maximum(0, features)
+
+
+class QuantizedNNUE:
+    """
+    An efficiently updatable neural network for evaluation, in integer arithmetic.
+
+    The feature weights are int16 and the hidden layers use int8 weights with clipped ReLU
+    activations in [0, 127], as in Stockfish. The accumulator sums the feature weights in
+    int32 and is only saturated to int16 when evaluated, so that every update can be
+    undone exactly. Use quantize() to build one from an NNUE.
+    """
+
+    QA = 127
+    SHIFT = 16
+
+    def __init__(
+        self,
+        feature_weights,
+        ft_bias,
+        ft_multiplier,
+        l1_weight,
+        l1_bias,
+        l1_multiplier,
+        l2_weight,
+        l2_bias,
+        l2_scale,
+    ):
+        (
+            self.feature_weights,
+            self.ft_bias,
+            self.l1_weight,
+            self.l1_bias,
+            self.l2_weight,
+            self.l2_bias,
+        ) = _freeze(feature_weights, ft_bias, l1_weight, l1_bias, l2_weight, l2_bias)
+        self.ft_multiplier = ft_multiplier
+        self.l1_multiplier = l1_multiplier
+        self.l2_scale = l2_scale
+
+        # Widened and transposed once, since every forward multiplies by them
+        self.l1_weight_t = ascontiguousarray(l1_weight.T, dtype=int32)
+        self.l2_weight_t = ascontiguousarray(l2_weight.T, dtype=int32)
+        self.l1_weight_t.setflags(write=False)
+        self.l2_weight_t.setflags(write=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["l1_weight_t"], state["l2_weight_t"]
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def new_accumulator(self, active_features=()):
+        accumulator = Accumulator(None)
+        self.refresh_accumulator(accumulator, active_features)
+        return accumulator
+
+    def forward(self, accumulator):
+        return self._evaluate(accumulator.hidden)
+
+    def forward_batch(self, accumulators):
+        return self._evaluate(stack([a.hidden for a in accumulators]))
+
+    def forward_deltas(self, accumulator, deltas):
+        return self._evaluate(
+            accumulator.hidden + _sum_deltas(self.feature_weights, deltas).astype(int32)
+        )
+
+    def refresh_accumulator(self, accumulator, active_features):
+        active_features = asarray(active_features, dtype=intp)
+        accumulator.hidden = self.ft_bias + add.reduce(
+            self.feature_weights[active_features], axis=0, dtype=int32
+        )
+
+    def update_accumulator(self, accumulator, removed_features, added_features):
+        removed_features = asarray(removed_features, dtype=intp)
+        added_features = asarray(added_features, dtype=intp)
+        accumulator.hidden = (
+            accumulator.hidden
+            + add.reduce(self.feature_weights[added_features], axis=0, dtype=int32)
+            - add.reduce(self.feature_weights[removed_features], axis=0, dtype=int32)
+        )
+
+    def _ft(self, features):
+        return asarray(features, dtype=int32) @ self.feature_weights + self.ft_bias
+
+    def _saturate(self, hidden):
+        # Sums past the int16 range clip to its ends instead of wrapping around
+        return clip(hidden, INT16.min, INT16.max).astype(int16)
+
+    def _evaluate(self, hidden):
+        l1_x = self._clipped_relu(self._saturate(hidden), self.ft_multiplier)
+        l2_x = self._clipped_relu(self._l1(l1_x), self.l1_multiplier)
+
+        return self._l2(l2_x) / self.l2_scale
+
+    def _l1(self, features):
+        return features @ self.l1_weight_t + self.l1_bias
+
+    def _l2(self, features):
+        return features @ self.l2_weight_t + self.l2_bias
+
+    def _clipped_relu(self, features, multiplier):
+        # Rescale to activation units with a fixed-point multiply, then clip to [0, QA]
+        rounding = 1 << (self.SHIFT - 1)
+        rescaled = (features.astype(int64) * multiplier + rounding) >> self.SHIFT
+        return clip(rescaled, 0, self.QA).astype(int32)
+
+
+def quantize(model, calibration=None, max_features=None, headroom=1.0):
+    """
+    model: An NNUE with float weights.
+    calibration: Iterable of active feature lists used to measure activation ranges,
+            ideally of real positions, e.g. from a self-play dataset. By default, random
+            feature sets of max_features features are used.
+    max_features: The most features a position can activate, as many as on a full 11x11
+            board by default.
+    headroom: How far past the largest accumulator value expected for max_features
+            features the int16 accumulator must reach before it saturates.
+    return: A QuantizedNNUE approximating model
+    """
+    n_features = model.feature_weights.shape[0]
+    if max_features is None:
+        max_features = min(FeatureSpace().max_active_features, n_features)
+    if calibration is None:
+        rng = default_rng(0)
+        calibration = [
+            rng.choice(n_features, size=max_features, replace=False) for _ in range(256)
+        ]
+
+    # Activation ranges over the calibration positions set the clipping ceilings
+    max_accumulator = absolute(model.ft_bias)
+    ft_ceiling = 0.0
+    l1_ceiling = 0.0
+    for active_features in calibration:
+        active_features = asarray(active_features, dtype=intp)
+        features_sum = add.reduce(model.feature_weights[active_features], axis=0)
+        accumulator = model.ft_bias + features_sum
+        l1_x = model._l1(model._relu(accumulator))
+
+        # A sum of more features reaches at most proportionally further than this one
+        reach = max(1.0, max_features / max(len(active_features), 1))
+        max_accumulator = maximum(
+            max_accumulator, absolute(model.ft_bias) + absolute(features_sum) * reach
+        )
+        ft_ceiling = max(ft_ceiling, float(accumulator.max()))
+        l1_ceiling = max(l1_ceiling, float(l1_x.max()))
+    max_accumulator = float(max_accumulator.max())
+    ft_ceiling = ft_ceiling if ft_ceiling > 0 else 1.0
+    l1_ceiling = l1_ceiling if l1_ceiling > 0 else 1.0
+
+    int16_max = 2**15 - 1
+    ft_scale = min(
+        int16_max / (headroom * max(max_accumulator, 1e-12)),
+        int16_max / max(float(absolute(model.feature_weights).max()), 1e-12),
+        int16_max / max(float(absolute(model.ft_bias).max()), 1e-12),
+    )
+    l1_scale = 127 / max(float(absolute(model.l1_weight).max()), 1e-12)
+    l2_scale = 127 / max(float(absolute(model.l2_weight).max()), 1e-12)
+
+    # Every layer output is in units of (weight scale * activation scale)
+    qa = QuantizedNNUE.QA
+    one = 1 << QuantizedNNUE.SHIFT
+    ft_activation_scale = qa / ft_ceiling
+    l1_activation_scale = qa / l1_ceiling
+    l1_output_scale = l1_scale * ft_activation_scale
+    l2_output_scale = l2_scale * l1_activation_scale
+
+    return QuantizedNNUE(
+        rint(model.feature_weights * ft_scale).astype(int16),
+        rint(model.ft_bias * ft_scale).astype(int16),
+        int(round(one * ft_activation_scale / ft_scale)),
+        rint(model.l1_weight * l1_scale).astype(int8),
+        rint(model.l1_bias * l1_output_scale).astype(int32),
+        int(round(one * l1_activation_scale / l1_output_scale)),
+        rint(model.l2_weight * l2_scale).astype(int8),
+        rint(model.l2_bias * l2_output_scale).astype(int32),
+        l2_output_scale,
+    )
+
+
+if __name__ == "__main__":
+    # python src/nnue.py src/model.nnue data src/model_quantized.nnue
+    # Imported here, since they import this module
+    from model_file import load_model, save_model
+    from training import Dataset
+
+    parser = ArgumentParser(description="Quantize a model to int8/int16.")
+    parser.add_argument("model", help="model file with float weights")
+    parser.add_argument("positions", help="self-play dataset to calibrate on")
+    parser.add_argument("output", help="quantized model file to write")
+    parser.add_argument("--samples", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = Dataset(args.positions)
+    features, offsets, _, _ = next(
+        dataset.batches(args.samples, default_rng(args.seed), block_size=len(dataset))
+    )
+    calibration = [features[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    save_model(quantize(load_model(args.model), calibration), args.output)
@@ -0,0 +1,96 @@
+from threading import Condition, Thread
+
+"""
+Battlesnake pondering between moves.
+"""
+
+
+class Activity:
+    """
+    Counts the requests being handled, from their arrival until their response is sent.
+
+    Ponderers wait on its condition while any request is being handled, and are woken once
+    none are.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.requests = 0
+
+    def begin(self):
+        with self.condition:
+            self.requests += 1
+
+    def end(self):
+        """
+        return: True if no request is being handled any more
+        """
+        with self.condition:
+            self.requests -= 1
+            if not self.requests:
+                self.condition.notify_all()
+            return not self.requests
+
+
+class Ponderer:
+    """
+    Runs the search of one game on a worker thread between its moves.
+
+    The ponderer is the game's cancellation token: it is passed to the search, which stops
+    once is_set() returns True. is_set() also parks the search while any request is being
+    handled, so that pondering one game never holds the interpreter while another game's
+    response is being computed. A parked search is woken as soon as it is cancelled.
+    """
+
+    def __init__(self, activity):
+        """
+        activity: The Activity of the server's requests.
+        """
+        self.activity = activity
+
+        self.cancelled = False
+        # True while the search cannot touch the game's tree or table: parked or finished
+        self.parked = True
+        self.thread = None
+
+    def is_set(self):
+        activity = self.activity
+        with activity.condition:
+            if activity.requests and not self.cancelled:
+                self.parked = True
+                activity.condition.notify_all()
+                while activity.requests and not self.cancelled:
+                    activity.condition.wait()
+                self.parked = self.cancelled
+            return self.cancelled
+
+    def start(self, target, *args):
+        """
+        target: The search to run, called with args and then this ponderer.
+        return: None.
+        """
+        self.parked = False
+        self.thread = Thread(target=self._run, args=(target, args), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        return: None.
+
+        Cancels the search without waiting for its thread to end. A search that is not
+        parked yet is waited for until it reaches its next check, between two nodes, so that
+        the caller is free to use the game's tree or table once this returns.
+        """
+        with self.activity.condition:
+            self.cancelled = True
+            self.activity.condition.notify_all()
+            while not self.parked:
+                self.activity.condition.wait()
+
+    def _run(self, target, args):
+        try:
+            target(*args, self)
+        finally:
+            with self.activity.condition:
+                self.parked = True
+                self.activity.condition.notify_all()
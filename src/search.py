@@ -0,0 +1,319 @@
+from itertools import product
+from math import inf, tanh
+from time import perf_counter
+
+from transposition import EXACT, LOWER, UPPER
+
+from src.board import Board
+from src.floodfill import calc_regions
+
+"""
+Battlesnake lookahead search.
+"""
+
+
+class Timeout(Exception):
+    "Raised inside a search when its deadline has passed"
+
+
+def calc_simulator_regions(simulator):
+    """
+    simulator: A Simulator.
+    return: The (labels, sizes) of the connected open regions of the board, as calc_regions
+    """
+    board = Board(simulator.width, simulator.height)
+    board.occupied = bytearray(simulator.occupied)
+    return calc_regions(board)
+
+
+def calc_space_values(simulator, regions=None):
+    """
+    simulator: A Simulator.
+    regions: The calc_simulator_regions() of the board, if already known.
+    return: Dictionary of the value of every living snake, between 0 and 1, from how much
+            more open space and length it has than its strongest opponent
+    """
+    labels, sizes = (
+        regions if regions is not None else calc_simulator_regions(simulator)
+    )
+    alive = simulator.alive_snakes
+
+    spaces = {}
+    for index in alive:
+        neighbors = {
+            labels[cell]
+            for cell in simulator.move_table[simulator.head(index)]
+            if cell >= 0 and labels[cell] >= 0
+        }
+        spaces[index] = max((sizes[region] for region in neighbors), default=0)
+
+    cells = simulator.width * simulator.height
+    values = {}
+    for index in alive:
+        length = simulator.length(index)
+        their_space = max((spaces[i] for i in alive if i != index), default=0)
+        their_length = max(
+            (simulator.length(i) for i in alive if i != index), default=length
+        )
+        values[index] = (
+            0.5
+            + 0.25 * (spaces[index] - their_space) / cells
+            + 0.25 * tanh((length - their_length) / 4)
+        )
+
+    return values
+
+
+# Evaluations are kept this far from the scores of decided positions, see Search
+MARGIN = 1e-3
+
+
+class SpaceEvaluator:
+    "Evaluates positions by how much open space and length each snake has"
+
+    def prepare(self, simulator, me):
+        return calc_space_values(simulator)[me]
+
+    def evaluate_batch(self, prepared):
+        return prepared
+
+
+class NNUEEvaluator:
+    """
+    Evaluates positions by the greatest move output of the efficiently updatable neural
+    network.
+
+    The outputs of a model are Q-values in WDL space, where 0 is a loss, 0.5 a draw and 1 a
+    win, which is the scale of the search's terminal scores.
+    """
+
+    def __init__(self, model, feature_space):
+        self.model = model
+        self.feature_space = feature_space
+
+    def prepare(self, simulator, me):
+        return self.feature_space.extract_simulator(simulator, me)
+
+    def evaluate_batch(self, prepared):
+        accumulators = [self.model.new_accumulator(features) for features in prepared]
+        return self.model.forward_batch(accumulators).max(axis=1).tolist()
+
+
+class Search:
+    """
+    Iterative deepening paranoid alpha-beta search over simultaneous moves.
+
+    Every turn, we pick a move and then all opponents jointly pick the moves that are worst
+    for us. Leaves are scored by the evaluator, in batches of all children of a node, and
+    positions are worth 1 when we are the last snake left, 0.5 when every snake is
+    eliminated at once and 0 when only we are. Evaluations are values in WDL space too,
+    and are clipped to [MARGIN, 1 - MARGIN], so that a position still being played never
+    ranks with or beyond a decided one, whatever the evaluator returns.
+    With a transposition table, positions reached again by another order of moves, or on a
+    later turn, reuse their stored bounds and try their stored best move first.
+    """
+
+    def __init__(self, evaluator, max_depth=32, table=None):
+        self.evaluator = evaluator
+        self.max_depth = max_depth
+        self.table = table
+
+        self.nodes = 0
+        self.depth = 0
+        self.values = {}
+        self.upper_bounds = {}
+
+    def search(self, simulator, me, deadline, cancel=None):
+        """
+        simulator: The Simulator of the current position. It is left as it was found.
+        me: Index of our snake.
+        deadline: perf_counter() time by which the search must return.
+        cancel: Token whose is_set() is True once the search must return, e.g. an Event.
+        return: The best move of the deepest completed iteration, or None if the first
+                iteration did not complete
+        """
+        self.nodes = 0
+        self.depth = 0
+        self.values = {}
+        self.upper_bounds = {}
+        self.deadline = deadline
+        self.cancel = cancel
+        self.multiplayer = len(simulator.alive_snakes) > 1
+
+        best_move = None
+        moves = simulator.legal_moves(me)
+
+        if self.table is not None:
+            self.table.new_search()
+            moves = self._order(moves, self._probe(simulator, me))
+
+        for depth in range(1, self.max_depth + 1):
+            try:
+                move, value, values, upper_bounds = self._root(
+                    simulator, me, moves, depth
+                )
+            except Timeout:
+                break
+
+            best_move = move
+            self.depth = depth
+            self.values = values
+            self.upper_bounds = upper_bounds
+
+            # Searching the best move first lets alpha-beta cut the others sooner
+            moves = [move] + [m for m in moves if m != move]
+            if self.table is not None:
+                self.table.store(simulator.hash(me), depth, EXACT, value, move)
+            if value in (0.0, 1.0):
+                break
+
+        return best_move
+
+    def _root(self, simulator, me, moves, depth):
+        alpha = -inf
+        best_move = moves[0]
+        values = {}
+        upper_bounds = {}
+
+        # Moves after the first are only searched to prove they are no better, so those
+        # that are not only get an upper bound on their value
+        for move in moves:
+            value = self._min(simulator, me, move, depth, alpha, inf)
+            if value > alpha:
+                values[move] = value
+                alpha = value
+                best_move = move
+            else:
+                upper_bounds[move] = value
+
+        return best_move, alpha, values, upper_bounds
+
+    def _max(self, simulator, me, depth, alpha, beta):
+        terminal = self._terminal(simulator, me)
+        if terminal is not None:
+            return terminal
+        if depth == 0:
+            return self._evaluate([self.evaluator.prepare(simulator, me)])[0]
+
+        moves = simulator.legal_moves(me)
+        if self.table is not None:
+            key = simulator.hash(me)
+            entry = self.table.probe(key)
+            if entry is not None and entry[0] >= depth:
+                _, bound, value, _ = entry
+                if bound == EXACT:
+                    return value
+                if bound == LOWER and value >= beta:
+                    return value
+                if bound == UPPER and value <= alpha:
+                    return value
+            moves = self._order(moves, entry)
+
+        original_alpha = alpha
+        best = -inf
+        best_move = -1
+        for move in moves:
+            value = self._min(simulator, me, move, depth, alpha, beta)
+            if value > best:
+                best = value
+                best_move = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if self.table is not None:
+            if best <= original_alpha:
+                bound = UPPER
+            elif best >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            self.table.store(key, depth, bound, best, best_move)
+
+        return best
+
+    def _probe(self, simulator, me):
+        return self.table.probe(simulator.hash(me))
+
+    def _order(self, moves, entry):
+        if entry is None or entry[3] not in moves:
+            return moves
+        return [entry[3]] + [m for m in moves if m != entry[3]]
+
+    def _min(self, simulator, me, my_move, depth, alpha, beta):
+        joint_moves = self._joint_moves(simulator, me, my_move)
+
+        if depth == 1:
+            return min(self._leaves(simulator, me, joint_moves))
+
+        worst = inf
+        for moves in joint_moves:
+            self._make(simulator, moves)
+            try:
+                value = self._max(simulator, me, depth - 1, alpha, beta)
+            finally:
+                simulator.unmake()
+
+            worst = min(worst, value)
+            beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        return worst
+
+    def _leaves(self, simulator, me, joint_moves):
+        values = [None] * len(joint_moves)
+        pending = []
+        prepared = []
+
+        for i, moves in enumerate(joint_moves):
+            self._make(simulator, moves)
+            try:
+                values[i] = self._terminal(simulator, me)
+                if values[i] is None:
+                    pending.append(i)
+                    prepared.append(self.evaluator.prepare(simulator, me))
+            finally:
+                simulator.unmake()
+
+        if prepared:
+            for i, value in zip(pending, self._evaluate(prepared)):
+                values[i] = value
+
+        return values
+
+    def _evaluate(self, prepared):
+        return [
+            min(max(value, MARGIN), 1 - MARGIN)
+            for value in self.evaluator.evaluate_batch(prepared)
+        ]
+
+    def _joint_moves(self, simulator, me, my_move):
+        alive = simulator.alive_snakes
+        opponents = [index for index in alive if index != me]
+        options = [simulator.legal_moves(index) for index in opponents]
+
+        joint_moves = []
+        for their_moves in product(*options):
+            moves = [0] * len(simulator.alive)
+            moves[me] = my_move
+            for index, move in zip(opponents, their_moves):
+                moves[index] = move
+            joint_moves.append(moves)
+
+        return joint_moves
+
+    def _make(self, simulator, moves):
+        if perf_counter() > self.deadline:
+            raise Timeout()
+        if self.cancel is not None and self.cancel.is_set():
+            raise Timeout()
+        self.nodes += 1
+        simulator.make(moves)
+
+    def _terminal(self, simulator, me):
+        if not simulator.alive[me]:
+            return 0.5 if not simulator.alive_snakes else 0.0
+        if self.multiplayer and len(simulator.alive_snakes) == 1:
+            return 1.0
+        return None
@@ -0,0 +1,258 @@
+from http.client import HTTPConnection, HTTPException
+from json import loads
+from logging import getLogger, ERROR
+from multiprocessing import get_context
+from os import environ
+from re import compile
+from signal import SIGTERM, signal
+from socket import socket
+from sys import exit
+from threading import local
+from zlib import crc32
+
+from waitress import create_server as create_waitress_server
+from waitress.wasyncore import close_all
+
+import main
+from metrics import metrics
+
+"""
+Battlesnake production server.
+"""
+
+# Headers that only describe one connection, and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# The engine sends the game first, so its id is found without parsing the whole body
+GAME_ID = compile(rb'^\s*\{\s*"game"\s*:\s*\{\s*"id"\s*:\s*"([^"\\]*)"')
+
+
+def create_server(app, host="127.0.0.1", port=0, threads=8, sock=None, idle_timeout=30):
+    """
+    app: The WSGI app to serve.
+    host: Address to listen on.
+    port: Port to listen on, or 0 for any free port.
+    threads: Number of threads handling requests.
+    sock: A bound socket to listen on instead of host and port, e.g. one made before forking.
+    idle_timeout: Seconds after which a kept-alive connection with no request is closed.
+    return: A waitress server, whose run() serves forever. Connections are kept alive
+            without holding a thread while they wait for their next request.
+    """
+    if sock is not None:
+        listen = {"sockets": [sock]}
+    else:
+        listen = {"host": host, "port": port}
+
+    # Idle connections are only looked for every cleanup interval
+    return create_waitress_server(
+        app,
+        threads=threads,
+        channel_timeout=idle_timeout,
+        cleanup_interval=max(1, idle_timeout // 2),
+        ident=None,
+        **listen,
+    )
+
+
+def stop_server(server):
+    """
+    server: A server made by create_server(), running on another thread.
+    return: None, once its threads have stopped. Its run() returns once its loop has closed
+            every connection.
+    """
+    # Sockets may only be closed by the loop polling them
+    server.trigger.pull_trigger(lambda: close_all(server._map))
+    server.task_dispatcher.shutdown()
+
+
+class Router:
+    """
+    A WSGI app that forwards every request to the worker process that owns its game.
+
+    Games are assigned to workers by a hash of their id, so that the state Logic keeps for
+    a game is always in the process that handles its requests. Every router thread keeps one
+    connection open to every worker.
+    """
+
+    def __init__(self, ports, timeout=5.0):
+        """
+        ports: The loopback ports of the workers.
+        timeout: Seconds to wait for a worker.
+        """
+        self.ports = ports
+        self.timeout = timeout
+        self.connections = local()
+
+    def __call__(self, environ, start_response):
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else b""
+
+        path = environ.get("PATH_INFO", "/")
+        if environ.get("QUERY_STRING"):
+            path += "?" + environ["QUERY_STRING"]
+        headers = {"Content-Type": environ.get("CONTENT_TYPE") or "application/json"}
+
+        if path == "/metrics":
+            return self._gather_metrics(start_response)
+
+        port = self.ports[self.worker(body)]
+        try:
+            response, content = self._forward(
+                port, environ["REQUEST_METHOD"], path, body, headers
+            )
+        except (OSError, HTTPException):
+            start_response("502 Bad Gateway", [("Content-Type", "text/plain")])
+            return [b"worker unavailable"]
+
+        start_response(
+            f"{response.status} {response.reason}",
+            [
+                (name, value)
+                for name, value in response.getheaders()
+                if name.lower() not in HOP_BY_HOP_HEADERS
+            ],
+        )
+        return [content]
+
+    def worker(self, body):
+        """
+        body: The JSON body of a request.
+        return: The index of the worker that owns the request's game
+        """
+        match = GAME_ID.match(body)
+        if match is not None:
+            return crc32(match.group(1)) % len(self.ports)
+
+        # Bodies with their keys in another order, or escapes in the id, are parsed
+        try:
+            game_id = loads(body)["game"]["id"]
+        except (ValueError, KeyError, TypeError):
+            return 0
+        return crc32(str(game_id).encode()) % len(self.ports)
+
+    def _gather_metrics(self, start_response):
+        # Every worker has its own histograms, labelled with its index, and the samples of
+        # a metric must follow its comments in one group
+        comments = {}
+        samples = {}
+        for port in self.ports:
+            try:
+                response, content = self._forward(port, "GET", "/metrics", b"", {})
+            except (OSError, HTTPException):
+                continue
+
+            for line in content.decode().splitlines():
+                if line.startswith("#"):
+                    family = line.split()[2]
+                    if line not in comments.setdefault(family, []):
+                        comments[family].append(line)
+                    samples.setdefault(family, [])
+                elif line:
+                    name = line.split("{")[0].split()[0]
+                    for suffix in ("_bucket", "_sum", "_count", ""):
+                        family = name[: len(name) - len(suffix)]
+                        if name.endswith(suffix) and family in samples:
+                            samples[family].append(line)
+                            break
+
+        lines = []
+        for family in comments:
+            lines += comments[family] + samples[family]
+
+        start_response("200 OK", [("Content-Type", "text/plain; version=0.0.4")])
+        return ["\n".join(lines).encode() + b"\n"]
+
+    def _forward(self, port, method, path, body, headers):
+        connections = getattr(self.connections, "ports", None)
+        if connections is None:
+            connections = self.connections.ports = {}
+
+        # A kept-alive connection may have been closed by the worker, so retry once
+        for attempt in range(2):
+            connection = connections.get(port)
+            if connection is None:
+                connection = HTTPConnection("127.0.0.1", port, timeout=self.timeout)
+                connections[port] = connection
+
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                return response, response.read()
+            except (OSError, HTTPException):
+                connection.close()
+                del connections[port]
+                if attempt:
+                    raise
+
+
+def serve(host="0.0.0.0", port=8080, workers=1, threads=8, idle_timeout=30):
+    """
+    host: Address to listen on.
+    port: Port to listen on.
+    workers: Number of worker processes. With more than one, a router process forwards
+            every request to the worker that owns its game.
+    threads: Number of threads of every process.
+    idle_timeout: Seconds after which a kept-alive connection with no request is closed.
+    return: None, once the server stops.
+    """
+    # The model is mapped from its file, so every worker shares its pages in the page cache
+    main.logic = main.create_logic()
+
+    if workers <= 1:
+        main.logs = main.create_logs()
+        create_server(main.app, host, port, threads, idle_timeout=idle_timeout).run()
+        return
+
+    # Workers listen on loopback ports picked by the system before forking, and start
+    # their threads after it, since threads do not survive a fork
+    sockets = []
+    for _ in range(workers):
+        sock = socket()
+        sock.bind(("127.0.0.1", 0))
+        # Connections queue from now on, even before a worker has started serving
+        sock.listen(1024)
+        sockets.append(sock)
+
+    context = get_context("fork")
+    for index, sock in enumerate(sockets):
+        context.Process(
+            target=_serve_worker, args=(sock, threads, idle_timeout, index), daemon=True
+        ).start()
+
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+
+    # Exiting normally terminates the daemonic workers too
+    signal(SIGTERM, lambda signum, frame: exit(0))
+    create_server(Router(ports), host, port, threads, idle_timeout=idle_timeout).run()
+
+
+def _serve_worker(sock, threads, idle_timeout, index):
+    main.logs = main.create_logs()
+    metrics.labels = {"worker": str(index)}
+    create_server(main.app, sock=sock, threads=threads, idle_timeout=idle_timeout).run()
+
+
+if __name__ == "__main__":
+    getLogger("waitress").setLevel(ERROR)
+
+    host = "0.0.0.0"
+    port = int(environ.get("PORT", "8080"))
+    workers = int(environ.get("WORKERS", "1"))
+    threads = int(environ.get("THREADS", "8"))
+    idle_timeout = int(environ.get("IDLE_TIMEOUT", "30"))
+
+    print(
+        f"\nRunning Battlesnake server at http://{host}:{port} with {workers} workers"
+    )
+    serve(host, port, workers, threads, idle_timeout)
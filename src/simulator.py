@@ -0,0 +1,430 @@
+from collections import deque
+from functools import lru_cache
+from random import Random
+
+"""
+Battlesnake standard rules, for lookahead.
+"""
+
+UP, DOWN, LEFT, RIGHT = range(4)
+MOVES = ("up", "down", "left", "right")
+
+# The direction of a segment to the next one, NOOP for the tail and stacked segments
+NOOP = 4
+MASK = 2**64 - 1
+
+
+@lru_cache(maxsize=None)
+def calc_move_table(width, height):
+    # The cell reached by each move from every cell, or -1 off the board
+    table = []
+    for cell in range(width * height):
+        x, y = cell % width, cell // width
+        table.append(
+            (
+                cell + width if y + 1 < height else -1,
+                cell - width if y > 0 else -1,
+                cell - 1 if x > 0 else -1,
+                cell + 1 if x + 1 < width else -1,
+            )
+        )
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def calc_zobrist_keys(width, height, seed=0):
+    """
+    width: Width of the board.
+    height: Height of the board.
+    seed: Seed of the keys.
+    return: The random 64-bit (food, head, segment, length) keys, by cell, by head cell
+            and health, by cell and direction, and by length
+    """
+    rng = Random(seed)
+    cells = width * height
+
+    def keys(n):
+        return tuple(rng.getrandbits(64) for _ in range(n))
+
+    return keys(cells), keys(cells * 101), keys(cells * 5), keys(cells + 2)
+
+
+def mix(key):
+    """
+    key: A 64-bit key.
+    return: The key scrambled by the SplitMix64 finalizer
+    """
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & MASK
+    return key ^ (key >> 31)
+
+
+class Simulator:
+    """
+    A standard Battlesnake board that can make and unmake turns.
+
+    Squares are flat cell indices, y * width + x, and every body is a deque of cells with
+    the head on the left. make() pushes what it changed onto an undo stack, so a search
+    can walk down and back up the game tree without copying the board.
+
+    The Zobrist key of every snake is the XOR of the keys of its head and health, of every
+    segment and the direction to the next one, and of its length. The key of the board is
+    the XOR of its food keys and of the keys of its living snakes, so that make() only
+    updates the keys of the squares that changed.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.move_table = calc_move_table(width, height)
+        self.zobrist_keys = calc_zobrist_keys(width, height)
+        self.directions = {width: UP, -width: DOWN, -1: LEFT, 1: RIGHT, 0: NOOP}
+
+        self.food = bytearray(width * height)
+        self.occupied = bytearray(width * height)
+
+        self.ids = []
+        self.bodies = []
+        self.health = []
+        self.alive = []
+
+        self.key = 0
+        self.snake_keys = []
+
+        self.turn = 0
+        self.history = []
+
+    @classmethod
+    def from_request(cls, data):
+        """
+        data: Dictionary of all Game Board data as received from the Battlesnake Engine.
+        return: A Simulator holding the same board
+        """
+        board = data["board"]
+        simulator = cls(board["width"], board["height"])
+        simulator.turn = data.get("turn", 0)
+
+        for food in board["food"]:
+            simulator.add_food(simulator.cell(food["x"], food["y"]))
+
+        for snake in board["snakes"]:
+            body = [simulator.cell(c["x"], c["y"]) for c in snake["body"]]
+            simulator.add_snake(snake["id"], body, snake["health"])
+
+        return simulator
+
+    @classmethod
+    def start(cls, width, height, n_snakes, rng):
+        """
+        width: Width of the board.
+        height: Height of the board.
+        n_snakes: Number of snakes, at most 8.
+        rng: A random.Random to draw from.
+        return: A Simulator at turn 0, with snakes stacked on the standard starting squares
+        """
+        left, bottom = 1, 1
+        right, top = width - 2, height - 2
+        middle_x, middle_y = width // 2, height // 2
+        squares = [
+            (left, bottom),
+            (right, top),
+            (left, top),
+            (right, bottom),
+            (middle_x, bottom),
+            (middle_x, top),
+            (left, middle_y),
+            (right, middle_y),
+        ]
+        if n_snakes > len(squares):
+            raise ValueError(f"at most {len(squares)} snakes fit the starting squares")
+        rng.shuffle(squares)
+
+        simulator = cls(width, height)
+        for index, (x, y) in enumerate(squares[:n_snakes]):
+            simulator.add_snake(f"snake-{index}", [simulator.cell(x, y)] * 3, 100)
+        simulator.spawn_food(rng, minimum=n_snakes + 1)
+        return simulator
+
+    def to_request(self, you, game=None):
+        """
+        you: Index of the snake the request is for.
+        game: Dictionary of game information to send, e.g. {"id": "...", "ruleset": {...}}
+        return: Dictionary of all Game Board data, as the Battlesnake Engine would send it
+        """
+        snakes = []
+        for index in range(len(self.ids)):
+            if not self.alive[index]:
+                continue
+            body = [self.coords(cell) for cell in self.bodies[index]]
+            snakes.append(
+                {
+                    "id": self.ids[index],
+                    "name": self.ids[index],
+                    "health": self.health[index],
+                    "body": body,
+                    "head": body[0],
+                    "length": len(body),
+                    "latency": "0",
+                    "shout": "",
+                }
+            )
+
+        you_id = self.ids[you]
+        return {
+            "game": game if game is not None else {"id": "", "timeout": 500},
+            "turn": self.turn,
+            "board": {
+                "width": self.width,
+                "height": self.height,
+                "food": [self.coords(c) for c, f in enumerate(self.food) if f],
+                "hazards": [],
+                "snakes": snakes,
+            },
+            "you": next((s for s in snakes if s["id"] == you_id), None),
+        }
+
+    def cell(self, x, y):
+        return y * self.width + x
+
+    def coords(self, cell):
+        return {"x": cell % self.width, "y": cell // self.width}
+
+    def add_food(self, cell):
+        if not self.food[cell]:
+            self.food[cell] = 1
+            self.key ^= self.zobrist_keys[0][cell]
+
+    def add_snake(self, snake_id, body, health):
+        self.ids.append(snake_id)
+        self.bodies.append(deque(body))
+        self.health.append(health)
+        self.alive.append(True)
+        for cell in body:
+            self.occupied[cell] += 1
+
+        snake_key = self._snake_key(body, health)
+        self.snake_keys.append(snake_key)
+        self.key ^= snake_key
+
+    def hash(self, me):
+        """
+        me: Index of our snake.
+        return: The Zobrist key of the position as seen by our snake, in which opponents
+                are told apart by their bodies rather than by their order
+        """
+        return self.key ^ mix(self.snake_keys[me])
+
+    @property
+    def alive_snakes(self):
+        return [index for index, alive in enumerate(self.alive) if alive]
+
+    def is_over(self):
+        return sum(self.alive) <= 1
+
+    def head(self, index):
+        return self.bodies[index][0]
+
+    def length(self, index):
+        return len(self.bodies[index])
+
+    def legal_moves(self, index):
+        """
+        index: Index of a living snake.
+        return: The moves that stay on the board and out of bodies, allowing for tails that
+                will move out of the way. Every move if none are safe.
+        """
+        tails = {}
+        for other in self.alive_snakes:
+            body = self.bodies[other]
+            # A tail stays put for a turn after its snake has eaten
+            if len(body) < 2 or body[-1] != body[-2]:
+                tails[body[-1]] = tails.get(body[-1], 0) + 1
+
+        moves = []
+        for move, cell in enumerate(self.move_table[self.bodies[index][0]]):
+            if cell >= 0 and self.occupied[cell] <= tails.get(cell, 0):
+                moves.append(move)
+
+        return moves if moves else list(range(4))
+
+    def make(self, moves):
+        """
+        moves: List of moves, one for each snake, ignored for eliminated snakes.
+        return: None.
+
+        Plays one turn: move, reduce health, feed, then eliminate. Food is not spawned.
+        """
+        alive = self.alive_snakes
+        bodies = self.bodies
+        occupied = self.occupied
+        food_keys, head_keys, segment_keys, length_keys = self.zobrist_keys
+        directions = self.directions
+        snake_keys = self.snake_keys
+        key = self.key
+
+        # Each entry is (index, tail, health, snake key), enough to put the snake back
+        moved = []
+        eaten = []
+
+        for index in alive:
+            body = bodies[index]
+            head = body[0]
+            next_head = self.move_table[head][moves[index]]
+            health = self.health[index]
+            previous_key = snake_keys[index]
+            # The head, its health and the length are keyed again once the snake has eaten
+            snake_key = previous_key ^ head_keys[head * 101 + health]
+            snake_key ^= length_keys[len(body)]
+
+            tail = body.pop()
+            moved.append((index, tail, health, previous_key))
+            if tail >= 0:
+                occupied[tail] -= 1
+                snake_key ^= segment_keys[tail * 5 + NOOP]
+                # The segment before the tail is the new tail
+                if body:
+                    before = body[-1]
+                    snake_key ^= (
+                        segment_keys[before * 5 + directions[tail - before]]
+                        ^ segment_keys[before * 5 + NOOP]
+                    )
+
+            body.appendleft(next_head)
+            if next_head >= 0:
+                occupied[next_head] += 1
+                snake_key ^= segment_keys[next_head * 5 + directions[head - next_head]]
+
+            self.health[index] = health - 1
+            snake_keys[index] = snake_key
+
+        grew = []
+        for index in alive:
+            body = bodies[index]
+            head = body[0]
+            if head >= 0 and self.food[head]:
+                self.health[index] = 100
+                body.append(body[-1])
+                occupied[body[-1]] += 1
+                grew.append(index)
+                eaten.append(head)
+                snake_keys[index] ^= segment_keys[body[-1] * 5 + NOOP]
+
+        for index, _, _, previous_key in moved:
+            body = bodies[index]
+            snake_key = snake_keys[index] ^ length_keys[len(body)]
+            if body[0] >= 0:
+                snake_key ^= head_keys[body[0] * 101 + self.health[index]]
+            snake_keys[index] = snake_key
+            key ^= previous_key ^ snake_key
+
+        eaten = set(eaten)
+        for cell in eaten:
+            self.food[cell] = 0
+            key ^= food_keys[cell]
+
+        history_key = self.key
+        self.key = key
+        eliminated = self._eliminate(alive)
+
+        self.history.append((moved, grew, eaten, eliminated, history_key))
+        self.turn += 1
+
+    def unmake(self):
+        moved, grew, eaten, eliminated, self.key = self.history.pop()
+        bodies = self.bodies
+        occupied = self.occupied
+
+        for index in eliminated:
+            self.alive[index] = True
+            for cell in bodies[index]:
+                if cell >= 0:
+                    occupied[cell] += 1
+
+        for cell in eaten:
+            self.food[cell] = 1
+
+        for index in grew:
+            occupied[bodies[index].pop()] -= 1
+
+        for index, tail, health, snake_key in moved:
+            body = bodies[index]
+            head = body.popleft()
+            if head >= 0:
+                occupied[head] -= 1
+            body.append(tail)
+            if tail >= 0:
+                occupied[tail] += 1
+            self.health[index] = health
+            self.snake_keys[index] = snake_key
+
+        self.turn -= 1
+
+    def spawn_food(self, rng, minimum=1, chance=0.15):
+        """
+        rng: A random.Random to draw from.
+        return: None.
+
+        Places food as the standard ruleset does. This is not undone by unmake(), so only
+        call it on boards that are played forwards.
+        """
+        n_food = sum(self.food)
+        count = max(minimum - n_food, 1 if rng.random() < chance else 0)
+        if count <= 0:
+            return
+
+        free = [
+            cell
+            for cell in range(self.width * self.height)
+            if not self.occupied[cell] and not self.food[cell]
+        ]
+        for cell in rng.sample(free, min(count, len(free))):
+            self.add_food(cell)
+
+    def _eliminate(self, alive):
+        bodies = self.bodies
+        occupied = self.occupied
+
+        # Starved and out of bounds snakes are removed before collisions are checked
+        eliminated = [
+            index for index in alive if self.health[index] <= 0 or bodies[index][0] < 0
+        ]
+        self._remove(eliminated)
+        remaining = [index for index in alive if self.alive[index]]
+
+        heads = {}
+        for index in remaining:
+            heads.setdefault(bodies[index][0], []).append(index)
+
+        collided = []
+        for index in remaining:
+            head = bodies[index][0]
+            others = heads[head]
+
+            # Any segment on the head's square other than heads is a body collision
+            if occupied[head] > len(others):
+                collided.append(index)
+                continue
+
+            length = len(bodies[index])
+            for other in others:
+                if other != index and len(bodies[other]) >= length:
+                    collided.append(index)
+                    break
+
+        self._remove(collided)
+        return eliminated + collided
+
+    def _remove(self, indices):
+        for index in indices:
+            self.alive[index] = False
+            self.key ^= self.snake_keys[index]
+            for cell in self.bodies[index]:
+                if cell >= 0:
+                    self.occupied[cell] -= 1
+
+    def _snake_key(self, body, health):
+        _, head_keys, segment_keys, length_keys = self.zobrist_keys
+        snake_key = head_keys[body[0] * 101 + health] ^ length_keys[len(body)]
+        for cell, next_cell in zip(body, list(body)[1:] + [body[-1]]):
+            snake_key ^= segment_keys[cell * 5 + self.directions[next_cell - cell]]
+        return snake_key
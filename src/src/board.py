@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def calc_neighbor_table(width, height):
+    # In-bounds neighbours of every cell, in the same up/down/right/left order as calc_neighbors
+    table = []
+    for index in range(width * height):
+        x, y = index % width, index // width
+        neighbors = []
+        if y + 1 < height:
+            neighbors.append(index + width)
+        if y > 0:
+            neighbors.append(index - width)
+        if x + 1 < width:
+            neighbors.append(index + 1)
+        if x > 0:
+            neighbors.append(index - 1)
+        table.append(tuple(neighbors))
+    return tuple(table)
+
+
+class Board:
+    __slots__ = ("width", "height", "neighbors", "occupied", "food", "heads", "regions")
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.neighbors = calc_neighbor_table(width, height)
+        self.occupied = bytearray(width * height)
+        self.food = bytearray(width * height)
+        self.heads = bytearray(width * height)
+        self.regions = None
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_open(self, x, y):
+        if not self.in_bounds(x, y):
+            return False
+        return not self.occupied[y * self.width + x]
+
+
+def build_board(board):
+    width = board["width"]
+    compact_board = Board(width, board["height"])
+
+    occupied = compact_board.occupied
+    heads = compact_board.heads
+    food = compact_board.food
+
+    # Tails move out of the way on the next turn, so they are never occupied
+    for snake in board["snakes"]:
+        body = snake["body"]
+        for snake_coords in body[:-1]:
+            occupied[snake_coords["y"] * width + snake_coords["x"]] = 1
+        if body:
+            heads[body[0]["y"] * width + body[0]["x"]] = 1
+
+    for food_coords in board["food"]:
+        food[food_coords["y"] * width + food_coords["x"]] = 1
+
+    return compact_board
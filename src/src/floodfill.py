@@ -1,19 +1,8 @@
-def is_coords_open(board, coords):
-    if coords["x"] < 0:
-        return False
-    if coords["x"] >= board["width"]:
-        return False
-    if coords["y"] < 0:
-        return False
-    if coords["y"] >= board["height"]:
-        return False
+from collections import deque
 
-    for snake in board["snakes"]:
-        for snake_coords in snake["body"][:-1]:
-            if snake_coords == coords:
-                return False
 
-    return True
+def is_coords_open(board, coords):
+    return board.is_open(coords["x"], coords["y"])
 
 
 def calc_neighbors(coords):
@@ -25,24 +14,74 @@ def calc_neighbors(coords):
     ]
 
 
-def calc_open_space(board, coords):
+def calc_open_space(board, coords, limit=None):
     if not is_coords_open(board, coords):
         return 0
 
-    open_coords = [coords]
-    seen_coords = []
+    start = board.index(coords["x"], coords["y"])
+    neighbors = board.neighbors
+
+    # Occupied cells start out as seen, so one lookup rejects both
+    seen = bytearray(board.occupied)
+    seen[start] = 1
+    open_cells = deque([start])
+    open_space = 0
+
+    while open_cells:
+        cell = open_cells.popleft()
+        open_space += 1
+        if limit is not None and open_space >= limit:
+            break
+
+        for neighbor in neighbors[cell]:
+            if not seen[neighbor]:
+                seen[neighbor] = 1
+                open_cells.append(neighbor)
+
+    return open_space
+
+
+def calc_regions(board):
+    # Label every open cell with its connected region once, and share it across callers
+    if board.regions is not None:
+        return board.regions
+
+    occupied = board.occupied
+    neighbors = board.neighbors
+    labels = [-1] * len(occupied)
+    sizes = []
+
+    for start in range(len(occupied)):
+        if occupied[start] or labels[start] >= 0:
+            continue
+
+        label = len(sizes)
+        labels[start] = label
+        open_cells = [start]
+        size = 0
+
+        while open_cells:
+            cell = open_cells.pop()
+            size += 1
+            for neighbor in neighbors[cell]:
+                if labels[neighbor] < 0 and not occupied[neighbor]:
+                    labels[neighbor] = label
+                    open_cells.append(neighbor)
+
+        sizes.append(size)
+
+    board.regions = (labels, sizes)
+    return board.regions
+
 
-    while len(open_coords) > 0:
-        c = open_coords.pop(0)
-        seen_coords.append(c)
+def calc_region_sizes(board, coords_list):
+    labels, sizes = calc_regions(board)
 
-        neighbors = calc_neighbors(c)
-        for neighbor in neighbors:
-            if neighbor in seen_coords:
-                continue
-            if not is_coords_open(board, neighbor):
-                continue
-            if neighbor not in open_coords:
-                open_coords.append(neighbor)
+    region_sizes = []
+    for coords in coords_list:
+        if is_coords_open(board, coords):
+            region_sizes.append(sizes[labels[board.index(coords["x"], coords["y"])]])
+        else:
+            region_sizes.append(0)
 
-    return len(seen_coords)
+    return region_sizes
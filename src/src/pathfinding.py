@@ -1,45 +1,36 @@
 from astar import AStar
 
+from src.board import build_board
 
-def calc_possible_moves(request):
-    possible_moves = ["up", "down", "left", "right"]
 
-    def remove_move(move):
-        if move in possible_moves:
-            possible_moves.remove(move)
+def calc_possible_moves(request, board=None):
+    if board is None:
+        board = build_board(request["board"])
 
     head = request["you"]["body"][0]
-
-    # Remove oob from possible moves
-    if head["x"] == 0:
-        remove_move("left")
-    if head["y"] == 0:
-        remove_move("down")
-    if head["x"] == request["board"]["width"] - 1:
-        remove_move("right")
-    if head["y"] == request["board"]["height"] - 1:
-        remove_move("up")
-
-    # Remove all snake bodies, excluding tails, from possible moves
-    for snake in request["board"]["snakes"]:
-        necks = snake["body"][:-1]
-        for neck in necks:
-            if (neck["x"] == head["x"] + 1) and (neck["y"] == head["y"]):
-                remove_move("right")
-            if (neck["x"] == head["x"] - 1) and (neck["y"] == head["y"]):
-                remove_move("left")
-            if (neck["x"] == head["x"]) and (neck["y"] == head["y"] + 1):
-                remove_move("up")
-            if (neck["x"] == head["x"]) and (neck["y"] == head["y"] - 1):
-                remove_move("down")
+    x, y = head["x"], head["y"]
+
+    # Remove oob and all snake bodies, excluding tails, from possible moves
+    possible_moves = []
+    if board.is_open(x, y + 1):
+        possible_moves.append("up")
+    if board.is_open(x, y - 1):
+        possible_moves.append("down")
+    if board.is_open(x - 1, y):
+        possible_moves.append("left")
+    if board.is_open(x + 1, y):
+        possible_moves.append("right")
 
     return possible_moves
 
 
-def calc_next_move(request, current_coords, target_coords):
+def calc_next_move(request, current_coords, target_coords, board=None):
+    if board is None:
+        board = build_board(request["board"])
+
     st = (current_coords["x"], current_coords["y"])
     et = (target_coords["x"], target_coords["y"])
-    astar_solver = BattlesnakeAStarPathfinder(request["board"], target_coords)
+    astar_solver = BattlesnakeAStarPathfinder(board, target_coords)
     path = astar_solver.astar(st, et)
     if path:
         path_tuples = list(path)
@@ -87,23 +78,7 @@ class BattlesnakeAStarPathfinder(AStar):
                 actual_neighbors.append(possible_neighbor)
                 continue
 
-            if possible_neighbor[0] < 0:
-                continue
-            if possible_neighbor[0] >= self._board["width"]:
-                continue
-            if possible_neighbor[1] < 0:
-                continue
-            if possible_neighbor[1] >= self._board["height"]:
-                continue
-
-            occupied = False
-            for snake in self._board["snakes"]:
-                for snake_coords in snake["body"][:-1]:
-                    snake_tuple = (snake_coords["x"], snake_coords["y"])
-                    if possible_neighbor == snake_tuple:
-                        occupied = True
-
-            if not occupied:
+            if self._board.is_open(possible_neighbor[0], possible_neighbor[1]):
                 actual_neighbors.append(possible_neighbor)
 
         # print(f" NBORS: {node}, {actual_neighbors}")
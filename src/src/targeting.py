@@ -1,8 +1,12 @@
-from src.floodfill import calc_open_space
+from src.board import build_board
+from src.floodfill import calc_region_sizes
 from src.util import calc_manhattan_distance
 
 
-def calc_targets(request):
+def calc_targets(request, board=None):
+    if board is None:
+        board = build_board(request["board"])
+
     targets = []
 
     head_coords = request["you"]["head"]
@@ -12,10 +16,8 @@ def calc_targets(request):
         key=lambda x: calc_manhattan_distance(head_coords, x),
     )
 
-    food_scores = []
-    for food_coords in ordered_food + [request["you"]["body"][-1]]:
-        score = calc_open_space(request["board"], food_coords)
-        food_scores.append((food_coords, score))
+    food_coords_list = ordered_food + [request["you"]["body"][-1]]
+    food_scores = list(zip(food_coords_list, calc_region_sizes(board, food_coords_list)))
     food_scores.sort(key=lambda x: x[1], reverse=True)
     for food_score in food_scores:
         targets.append(food_score[0])
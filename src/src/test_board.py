@@ -0,0 +1,79 @@
+from src.board import build_board
+from src.floodfill import calc_open_space, calc_region_sizes
+from src.pathfinding import calc_possible_moves, calc_next_move
+from src.targeting import calc_targets
+from utils.test import build_test_gamestate
+
+
+def _request(*args, **kwargs):
+    return build_test_gamestate(*args, **kwargs).data
+
+
+def test_tails_are_open():
+    request = _request(3, 3, me=[(1, 1), (1, 0), (0, 0)], food=[(2, 2)])
+    board = build_board(request["board"])
+
+    assert not board.is_open(1, 1)
+    assert not board.is_open(1, 0)
+    assert board.is_open(0, 0)
+    assert board.heads[board.index(1, 1)]
+    assert board.food[board.index(2, 2)]
+
+
+def test_out_of_bounds():
+    board = build_board(_request(2, 2)["board"])
+
+    assert not board.is_open(-1, 0)
+    assert not board.is_open(0, -1)
+    assert not board.is_open(2, 0)
+    assert not board.is_open(0, 2)
+
+
+def test_possible_moves():
+    request = _request(
+        3, 3, me=[(1, 1), (1, 0), (0, 0)], opponents=[[(2, 2), (2, 1), (2, 0)]]
+    )
+
+    assert calc_possible_moves(request) == ["up", "left"]
+
+
+def test_open_space():
+    request = _request(3, 3, me=[(1, 0), (1, 1), (1, 2), (1, 2)])
+    board = build_board(request["board"])
+
+    assert calc_open_space(board, {"x": 0, "y": 0}) == 3
+    assert calc_open_space(board, {"x": 2, "y": 1}) == 3
+    assert calc_open_space(board, {"x": 1, "y": 1}) == 0
+
+
+def test_open_space_limit():
+    board = build_board(_request(5, 5, me=[(0, 0), (0, 1), (0, 2)])["board"])
+
+    assert calc_open_space(board, {"x": 4, "y": 4}) == 23
+    assert calc_open_space(board, {"x": 4, "y": 4}, limit=3) == 3
+    assert calc_open_space(board, {"x": 4, "y": 4}, limit=50) == 23
+
+
+def test_region_sizes_match_open_space():
+    request = _request(
+        5,
+        4,
+        me=[(2, 0), (2, 1), (2, 2), (2, 3), (3, 3)],
+        opponents=[[(4, 1), (3, 1), (3, 2)]],
+        food=[(0, 0)],
+    )
+    board = build_board(request["board"])
+    all_coords = [{"x": x, "y": y} for x in range(-1, 6) for y in range(-1, 5)]
+
+    assert calc_region_sizes(board, all_coords) == [
+        calc_open_space(board, coords) for coords in all_coords
+    ]
+    assert board.regions is not None
+
+
+def test_next_move_and_targets():
+    request = _request(3, 3, me=[(0, 0), (0, 1), (0, 2)], food=[(2, 0)])
+    board = build_board(request["board"])
+
+    assert calc_next_move(request, {"x": 0, "y": 0}, {"x": 2, "y": 0}, board) == "right"
+    assert calc_targets(request, board)[0] == {"x": 2, "y": 0}
@@ -0,0 +1,195 @@
+from hashlib import sha1
+from io import BytesIO
+from os import listdir, makedirs, remove, replace, getpid
+from os.path import getmtime, join
+from threading import get_ident
+from time import time
+
+from numpy import array, cumsum, int16, int32, load, savez, uint8
+
+from features import FeatureTracker
+from nnue import Accumulator
+
+"""
+Battlesnake per-game state, shared between worker processes.
+"""
+
+
+def pack_state(accumulator, feature_tracker):
+    """
+    accumulator: The Accumulator of a game.
+    feature_tracker: The FeatureTracker of the same game.
+    return: Bytes of NumPy buffers holding both
+    """
+    counts = [(f, c) for f, c in feature_tracker.counts.items() if c > 0]
+    snakes = list(feature_tracker.snakes.items())
+
+    bodies = [square for _, (body, _, _, _) in snakes for square in body]
+    buffer = BytesIO()
+    savez(
+        buffer,
+        hidden=accumulator.hidden,
+        features=array([f for f, _ in counts], dtype=int32),
+        counts=array([c for _, c in counts], dtype=int16),
+        food=array(sorted(feature_tracker.food), dtype=int16).reshape(-1, 2),
+        ids=array([snake_id for snake_id, _ in snakes], dtype=str),
+        healths=array([state[1] for _, state in snakes], dtype=int16),
+        lengths=array([state[2] for _, state in snakes], dtype=int16),
+        players=array([state[3] == "you" for _, state in snakes], dtype=uint8),
+        sizes=array([len(state[0]) for _, state in snakes], dtype=int32),
+        bodies=array(bodies, dtype=int16).reshape(-1, 2),
+    )
+    return buffer.getvalue()
+
+
+def unpack_state(snapshot, feature_space):
+    """
+    snapshot: Bytes written by pack_state().
+    feature_space: The FeatureSpace of the game.
+    return: The (Accumulator, FeatureTracker) of the game
+    """
+    arrays = load(BytesIO(snapshot), allow_pickle=False)
+
+    feature_tracker = FeatureTracker(feature_space)
+    feature_tracker.counts = dict(
+        zip(arrays["features"].tolist(), arrays["counts"].tolist())
+    )
+    feature_tracker.food = {tuple(square) for square in arrays["food"].tolist()}
+
+    bodies = [tuple(square) for square in arrays["bodies"].tolist()]
+    ends = cumsum(arrays["sizes"]).tolist()
+    starts = [0] + ends[:-1]
+    for snake_id, health, length, player, start, end in zip(
+        arrays["ids"].tolist(),
+        arrays["healths"].tolist(),
+        arrays["lengths"].tolist(),
+        arrays["players"].tolist(),
+        starts,
+        ends,
+    ):
+        player = "you" if player else "snake"
+        feature_tracker.snakes[snake_id] = (bodies[start:end], health, length, player)
+
+    return Accumulator(arrays["hidden"]), feature_tracker
+
+
+class LocalStore:
+    "Keeps no shared state, so a game's state only lives in the worker that handles it"
+
+    shared = False
+
+    def load(self, game):
+        return None
+
+    def save(self, game, snapshot):
+        pass
+
+    def delete(self, game):
+        pass
+
+    def sweep(self, ttl):
+        pass
+
+
+class SharedMemoryStore:
+    """
+    Keeps every game's state in a file of a shared memory directory, so that any worker of
+    the machine can serve any turn. Files are replaced atomically, so a reader never sees a
+    half-written state.
+    """
+
+    shared = True
+
+    def __init__(self, directory="/dev/shm/battlesnake"):
+        self.directory = directory
+        makedirs(directory, exist_ok=True)
+
+    def load(self, game):
+        """
+        game: The (game id, snake id) of a game.
+        return: The snapshot of the game, or None
+        """
+        try:
+            with open(self._path(game), "rb") as state:
+                return state.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, game, snapshot):
+        path = self._path(game)
+        temporary = f"{path}.{getpid()}.{get_ident()}"
+        with open(temporary, "wb") as state:
+            state.write(snapshot)
+        replace(temporary, path)
+
+    def delete(self, game):
+        try:
+            remove(self._path(game))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, ttl):
+        # Games may have been played on another worker, so stale files are found by age
+        now = time()
+        for name in listdir(self.directory):
+            path = join(self.directory, name)
+            try:
+                if now - getmtime(path) > ttl:
+                    remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _path(self, game):
+        return join(self.directory, sha1(repr(game).encode()).hexdigest())
+
+
+class RedisStore:
+    """
+    Keeps every game's state in Redis, or a Redis-compatible server, so that workers on any
+    machine can serve any turn. States expire on their own after ttl seconds.
+    """
+
+    shared = True
+
+    def __init__(self, url="redis://localhost:6379/0", ttl=300, prefix="battlesnake:"):
+        # Only this backend needs the redis package, from requirements-redis.txt
+        try:
+            from redis import Redis
+        except ImportError as error:
+            raise ImportError(
+                "the redis state store needs `pip install -r requirements-redis.txt`"
+            ) from error
+
+        self.client = Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, game):
+        return self.client.get(self._key(game))
+
+    def save(self, game, snapshot):
+        self.client.set(self._key(game), snapshot, ex=self.ttl)
+
+    def delete(self, game):
+        self.client.delete(self._key(game))
+
+    def sweep(self, ttl):
+        pass
+
+    def _key(self, game):
+        return self.prefix + sha1(repr(game).encode()).hexdigest()
+
+
+def open_store(kind="local", location=None):
+    """
+    kind: "local", "shm" or "redis".
+    location: The directory of "shm", or the URL of "redis".
+    return: The store
+    """
+    if kind == "local":
+        return LocalStore()
+    if kind == "shm":
+        return SharedMemoryStore(location) if location else SharedMemoryStore()
+    if kind == "redis":
+        return RedisStore(location) if location else RedisStore()
+    raise ValueError(f"unknown state store {kind!r}")
@@ -0,0 +1,60 @@
+from pytest import raises
+
+from arena import Baseline, BASELINES, calc_wilson_interval, play_game, run_arena
+from logic import Logic
+from test_logic import _request
+
+
+def test_wilson_interval():
+    lower, upper = calc_wilson_interval(50, 100)
+    assert abs(lower - 0.4038) < 1e-3
+    assert abs(upper - 0.5962) < 1e-3
+
+    lower, upper = calc_wilson_interval(0, 10)
+    assert lower == 0.0 and 0.0 < upper < 0.35
+    assert calc_wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_baselines_avoid_walls_and_bodies():
+    data = _request("a")
+    head = data["you"]["head"]
+    # Tails move out of the way, so only the rest of the bodies are in the way
+    bodies = {
+        (c["x"], c["y"])
+        for snake in data["board"]["snakes"]
+        for c in snake["body"][:-1]
+    }
+    offsets = {"up": (0, 1), "down": (0, -1), "left": (-1, 0), "right": (1, 0)}
+
+    for logics in BASELINES.values():
+        move = Baseline(logics).choose_move(data)
+        x, y = head["x"] + offsets[move][0], head["y"] + offsets[move][1]
+        assert 0 <= x < data["board"]["width"] and 0 <= y < data["board"]["height"]
+        assert (x, y) not in bodies
+
+
+def test_play_game():
+    players = [Logic(None), Baseline(BASELINES["eat"])]
+    results = play_game(players, ["greedy", "eat"], "arena", size=7, max_turns=50)
+
+    assert [name for name, _, _ in results] == ["greedy", "eat"]
+    outcomes = sorted(outcome for _, outcome, _ in results)
+    assert outcomes in (["loss", "win"], ["draw", "draw"], ["draw", "loss"])
+    assert all(times and min(times) > 0 for _, _, times in results)
+
+
+def test_run_arena():
+    report = run_arena(["greedy", "tail", "tail"], 6, processes=2, size=7, max_turns=30)
+
+    assert report["games"] == 6
+    assert set(report["players"]) == {"greedy", "tail#1", "tail#2"}
+    for player in report["players"].values():
+        assert player["wins"] + player["losses"] + player["draws"] == 6
+        lower, upper = player["win_rate_95"]
+        assert lower <= player["win_rate"] <= upper
+        assert player["moves"] > 0
+
+
+def test_run_arena_fails_fast_on_a_missing_model(tmp_path):
+    with raises(FileNotFoundError):
+        run_arena(["greedy", "tail"], 2, processes=2, model_path=str(tmp_path / "none"))
@@ -0,0 +1,70 @@
+from json import dumps
+from random import Random
+
+from benchmark import (
+    benchmark,
+    compare,
+    generate_board,
+    generate_boards,
+    load_boards,
+    random_model,
+)
+from features import FeatureSpace
+from logic import Logic
+
+
+def test_generated_boards_are_legal():
+    rng = Random(0)
+    for size, n_snakes, length in [(7, 2, 3), (11, 4, 10), (19, 4, 30)]:
+        data = generate_board(size, size, n_snakes, length, rng)
+        snakes = data["board"]["snakes"]
+
+        assert len(snakes) == n_snakes
+        squares = [(c["x"], c["y"]) for snake in snakes for c in snake["body"]]
+        assert len(set(squares)) == n_snakes * length
+        assert all(0 <= x < size and 0 <= y < size for x, y in squares)
+        assert data["you"]["id"] == snakes[0]["id"]
+
+    assert generate_board(7, 7, 8, 30, rng) is None
+
+
+def test_benchmark_times_every_function(tmp_path):
+    boards = generate_boards(sizes=(7, 11), snake_counts=(2,), lengths=(3, 10), n=1)
+    path = tmp_path / "boards.jsonl"
+    path.write_text("\n".join(dumps({"request": data}) for data in boards))
+    assert load_boards(path) == boards
+
+    logic = Logic(random_model(len(FeatureSpace()), hidden=8))
+    results = benchmark(boards, logic, repeat=2)
+
+    assert set(results) == {
+        "7x7/2 snakes/length 3",
+        "7x7/2 snakes/length 10",
+        "11x11/2 snakes/length 3",
+        "11x11/2 snakes/length 10",
+    }
+    assert "NNUE.forward" not in results["7x7/2 snakes/length 3"]
+    assert set(results["11x11/2 snakes/length 10"]) == {
+        "calc_possible_moves",
+        "calc_open_space",
+        "calc_targets",
+        "calc_next_move",
+        "GameState.travel_times",
+        "IncreaseBoardControl.board_control",
+        "Logic._get_active_features",
+        "NNUE.forward",
+        "Logic.choose_move",
+    }
+    summary = results["11x11/2 snakes/length 3"]["Logic.choose_move"]
+    assert summary["calls"] == 2
+    assert 0 < summary["min_us"] <= summary["median_us"] <= summary["p95_us"]
+
+    slower = {
+        group: {
+            name: {**summary, "median_us": summary["median_us"] * 2}
+            for name, summary in functions.items()
+        }
+        for group, functions in results.items()
+    }
+    assert compare(results, results) == []
+    assert len(compare(results, slower)) == 32
@@ -0,0 +1,127 @@
+from numpy import array
+
+from features import FeatureSpace, FeatureTracker
+from logic import Logic
+from simulator import Simulator
+
+
+def _request(snakes, food):
+    def _snake(snake_id, body, health):
+        return {
+            "id": snake_id,
+            "health": health,
+            "body": [{"x": x, "y": y} for x, y in body],
+            "head": {"x": body[0][0], "y": body[0][1]},
+            "length": len(body),
+        }
+
+    board_snakes = [_snake(*snake) for snake in snakes]
+    return {
+        "board": {
+            "width": 11,
+            "height": 11,
+            "food": [{"x": x, "y": y} for x, y in food],
+            "snakes": board_snakes,
+        },
+        "you": board_snakes[0],
+    }
+
+
+def test_tracker_matches_full_rebuild():
+    logic = Logic(None)
+    turns = [
+        _request([("me", [(1, 1)] * 3, 100), ("them", [(9, 9)] * 3, 100)], [(1, 3)]),
+        _request(
+            [
+                ("me", [(1, 2), (1, 1), (1, 1)], 99),
+                ("them", [(9, 8), (9, 9), (9, 9)], 99),
+            ],
+            [(1, 3)],
+        ),
+        # I eat, so my tail is stacked again
+        _request(
+            [
+                ("me", [(1, 3), (1, 2), (1, 1), (1, 1)], 100),
+                ("them", [(8, 8), (9, 8), (9, 9)], 98),
+            ],
+            [(5, 5)],
+        ),
+        _request(
+            [
+                ("me", [(2, 3), (1, 3), (1, 2), (1, 1)], 99),
+                ("them", [(8, 7), (8, 8), (9, 8)], 97),
+            ],
+            [(5, 5)],
+        ),
+        # A turn is skipped, so both snakes need a rebuild
+        _request(
+            [
+                ("me", [(4, 3), (3, 3), (2, 3), (1, 3)], 97),
+                ("them", [(8, 5), (8, 6), (8, 7)], 95),
+            ],
+            [(5, 5)],
+        ),
+        # They are eliminated
+        _request([("me", [(5, 3), (4, 3), (3, 3), (2, 3)], 96)], [(5, 5)]),
+    ]
+
+    tracker = FeatureTracker(logic.feature_space)
+    active_features = set(tracker.refresh(turns[0]))
+    assert active_features == set(logic._get_active_features(turns[0]))
+
+    for data in turns[1:]:
+        removed_features, added_features = tracker.update(data)
+        expected = set(logic._get_active_features(data))
+
+        assert set(tracker.active_features) == expected
+        assert set(removed_features) == active_features - expected
+        assert set(added_features) == expected - active_features
+        active_features = expected
+
+
+def test_feature_space_matches_mapping():
+    logic = Logic(None)
+    feature_mapping = logic._get_feature_mapping()
+
+    assert len(logic.feature_space) == len(feature_mapping) == 11 * 11 * 229
+    for (square, kind), index in feature_mapping.items():
+        assert logic.feature_space.index(square, kind) == index
+
+
+def test_snake_features_vectorised():
+    space = FeatureSpace()
+    xs = array([5, 5, 4, 4, 4])
+    ys = array([5, 4, 4, 3, 3])
+
+    features = space.snake_features(xs, ys, 80, 5, "snake")
+
+    expected = []
+    for i, square in enumerate(zip(xs.tolist(), ys.tolist())):
+        expected += [
+            space.index(square, ("health", 80)),
+            space.index(square, "head" if i == 0 else "body"),
+            space.index(square, ("length", 5)),
+            space.index(square, "snake"),
+        ]
+    for square, direction in zip(
+        zip(xs.tolist(), ys.tolist()), ["down", "left", "down", "noop"]
+    ):
+        expected.append(space.index(square, direction))
+
+    assert sorted(features.tolist()) == sorted(expected)
+
+
+def test_extract_simulator_matches_request():
+    data = _request(
+        [
+            ("you", [(2, 3), (2, 2), (1, 2), (1, 2)], 73),
+            ("them", [(8, 8), (8, 9), (9, 9)], 40),
+        ],
+        [(5, 5), (0, 10)],
+    )
+    simulator = Simulator.from_request(data)
+    space = FeatureSpace()
+
+    assert (
+        space.extract_simulator(simulator, 0).tolist() == space.extract(data).tolist()
+    )
@@ -0,0 +1,68 @@
+from asyncio import run
+from json import dumps
+from threading import Thread
+
+import main
+from loadtest import (
+    AppClient,
+    HTTPClient,
+    load_transcripts,
+    replay,
+    run_games,
+    self_play,
+)
+from logic import Logic
+from serve import create_server, stop_server
+from test_logic import _request
+
+
+def test_self_play_in_process():
+    main.logic = Logic(None)
+    games = [
+        lambda client, report, i=i: self_play(
+            client, report, f"load-{i}", size=7, max_turns=20, seed=i
+        )
+        for i in range(4)
+    ]
+    summary = run(run_games(AppClient(main.app, threads=4), games, concurrency=2))
+
+    assert summary["games"] == 4
+    assert summary["errors"] == 0
+    assert summary["moves"] > 4
+    # Every game has a start and an end for each snake
+    assert summary["requests"] == summary["moves"] + 4 * 2 * 2
+    assert summary["turns"]["0"]["moves"] == 8
+    assert summary["latency"]["p50_ms"] <= summary["latency"]["max_ms"]
+
+
+def test_replay_over_http(tmp_path):
+    requests = []
+    for turn in range(3):
+        data = _request("recorded")
+        data["turn"] = turn
+        requests.append({"message": "request", "request": data})
+    path = tmp_path / "requests.jsonl"
+    path.write_text("\n".join(dumps(record) for record in reversed(requests)))
+
+    (transcript,) = load_transcripts(path)
+    assert [data["turn"] for data in transcript] == [0, 1, 2]
+
+    main.logic = Logic(None)
+    server = create_server(main.app, threads=4)
+    Thread(target=server.run, daemon=True).start()
+
+    try:
+        client = HTTPClient(f"http://127.0.0.1:{server.effective_port}")
+        games = [
+            lambda client, report, i=i: replay(client, report, transcript, f"r-{i}")
+            for i in range(3)
+        ]
+        summary = run(run_games(client, games, concurrency=3))
+    finally:
+        stop_server(server)
+
+    assert summary["games"] == 3
+    assert summary["errors"] == 0
+    assert summary["requests"] == 3 * 5
+    assert sorted(summary["turns"]) == ["0", "1", "2"]
+    assert summary["turns"]["2"]["moves"] == 3
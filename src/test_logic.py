@@ -0,0 +1,131 @@
+from time import perf_counter, sleep
+
+from logic import Logic
+from ponder import Activity, Ponderer
+from utils.test import build_test_gamestate
+
+
+def _request(game_id):
+    data = build_test_gamestate(
+        7, 7, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(5, 5), (5, 5), (5, 5)]]
+    ).data
+    data["board"]["snakes"][0]["id"] = "them"
+    data["game"] = {"id": game_id, "ruleset": {"name": "standard"}, "timeout": 500}
+    return data
+
+
+def test_state_freed_on_end():
+    logic = Logic(None, strategy="mcts", search_budget=20)
+    data = _request("a")
+
+    logic.choose_start(data)
+    logic.choose_move(data)
+    assert ("a", data["you"]["id"]) in logic.trees
+
+    logic.choose_end(data)
+    assert not logic.trees and not logic.compute_times and not logic.last_seen
+
+
+def test_stale_games_swept():
+    logic = Logic(None, strategy="mcts", search_budget=20, state_ttl=0)
+    stale = _request("stale")
+    logic.choose_start(stale)
+    logic.choose_move(stale)
+
+    # Another game's request sweeps the game whose /end never arrived
+    fresh = _request("fresh")
+    logic.choose_move(fresh)
+
+    assert list(logic.trees) == [("fresh", fresh["you"]["id"])]
+    assert ("stale", stale["you"]["id"]) not in logic.compute_times
+
+
+def test_pondering_explores_between_moves():
+    logic = Logic(None, strategy="mcts", search_budget=20, ponder=True)
+    data = _request("a")
+    game = ("a", data["you"]["id"])
+
+    logic.choose_start(data)
+    logic.begin_request()
+    logic.choose_move(data)
+    # Pondering waits for the response to be sent
+    assert not logic.ponderers
+
+    logic.end_request()
+    tree = logic.trees[game]
+    ponderer = logic.ponderers[game]
+    visits = tree.root.n
+
+    sleep(0.05)
+    assert tree.root.n > visits
+
+    logic.begin_request()
+    logic.choose_end(data)
+    logic.end_request()
+    ponderer.thread.join(1)
+    assert not ponderer.thread.is_alive()
+    assert not logic.ponderers and not logic.pending_ponders
+
+
+def test_pondering_waits_for_every_request():
+    logic = Logic(None, strategy="mcts", search_budget=20, ponder=True)
+    first = _request("first")
+    second = _request("second")
+
+    logic.begin_request()
+    logic.begin_request()
+    logic.choose_move(first)
+    logic.end_request()
+    assert not logic.ponderers
+
+    logic.choose_move(second)
+    logic.end_request()
+    assert len(logic.ponderers) == 2
+
+    logic.begin_request()
+    logic.choose_end(first)
+    logic.choose_end(second)
+    logic.end_request()
+
+
+def test_ponderer_parks_while_busy():
+    activity = Activity()
+    ponderer = Ponderer(activity)
+    checks = []
+
+    def search(cancel):
+        while not cancel.is_set():
+            checks.append(perf_counter())
+
+    activity.begin()
+    ponderer.start(search)
+    sleep(0.02)
+    # The search parks at its first check, and is woken at once when stopped
+    assert len(checks) == 0 and ponderer.parked
+
+    start = perf_counter()
+    ponderer.stop()
+    assert perf_counter() - start < 0.005
+    ponderer.thread.join(1)
+    assert not ponderer.thread.is_alive() and not checks
+
+    # Once idle, a search runs until it is stopped
+    ponderer = Ponderer(activity)
+    ponderer.start(search)
+    activity.end()
+    sleep(0.01)
+    ponderer.stop()
+    ponderer.thread.join(1)
+    assert checks and not ponderer.thread.is_alive()
+
+
+def test_standard_duel_without_model():
+    logic = Logic(None)
+    data = build_test_gamestate(
+        11, 11, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(9, 9), (9, 9), (9, 9)]]
+    ).data
+    data["game"] = {"id": "a", "ruleset": {"name": "standard"}, "timeout": 500}
+
+    logic.choose_start(data)
+    assert logic.choose_move(data) in ["up", "down", "left", "right"]
+    assert not logic.features
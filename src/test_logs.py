@@ -0,0 +1,84 @@
+from io import StringIO
+from json import loads
+from logging import DEBUG, INFO, LogRecord, WARNING
+
+from logic import Logic
+from logs import GameFilter, GameLogs, JSONLinesHandler, logger
+from test_logic import _request
+
+
+def _record(level, game, message="move"):
+    record = LogRecord("battlesnake", level, __file__, 1, message, None, None)
+    record.game = game
+    return record
+
+
+def test_filter_samples_moves_and_keeps_verbose_games():
+    game_filter = GameFilter(INFO, sample_rate=0.0)
+    game_filter.game_levels["verbose"] = DEBUG
+
+    assert not game_filter.filter(_record(INFO, "quiet"))
+    assert not game_filter.filter(_record(DEBUG, "quiet"))
+    assert game_filter.filter(_record(INFO + 10, "quiet"))
+    assert game_filter.filter(_record(INFO, "verbose"))
+    assert game_filter.filter(_record(DEBUG, "verbose"))
+
+
+def test_filter_keeps_starts_and_ends():
+    game_filter = GameFilter(INFO, sample_rate=0.0)
+
+    assert game_filter.filter(_record(INFO, "quiet", "start"))
+    assert game_filter.filter(_record(INFO, "quiet", "end"))
+
+
+def test_logger_level_is_restored_after_verbose_games():
+    logs = GameLogs(JSONLinesHandler(StringIO(), flush_interval=60), level=WARNING)
+    logs.start()
+    try:
+        assert logger.level == WARNING
+
+        logs.set_game_level("a", DEBUG)
+        logs.set_game_level("b", INFO)
+        assert logger.level == DEBUG
+
+        logs.end_game("a")
+        assert logger.level == INFO
+        logs.end_game("b")
+        assert logger.level == WARNING
+    finally:
+        logs.stop()
+
+
+def test_handler_writes_batches():
+    stream = StringIO()
+    handler = JSONLinesHandler(stream, batch_size=2, flush_interval=60)
+
+    handler.handle(_record(INFO, "a"))
+    assert stream.getvalue() == ""
+
+    handler.handle(_record(INFO, "b"))
+    lines = [loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["game"] for line in lines] == ["a", "b"]
+
+    handler.close()
+
+
+def test_move_records():
+    stream = StringIO()
+    logs = GameLogs(JSONLinesHandler(stream, flush_interval=60))
+    logs.start()
+    try:
+        logic = Logic(None, strategy="search", search_budget=20)
+        data = _request("a")
+        data["turn"] = 3
+        logic.choose_move(data)
+    finally:
+        logs.stop()
+
+    (record,) = [loads(line) for line in stream.getvalue().splitlines()]
+    assert record["game"] == "a"
+    assert record["message"] == "move"
+    assert record["turn"] == 3
+    assert record["move"] in record["possible_moves"]
+    assert set(record["values"]) <= set(record["possible_moves"])
+    assert record["ms"] > 0
@@ -0,0 +1,40 @@
+from json import dumps
+from pickle import dump
+
+from werkzeug.test import Client
+
+import main
+from features import FeatureSpace
+from logic import Logic
+from nnue import NNUE
+from test_logic import _request
+from test_nnue import _random_weights
+
+
+def test_pondering_starts_once_the_response_is_sent():
+    main.logic = Logic(None, strategy="mcts", search_budget=20, ponder=True)
+    client = Client(main.app)
+    data = _request("a")
+
+    response = client.post("/move", data=dumps(data), content_type="application/json")
+    assert response.status_code == 200
+    assert main.logic.activity.requests == 1 and not main.logic.ponderers
+
+    # The server closes the response once it has been written
+    response.close()
+    assert main.logic.activity.requests == 0
+    assert list(main.logic.ponderers) == [("a", data["you"]["id"])]
+
+    client.post("/end", data=dumps(data), content_type="application/json").close()
+    assert not main.logic.ponderers and main.logic.activity.requests == 0
+
+
+def test_pickled_models_are_converted(tmp_path, monkeypatch):
+    model = NNUE(*_random_weights(features=len(FeatureSpace()), hidden=8))
+    with open(tmp_path / "model.pth", "wb") as pickle:
+        dump(model, pickle)
+    monkeypatch.setenv("MODEL", str(tmp_path / "model.nnue"))
+
+    logic = main.create_logic()
+    assert (tmp_path / "model.nnue").exists()
+    assert (logic.model.l2_bias == model.l2_bias).all()
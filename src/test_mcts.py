@@ -0,0 +1,84 @@
+from time import perf_counter
+
+from mcts import MCTS
+from simulator import Simulator, DOWN
+from utils.test import build_test_simulator
+
+
+def test_avoids_losing_head_to_head():
+    simulator = build_test_simulator(
+        5,
+        3,
+        me=[(1, 1), (2, 1), (3, 1), (4, 1)],
+        opponents=[[(0, 2), (1, 2), (2, 2), (3, 2), (4, 2)]],
+    )
+    tree = MCTS(seed=0)
+    move = tree.search(simulator, 1, perf_counter() + 0.1)
+
+    assert move == DOWN
+    assert tree.simulations > 0
+    assert simulator.history == []
+
+
+def test_many_snakes():
+    simulator = build_test_simulator(
+        11,
+        11,
+        me=[(1, 1), (1, 1), (1, 1)],
+        opponents=[
+            [(1, 9), (1, 9), (1, 9)],
+            [(9, 1), (9, 1), (9, 1)],
+            [(9, 9), (9, 9), (9, 9)],
+            [(5, 5), (5, 5), (5, 5)],
+            [(5, 1), (5, 1), (5, 1)],
+            [(1, 5), (1, 5), (1, 5)],
+            [(9, 5), (9, 5), (9, 5)],
+        ],
+    )
+    before = [list(body) for body in simulator.bodies]
+    tree = MCTS(rollout="random", seed=0)
+
+    start = perf_counter()
+    move = tree.search(simulator, 7, start + 0.1)
+
+    assert perf_counter() - start < 0.2
+    assert move in simulator.legal_moves(7)
+    assert [list(body) for body in simulator.bodies] == before
+    assert sum(simulator.occupied) == 24
+
+
+def _next_turn(simulator, joint_move, food=()):
+    # The request of the next turn, as the engine would send it
+    following = Simulator.from_request(simulator.to_request(1))
+    following.make(list(joint_move))
+    for cell in food:
+        following.food[cell] = 1
+    return Simulator.from_request(following.to_request(1))
+
+
+def test_reroots_at_observed_moves():
+    simulator = build_test_simulator(
+        7, 7, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(5, 5), (5, 5), (5, 5)]]
+    )
+    tree = MCTS(seed=0)
+    tree.search(simulator, 1, perf_counter() + 0.05)
+
+    joint_move, child = max(tree.root.children.items(), key=lambda item: item[1].n)
+    tree.search(_next_turn(simulator, joint_move), 1, perf_counter() + 0.05)
+
+    assert tree.root is child
+    assert tree.reused > 0
+
+
+def test_starts_afresh_when_food_spawns():
+    simulator = build_test_simulator(
+        7, 7, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(5, 5), (5, 5), (5, 5)]]
+    )
+    tree = MCTS(seed=0)
+    tree.search(simulator, 1, perf_counter() + 0.05)
+
+    joint_move, child = max(tree.root.children.items(), key=lambda item: item[1].n)
+    tree.search(_next_turn(simulator, joint_move, food=[24]), 1, perf_counter() + 0.05)
+
+    assert tree.root is not child
+    assert tree.reused == 0
@@ -0,0 +1,100 @@
+from threading import Thread
+
+from werkzeug.test import Client
+
+import main
+from logic import Logic
+from metrics import Histogram, Metrics
+from serve import Router, create_server, stop_server
+from test_logic import _request
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for _ in range(90):
+        histogram.observe(0.0007)
+    for _ in range(10):
+        histogram.observe(0.3)
+
+    counts, total, count = histogram.snapshot()
+    assert count == 100
+    assert sum(counts) == 100
+    assert abs(total - (90 * 0.0007 + 10 * 0.3)) < 1e-9
+
+    assert 0.0005 < histogram.quantile(0.5) <= 0.001
+    assert 0.25 < histogram.quantile(0.95) <= 0.5
+    assert Histogram().quantile(0.5) is None
+
+
+def test_render():
+    metrics = Metrics({"worker": "1"})
+    metrics.observe("search", 0.02)
+    metrics.observe("search", 2.0)
+
+    lines = metrics.render().splitlines()
+    assert (
+        'battlesnake_phase_seconds_bucket{worker="1",phase="search",le="0.025"} 1'
+        in lines
+    )
+    assert (
+        'battlesnake_phase_seconds_bucket{worker="1",phase="search",le="+Inf"} 2'
+        in lines
+    )
+    assert 'battlesnake_phase_seconds_count{worker="1",phase="search"} 2' in lines
+    assert any(
+        line.startswith(
+            'battlesnake_phase_quantile_seconds{worker="1",phase="search",quantile="0.99"}'
+        )
+        for line in lines
+    )
+
+
+def test_metrics_endpoint():
+    main.logic = Logic(None)
+    client = Client(main.app)
+
+    response = client.post("/move", json=_request("a"))
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    text = response.get_data(as_text=True)
+    for phase in ["parse", "possible_moves", "move"]:
+        assert f'battlesnake_phase_seconds_count{{phase="{phase}"}}' in text
+
+
+def _worker(index):
+    metrics = Metrics({"worker": str(index)})
+    metrics.observe("move", 0.01)
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [metrics.render().encode()]
+
+    server = create_server(app, threads=2)
+    Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def test_router_gathers_metrics():
+    servers = [_worker(0), _worker(1)]
+    client = Client(Router([server.effective_port for server in servers]))
+
+    try:
+        lines = client.get("/metrics").get_data(as_text=True).splitlines()
+    finally:
+        for server in servers:
+            stop_server(server)
+
+    assert lines.count("# TYPE battlesnake_phase_seconds histogram") == 1
+    for index in ["0", "1"]:
+        assert (
+            f'battlesnake_phase_seconds_count{{worker="{index}",phase="move"}} 1'
+            in lines
+        )
+
+    # Every metric's samples follow its comments, before the next metric's
+    quantiles = [i for i, line in enumerate(lines) if "quantile_seconds{" in line]
+    histograms = [i for i, line in enumerate(lines) if "phase_seconds_" in line]
+    assert histograms and max(histograms) < min(quantiles)
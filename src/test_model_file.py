@@ -0,0 +1,80 @@
+from pickle import dumps
+
+from numpy import allclose, memmap
+from pytest import raises
+
+from features import FeatureSpace
+from model_file import PREAMBLE, load_model, save_model
+from nnue import NNUE, quantize
+from test_nnue import _random_weights
+
+
+def _model(feature_space):
+    return NNUE(*_random_weights(features=len(feature_space), hidden=8))
+
+
+def _is_mapped(array):
+    while array is not None:
+        if isinstance(array, memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_round_trip(tmp_path):
+    feature_space = FeatureSpace(3, 3)
+    model = _model(feature_space)
+    quantized = quantize(model)
+    active_features = [0, 17, 40, 100]
+
+    for original in (model, quantized):
+        path = str(tmp_path / "model.nnue")
+        save_model(original, path, feature_space)
+        loaded = load_model(path, feature_space)
+
+        assert type(loaded) is type(original)
+        assert allclose(
+            loaded.forward(loaded.new_accumulator(active_features)),
+            original.forward(original.new_accumulator(active_features)),
+        )
+        assert _is_mapped(loaded.feature_weights)
+        assert not loaded.feature_weights.flags.writeable
+
+
+def test_arrays_are_aligned(tmp_path):
+    path = str(tmp_path / "model.nnue")
+    save_model(_model(FeatureSpace(3, 3)), path, FeatureSpace(3, 3))
+    model = load_model(path, FeatureSpace(3, 3))
+
+    for array in (model.feature_weights, model.l1_weight, model.l2_bias):
+        assert array.__array_interface__["data"][0] % 64 == 0
+
+
+def test_feature_space_mismatch(tmp_path):
+    path = str(tmp_path / "model.nnue")
+    save_model(_model(FeatureSpace(3, 3)), path, FeatureSpace(3, 3))
+
+    with raises(ValueError, match="feature space"):
+        load_model(path, FeatureSpace(5, 5))
+    with raises(ValueError, match="features"):
+        save_model(_model(FeatureSpace(3, 3)), path, FeatureSpace(5, 5))
+
+
+def test_bad_files(tmp_path):
+    path = tmp_path / "model.nnue"
+
+    path.write_bytes(dumps(_model(FeatureSpace(3, 3))))
+    with raises(ValueError, match="not a model file"):
+        load_model(str(path), FeatureSpace(3, 3))
+
+    save_model(_model(FeatureSpace(3, 3)), str(path), FeatureSpace(3, 3))
+    contents = path.read_bytes()
+
+    magic, _, header_size = PREAMBLE.unpack(contents[: PREAMBLE.size])
+    path.write_bytes(PREAMBLE.pack(magic, 2, header_size) + contents[PREAMBLE.size :])
+    with raises(ValueError, match="version 2"):
+        load_model(str(path), FeatureSpace(3, 3))
+
+    path.write_bytes(contents[:-8])
+    with raises(ValueError, match="truncated"):
+        load_model(str(path), FeatureSpace(3, 3))
@@ -0,0 +1,181 @@
+from pickle import dumps, loads
+
+from numpy import allclose, int8, int16, int32, zeros
+from numpy.random import default_rng
+
+from nnue import NNUE, quantize
+
+
+def _random_weights(features=50, hidden=8, outputs=4, seed=0):
+    rng = default_rng(seed)
+    return (
+        rng.normal(size=(hidden, features)),
+        rng.normal(size=hidden),
+        rng.normal(size=(hidden, hidden)),
+        rng.normal(size=hidden),
+        rng.normal(size=(outputs, hidden)),
+        rng.normal(size=outputs),
+    )
+
+
+def _dense(active_features, features=50):
+    x = zeros(features)
+    x[list(active_features)] = 1
+    return x
+
+
+def test_refresh_matches_dense_forward():
+    model = NNUE(*_random_weights())
+    accumulator = model.new_accumulator([1, 7, 42])
+
+    assert model.feature_weights.shape == (50, 8)
+    assert allclose(accumulator.hidden, model._ft(_dense([1, 7, 42])))
+
+
+def test_update_matches_refresh():
+    model = NNUE(*_random_weights())
+    accumulator = model.new_accumulator([1, 7, 42])
+    model.update_accumulator(accumulator, [7, 42], [3, 8, 49])
+
+    expected = model.new_accumulator([1, 3, 8, 49])
+
+    assert allclose(accumulator.hidden, expected.hidden)
+    assert allclose(model.forward(accumulator), model.forward(expected))
+
+
+def test_accumulators_share_weights():
+    model = NNUE(*_random_weights())
+    first = model.new_accumulator([1])
+    second = model.new_accumulator([2])
+    model.update_accumulator(first, [1], [2])
+
+    assert allclose(first.hidden, second.hidden)
+    assert not model.feature_weights.flags["WRITEABLE"]
+    assert not hasattr(first, "__dict__")
+
+
+def test_weights_are_copied_before_freezing():
+    weights = _random_weights()
+    model = NNUE(*weights)
+    for array in weights:
+        array += 1
+
+    assert not model.l1_weight.flags["WRITEABLE"]
+    assert allclose(model.l1_weight, weights[2] - 1)
+
+    # Read-only arrays, e.g. mapped from a model file, are shared instead
+    for array in weights:
+        array.setflags(write=False)
+    assert NNUE(*weights).l1_weight is weights[2]
+
+
+def test_unpickle_legacy_layout():
+    ft_weight, ft_bias, l1_weight, l1_bias, l2_weight, l2_bias = _random_weights()
+    legacy = NNUE.__new__(NNUE)
+    legacy.__dict__.update(
+        ft_weight=ft_weight,
+        ft_bias=ft_bias,
+        l1_weight=l1_weight,
+        l1_bias=l1_bias,
+        l2_weight=l2_weight,
+        l2_bias=l2_bias,
+        accumulator=ft_bias.copy(),
+    )
+
+    model = loads(dumps(legacy))
+    accumulator = model.new_accumulator([5])
+
+    assert model.feature_weights.flags["C_CONTIGUOUS"]
+    assert allclose(accumulator.hidden, ft_bias + ft_weight[:, 5])
+    assert loads(dumps(model)).feature_weights.shape == (50, 8)
+
+
+def test_quantized_matches_float():
+    rng = default_rng(1)
+    model = NNUE(*(w * 0.1 for w in _random_weights(features=500, hidden=64)))
+    positions = [rng.choice(500, size=40, replace=False) for _ in range(64)]
+    quantized = quantize(model, positions)
+
+    assert quantized.feature_weights.dtype == int16
+    assert quantized.l1_weight.dtype == int8
+    assert quantized.l2_weight.dtype == int8
+
+    for active_features in positions:
+        expected = model.forward(model.new_accumulator(active_features))
+        actual = quantized.forward(quantized.new_accumulator(active_features))
+        assert allclose(actual, expected, atol=0.05)
+
+
+def test_quantized_update_matches_refresh():
+    model = NNUE(*(w * 0.1 for w in _random_weights()))
+    quantized = loads(dumps(quantize(model)))
+    accumulator = quantized.new_accumulator([1, 7, 42])
+    quantized.update_accumulator(accumulator, [7, 42], [3, 8, 49])
+    expected = quantized.new_accumulator([1, 3, 8, 49])
+
+    assert (accumulator.hidden == expected.hidden).all()
+    assert accumulator.hidden.dtype == int32
+
+
+def test_forward_deltas_match_forward():
+    for model in (NNUE(*_random_weights()), quantize(NNUE(*_random_weights()))):
+        parent = model.new_accumulator([1, 7, 42])
+        deltas = [([], [3]), ([], []), ([7], [8, 9]), ([1, 7, 42], []), ([], [])]
+        children = [
+            model.new_accumulator([1, 3, 7, 42]),
+            model.new_accumulator([1, 7, 42]),
+            model.new_accumulator([1, 8, 9, 42]),
+            model.new_accumulator([]),
+            model.new_accumulator([1, 7, 42]),
+        ]
+
+        outputs = model.forward_deltas(parent, deltas)
+
+        assert outputs.shape == (5, 4)
+        assert allclose(outputs, model.forward_batch(children))
+        assert allclose(outputs[2], model.forward(children[2]))
+        assert allclose(parent.hidden, model.new_accumulator([1, 7, 42]).hidden)
+
+
+def test_quantized_accumulator_saturates():
+    model = NNUE(*(w * 0.1 for w in _random_weights(features=500, hidden=64)))
+    quantized = quantize(model, [list(range(10))], max_features=10)
+    accumulator = quantized.new_accumulator(range(500))
+    saturated = quantized.new_accumulator([])
+    quantized.update_accumulator(saturated, [], range(500))
+
+    exact = quantized.ft_bias + quantized.feature_weights.sum(axis=0, dtype="int64")
+    assert (abs(exact) > 2**15 - 1).any()
+    assert (accumulator.hidden == exact).all()
+    assert (saturated.hidden == accumulator.hidden).all()
+
+    clipped = quantized.new_accumulator([])
+    clipped.hidden = exact.clip(-(2**15), 2**15 - 1).astype(int32)
+    assert (quantized.forward(accumulator) == quantized.forward(clipped)).all()
+
+
+def test_quantized_update_reverts_after_saturating():
+    model = NNUE(*(w * 0.1 for w in _random_weights(features=500, hidden=64)))
+    quantized = quantize(model, [list(range(10))], max_features=10)
+    accumulator = quantized.new_accumulator([1, 7, 42])
+
+    # Adding every feature saturates the int16 range, removing them must undo it exactly
+    others = [f for f in range(500) if f not in (1, 7, 42)]
+    quantized.update_accumulator(accumulator, [], others)
+    quantized.update_accumulator(accumulator, others, [])
+    expected = quantized.new_accumulator([1, 7, 42])
+
+    assert (accumulator.hidden == expected.hidden).all()
+    assert (quantized.forward(accumulator) == quantized.forward(expected)).all()
+
+
+def test_quantize_calibrates_for_the_most_features():
+    model = NNUE(*(w * 0.1 for w in _random_weights(features=500, hidden=64)))
+    few = [default_rng(2).choice(500, size=20, replace=False)]
+    quantized = quantize(model, few, max_features=400)
+
+    for active_features in default_rng(3).choice(500, size=(16, 400)):
+        exact = quantized.ft_bias + quantized.feature_weights[
+            list(set(active_features))
+        ].sum(axis=0, dtype="int64")
+        assert (abs(exact) <= 2**15 - 1).all()
@@ -0,0 +1,77 @@
+from time import perf_counter
+
+from search import MARGIN, Search, SpaceEvaluator
+from simulator import DOWN, LEFT, RIGHT, UP
+from utils.test import build_test_simulator
+
+
+def test_takes_winning_head_to_head():
+    # The opponent can only move down, into the square left of my head
+    simulator = build_test_simulator(
+        5,
+        3,
+        me=[(1, 1), (2, 1), (3, 1), (4, 1), (4, 0)],
+        opponents=[[(0, 2), (1, 2), (2, 2), (3, 2)]],
+    )
+    move = Search(SpaceEvaluator()).search(simulator, 1, perf_counter() + 0.2)
+
+    assert move == LEFT
+    assert simulator.history == []
+
+
+def test_avoids_losing_head_to_head():
+    simulator = build_test_simulator(
+        5,
+        3,
+        me=[(1, 1), (2, 1), (3, 1), (4, 1)],
+        opponents=[[(0, 2), (1, 2), (2, 2), (3, 2), (4, 2)]],
+    )
+    move = Search(SpaceEvaluator()).search(simulator, 1, perf_counter() + 0.2)
+
+    assert move == DOWN
+
+
+def test_respects_deadline():
+    simulator = build_test_simulator(
+        11, 11, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(9, 9), (9, 9), (9, 9)]]
+    )
+    search = Search(SpaceEvaluator())
+
+    start = perf_counter()
+    move = search.search(simulator, 1, start + 0.05)
+
+    assert perf_counter() - start < 0.1
+    assert move is not None
+    assert simulator.history == []
+
+
+class ConstantEvaluator:
+    "Scores every position the same, like a model whose outputs are off the WDL scale"
+
+    def __init__(self, value):
+        self.value = value
+
+    def prepare(self, simulator, me):
+        return None
+
+    def evaluate_batch(self, prepared):
+        return [self.value] * len(prepared)
+
+
+def test_evaluations_rank_between_losses_and_wins():
+    # Moving up or right lets the longer opponent take my head
+    simulator = build_test_simulator(
+        11,
+        11,
+        me=[(5, 5), (5, 4), (5, 3)],
+        opponents=[[(6, 6), (7, 6), (8, 6), (9, 6)]],
+    )
+
+    for value, clipped in ((-5.0, MARGIN), (7.0, 1 - MARGIN)):
+        search = Search(ConstantEvaluator(value), max_depth=2)
+        move = search.search(simulator, 1, perf_counter() + 1)
+
+        assert move == LEFT
+        assert search.values[LEFT] == clipped
+        assert set(search.values) | set(search.upper_bounds) == {UP, RIGHT, LEFT}
+        assert all(bound <= clipped for bound in search.upper_bounds.values())
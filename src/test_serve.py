@@ -0,0 +1,78 @@
+from http.client import HTTPConnection
+from json import dumps
+from threading import Thread
+
+from werkzeug.test import Client
+
+from serve import Router, create_server, stop_server
+
+
+def _worker(name):
+    def app(environ, start_response):
+        body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [name.encode() + b" " + body]
+
+    server = create_server(app, threads=2)
+    Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def test_router_keeps_games_on_one_worker():
+    servers = [_worker("first"), _worker("second")]
+    router = Router([server.effective_port for server in servers])
+    client = Client(router)
+
+    try:
+        for game_id in ["a", "b", "c", "d"]:
+            body = dumps({"game": {"id": game_id}})
+            worker = ["first", "second"][router.worker(body.encode())]
+
+            for _ in range(3):
+                response = client.post(
+                    "/move", data=body, content_type="application/json"
+                )
+                assert response.status_code == 200
+                assert response.get_data(as_text=True) == f"{worker} {body}"
+
+        assert client.get("/").get_data(as_text=True) == "first "
+    finally:
+        for server in servers:
+            stop_server(server)
+
+
+def test_router_finds_the_game_without_parsing():
+    router = Router([1, 2, 3])
+    for game_id in ["a", "b", "c", "d", "e"]:
+        compact = dumps({"game": {"id": game_id}, "turn": 0}).encode()
+        reordered = dumps({"turn": 0, "game": {"timeout": 500, "id": game_id}}).encode()
+        assert router.worker(compact) == router.worker(reordered)
+
+    assert router.worker(b"not json") == 0
+
+
+def test_idle_connections_do_not_hold_threads():
+    server = _worker("first")
+    idle = []
+
+    try:
+        # More kept-alive connections than threads wait for their next request
+        for _ in range(4):
+            connection = HTTPConnection("127.0.0.1", server.effective_port, timeout=1)
+            connection.request("POST", "/move", b"idle")
+            response = connection.getresponse()
+            assert response.read() == b"first idle"
+            assert response.getheader("Connection") != "close"
+            idle.append(connection)
+
+        connection = HTTPConnection("127.0.0.1", server.effective_port, timeout=1)
+        connection.request("POST", "/move", b"new")
+        assert connection.getresponse().read() == b"first new"
+
+        # The idle connections are still usable
+        idle[0].request("POST", "/move", b"again")
+        assert idle[0].getresponse().read() == b"first again"
+    finally:
+        for connection in idle:
+            connection.close()
+        stop_server(server)
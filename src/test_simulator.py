@@ -0,0 +1,200 @@
+from random import Random
+
+from simulator import Simulator, UP, DOWN, LEFT, RIGHT
+from utils.test import build_test_simulator
+
+
+def _state(simulator):
+    return (
+        [list(body) for body in simulator.bodies],
+        list(simulator.health),
+        list(simulator.alive),
+        bytes(simulator.food),
+        bytes(simulator.occupied),
+        simulator.turn,
+    )
+
+
+def _xy(simulator, index):
+    return [
+        (c % simulator.width, c // simulator.width) for c in simulator.bodies[index]
+    ]
+
+
+def test_move():
+    simulator = build_test_simulator(5, 5, me=[(2, 2), (2, 1), (2, 0)])
+    simulator.make([UP])
+
+    assert _xy(simulator, 0) == [(2, 3), (2, 2), (2, 1)]
+    assert simulator.health == [99]
+    assert simulator.alive == [True]
+
+
+def test_feed():
+    simulator = build_test_simulator(5, 5, me=[(2, 2), (2, 1), (2, 0)], food=[(1, 2)])
+    simulator.health[0] = 10
+    simulator.make([LEFT])
+
+    assert _xy(simulator, 0) == [(1, 2), (2, 2), (2, 1), (2, 1)]
+    assert simulator.health == [100]
+    assert not any(simulator.food)
+
+
+def test_starve():
+    simulator = build_test_simulator(5, 5, me=[(2, 2), (2, 1), (2, 0)])
+    simulator.health[0] = 1
+    simulator.make([UP])
+
+    assert simulator.alive == [False]
+
+
+def test_wall_and_self_collision():
+    # Opponents come first, so the snake of "me" is the last one
+    simulator = build_test_simulator(
+        5,
+        5,
+        me=[(0, 0), (1, 0), (2, 0)],
+        opponents=[[(2, 2), (2, 3), (3, 3), (3, 2), (3, 1)]],
+    )
+    simulator.make([DOWN, LEFT])
+
+    assert simulator.alive == [True, False]
+    simulator.unmake()
+    simulator.make([RIGHT, UP])
+
+    assert simulator.alive == [False, True]
+
+
+def test_body_collision_and_tails():
+    simulator = build_test_simulator(
+        5, 5, me=[(1, 1), (1, 0), (0, 0)], opponents=[[(2, 1), (2, 2), (2, 3)]]
+    )
+    assert DOWN in simulator.legal_moves(0)
+    # The opponent's head becomes its neck, so moving onto it is not safe
+    assert RIGHT not in simulator.legal_moves(1)
+    simulator.make([DOWN, RIGHT])
+
+    assert simulator.alive == [True, False]
+
+
+def test_tail_is_legal():
+    simulator = build_test_simulator(5, 5, me=[(1, 1), (1, 0), (0, 0), (0, 1)])
+    assert LEFT in simulator.legal_moves(0)
+
+    simulator.bodies[0].append(simulator.bodies[0][-1])
+    simulator.occupied[simulator.cell(0, 1)] += 1
+
+    # Unless it has just eaten
+    assert LEFT not in simulator.legal_moves(0)
+
+
+def test_head_to_head():
+    simulator = build_test_simulator(
+        5,
+        5,
+        me=[(1, 2), (0, 2), (0, 1)],
+        opponents=[[(3, 2), (4, 2), (4, 1), (4, 0)], [(2, 4), (1, 4), (0, 4)]],
+    )
+    simulator.make([LEFT, DOWN, RIGHT])
+
+    # The longer snake survives
+    assert simulator.alive == [True, True, False]
+    simulator.unmake()
+
+    simulator.bodies[0].pop()
+    simulator.occupied[simulator.cell(4, 0)] -= 1
+    simulator.make([LEFT, DOWN, RIGHT])
+
+    # Snakes of equal length eliminate each other
+    assert simulator.alive == [False, True, False]
+
+
+def test_unmake_restores_state():
+    rng = Random(0)
+    simulator = build_test_simulator(
+        7,
+        7,
+        me=[(1, 1), (1, 1), (1, 1)],
+        opponents=[[(5, 5), (5, 5), (5, 5)]],
+        food=[(3, 3), (1, 3), (5, 3)],
+    )
+
+    states = []
+    while not simulator.is_over() and simulator.turn < 60:
+        states.append(_state(simulator))
+        moves = [rng.choice(simulator.legal_moves(i)) for i in range(2)]
+        simulator.make(moves)
+
+    while states:
+        simulator.unmake()
+        assert _state(simulator) == states.pop()
+
+
+def test_to_request_round_trip():
+    simulator = build_test_simulator(5, 5, me=[(2, 2), (2, 1), (2, 0)], food=[(0, 4)])
+    data = simulator.to_request(0)
+
+    assert data["you"]["head"] == {"x": 2, "y": 2}
+    assert _state(Simulator.from_request(data)) == _state(simulator)
+
+
+def test_start():
+    simulator = Simulator.start(11, 11, 4, Random(0))
+
+    heads = {_xy(simulator, i)[0] for i in range(4)}
+    assert len(heads) == 4
+    assert heads <= {(1, 1), (9, 9), (1, 9), (9, 1), (5, 1), (5, 9), (1, 5), (9, 5)}
+    assert all(len(set(_xy(simulator, i))) == 1 for i in range(4))
+    assert all(simulator.length(i) == 3 for i in range(4))
+    assert sum(simulator.food) == 5
+    assert not any(simulator.food[c] and simulator.occupied[c] for c in range(121))
+
+
+def test_hash_matches_next_turn():
+    simulator = build_test_simulator(
+        7, 7, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(5, 5), (5, 5), (5, 5)]]
+    )
+    before = simulator.hash(1)
+
+    # A position searched as a child is found again when it arrives as the next request
+    simulator.make([DOWN, UP])
+    after = simulator.hash(1)
+    next_turn = Simulator.from_request(simulator.to_request(1))
+
+    assert after != before
+    assert next_turn.hash(1) == after
+
+    simulator.unmake()
+    assert simulator.hash(1) == before
+
+    simulator.make([DOWN, RIGHT])
+    assert simulator.hash(1) != after
+
+
+def test_hash_depends_on_perspective():
+    simulator = build_test_simulator(
+        7, 7, me=[(1, 1), (1, 1), (1, 1)], opponents=[[(5, 5), (5, 5), (5, 5)]]
+    )
+
+    assert simulator.hash(0) != simulator.hash(1)
+
+
+def test_hash_is_kept_by_make_and_unmake():
+    rng = Random(0)
+    for game in range(20):
+        simulator = Simulator.start(7, 7, 4, rng)
+        keys = []
+        while not simulator.is_over() and simulator.turn < 100:
+            keys.append(simulator.hash(0))
+            moves = [rng.choice(simulator.legal_moves(i)) for i in range(4)]
+            simulator.make(moves)
+            simulator.spawn_food(rng, chance=0.5)
+
+            for me in simulator.alive_snakes:
+                me_id = simulator.ids[me]
+                following = Simulator.from_request(simulator.to_request(me))
+                assert following.hash(following.ids.index(me_id)) == simulator.hash(me)
+
+        # Food spawned between turns is not undone, so only the last turn is checked
+        simulator.unmake()
+        assert simulator.hash(0) == keys[-1]
@@ -0,0 +1,97 @@
+from numpy import allclose
+
+from features import FeatureSpace, FeatureTracker
+from logic import Logic
+from nnue import NNUE
+from state import SharedMemoryStore, pack_state, unpack_state
+from test_features import _request
+from test_nnue import _random_weights
+
+
+def _turns():
+    turns = [
+        _request([("me", [(1, 1)] * 3, 100), ("them", [(9, 9)] * 3, 100)], [(1, 3)]),
+        _request(
+            [
+                ("me", [(1, 2), (1, 1), (1, 1)], 99),
+                ("them", [(9, 8), (9, 9), (9, 9)], 99),
+            ],
+            [(1, 3)],
+        ),
+        _request(
+            [
+                ("me", [(1, 3), (1, 2), (1, 1), (1, 1)], 100),
+                ("them", [(8, 8), (9, 8), (9, 9)], 98),
+            ],
+            [(5, 5)],
+        ),
+    ]
+    for turn, data in enumerate(turns):
+        data["game"] = {"id": "game", "ruleset": {"name": "standard"}}
+        data["turn"] = turn
+    return turns
+
+
+def _model():
+    return NNUE(*_random_weights(features=FeatureSpace().n_features))
+
+
+def test_pack_round_trip():
+    model = _model()
+    first, second, third = _turns()
+
+    tracker = FeatureTracker(FeatureSpace())
+    accumulator = model.new_accumulator(tracker.refresh(first))
+    model.update_accumulator(accumulator, *tracker.update(second))
+
+    restored_accumulator, restored_tracker = unpack_state(
+        pack_state(accumulator, tracker), FeatureSpace()
+    )
+    assert allclose(restored_accumulator.hidden, accumulator.hidden)
+    assert restored_tracker.snakes == tracker.snakes
+    assert restored_tracker.food == tracker.food
+
+    # The restored tracker carries on exactly as the original
+    changes = tracker.update(third)
+    assert restored_tracker.update(third) == changes
+    assert set(restored_tracker.active_features) == set(tracker.active_features)
+
+
+def test_shared_store(tmp_path):
+    store = SharedMemoryStore(str(tmp_path))
+    game = ("game", "me")
+
+    assert store.load(game) is None
+    store.save(game, b"state")
+    assert store.load(game) == b"state"
+
+    store.sweep(ttl=-1)
+    assert store.load(game) is None
+
+
+def test_any_worker_serves_any_turn(tmp_path):
+    model = _model()
+    first, second, third = _turns()
+
+    # Two workers sharing a store, and one worker keeping its own state
+    workers = [Logic(model, store=SharedMemoryStore(str(tmp_path))) for _ in range(2)]
+    alone = Logic(model)
+
+    workers[0].choose_start(first)
+    alone.choose_start(first)
+    for logic, data in [(workers[1], second), (workers[0], third)]:
+        logic.choose_move(data)
+        alone.choose_move(data)
+
+    game = ("game", "me")
+    assert allclose(workers[0].models[game].hidden, alone.models[game].hidden)
+
+    workers[0].choose_end(third)
+    assert workers[1].store.load(game) is None
+
+
+def test_rebuilds_state_without_start():
+    logic = Logic(_model())
+    logic.choose_move(_turns()[1])
+
+    assert ("game", "me") in logic.models
@@ -0,0 +1,167 @@
+from numpy import arange, array, concatenate, int8, intp, zeros
+from numpy.random import default_rng
+from pytest import raises
+
+from features import FeatureSpace
+from training import Dataset, RecordWriter, Trainer, evaluate, self_play, train
+
+
+def _records(n, n_features=50, seed=0):
+    rng = default_rng(seed)
+    features = [
+        rng.choice(n_features, size=rng.integers(1, 8), replace=False) for _ in range(n)
+    ]
+    targets = rng.integers(0, 4, size=n)
+    results = rng.integers(-1, 2, size=n)
+    return features, targets, results
+
+
+def test_dataset_round_trip(tmp_path):
+    feature_space = FeatureSpace()
+    features, targets, results = _records(100, len(feature_space))
+
+    writer = RecordWriter(str(tmp_path / "shard-0"), feature_space)
+    writer.write(features[:60], targets[:60], results[:60])
+    writer.write(features[60:], targets[60:], results[60:])
+    writer.close()
+    # Shards without meta.json are still being written, and are left out
+    RecordWriter(str(tmp_path / "shard-1"), feature_space)
+
+    dataset = Dataset(str(tmp_path))
+    assert len(dataset) == 100
+    assert dataset.n_features == len(feature_space)
+
+    seen = {}
+    for batch_features, offsets, batch_targets, batch_results in dataset.batches(
+        16, default_rng(0), block_size=32
+    ):
+        for i, (target, result) in enumerate(zip(batch_targets, batch_results)):
+            record = tuple(sorted(batch_features[offsets[i] : offsets[i + 1]]))
+            seen[record] = (target, result)
+
+    assert seen == {
+        tuple(sorted(f)): (t, r) for f, t, r in zip(features, targets, results)
+    }
+
+
+def _loss(trainer, features, offsets, targets, results):
+    # A step without learning only computes the loss
+    learning_rate, steps = trainer.learning_rate, trainer.steps
+    moments = {k: (m.copy(), v.copy()) for k, (m, v) in trainer.moments.items()}
+    trainer.learning_rate = 0.0
+    loss, _ = trainer.step(features, offsets, targets, results)
+    trainer.learning_rate = learning_rate
+    trainer.steps = steps
+    trainer.moments = moments
+    return loss
+
+
+def test_gradients_match_finite_differences():
+    trainer = Trainer(50, hidden=8, seed=1)
+    trainer.params = {k: v.astype("float64") for k, v in trainer.params.items()}
+    trainer.moments = {
+        k: (zeros(v.shape), zeros(v.shape)) for k, v in trainer.params.items()
+    }
+    features, targets, results = _records(12)
+    offsets = concatenate([[0], array([len(f) for f in features]).cumsum()])
+    batch = (
+        concatenate(features).astype(intp),
+        offsets.astype(intp),
+        targets.astype(intp),
+        results.astype(int8),
+    )
+
+    # With a tiny learning rate, Adam's first step moves every weight against its gradient
+    trainer.learning_rate = 1e-6
+    before = {k: v.copy() for k, v in trainer.params.items()}
+    loss = _loss(trainer, *batch)
+    trainer.step(*batch)
+    after = trainer.params
+    trainer.params = before
+
+    rng = default_rng(2)
+    checked = 0
+    for name, param in before.items():
+        for _ in range(3):
+            index = tuple(rng.integers(0, s) for s in param.shape)
+            if name == "feature_weights":
+                index = (int(rng.choice(concatenate(features))), index[1])
+
+            param[index] += 1e-5
+            gradient = (_loss(trainer, *batch) - loss) / 1e-5
+            param[index] -= 1e-5
+
+            moved = after[name][index] - param[index]
+            if abs(gradient) > 1e-4:
+                assert moved * gradient < 0, name
+                checked += 1
+
+    assert checked >= 6
+
+
+def test_training_learns_a_rule(tmp_path):
+    # The game is won when one feature is active, and lost when another one is
+    feature_space = FeatureSpace(3, 3)
+    rng = default_rng(0)
+    writer = RecordWriter(str(tmp_path / "shard-0"), feature_space)
+    features = []
+    targets = []
+    results = []
+    for _ in range(512):
+        won = int(rng.integers(0, 2))
+        noise = rng.choice(arange(10, 200), size=5, replace=False)
+        features.append(concatenate([[won], noise]))
+        targets.append(int(rng.integers(0, 4)))
+        results.append(1 if won else -1)
+    writer.write(features, targets, results)
+    writer.close()
+
+    dataset = Dataset(str(tmp_path))
+    model = train(
+        dataset,
+        hidden=16,
+        epochs=20,
+        batch_size=64,
+        learning_rate=1e-2,
+        log=lambda line: None,
+    )
+    loss, accuracy = evaluate(model, dataset)
+    assert accuracy > 0.95
+    assert model.feature_weights.shape == (len(feature_space), 16)
+
+    # Outputs are values in WDL space, as the search reads them
+    for active_features, target, result in zip(features[:16], targets, results):
+        value = model.forward(model.new_accumulator(active_features))[target]
+        assert abs(value - (result + 1) / 2) < 0.25
+
+
+def test_self_play_writes_shards(tmp_path):
+    records = self_play(
+        str(tmp_path),
+        ("tail", "eat"),
+        n_games=3,
+        processes=2,
+        games_per_shard=2,
+        max_turns=20,
+    )
+    dataset = Dataset(str(tmp_path))
+
+    assert len(dataset.shards) == 2
+    assert len(dataset) == records > 0
+    assert dataset.n_features == len(FeatureSpace())
+
+    features, offsets, targets, results = next(dataset.batches(8, default_rng(0)))
+    assert set(targets) <= {0, 1, 2, 3}
+    assert set(results) <= {-1, 0, 1}
+    assert features.max() < dataset.n_features
+
+
+def test_self_play_fails_fast_on_a_missing_model(tmp_path):
+    with raises(FileNotFoundError):
+        self_play(
+            str(tmp_path / "data"),
+            ("greedy", "tail"),
+            n_games=2,
+            processes=2,
+            model_path=str(tmp_path / "none"),
+        )
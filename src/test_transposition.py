@@ -0,0 +1,45 @@
+from time import perf_counter
+
+from search import Search, SpaceEvaluator
+from simulator import UP, DOWN, LEFT
+from transposition import EXACT, LOWER, TranspositionTable
+from utils.test import build_test_simulator
+
+
+def test_store_and_replace():
+    table = TranspositionTable(size=100)
+    assert len(table) == 64
+
+    table.store(3, 4, EXACT, 0.75, LEFT)
+    assert table.probe(3) == (4, EXACT, 0.75, LEFT)
+    assert table.probe(3 + 64) is None
+
+    # A shallower result of the same search does not replace a deeper one
+    table.store(3 + 64, 2, LOWER, 0.5, UP)
+    assert table.probe(3) == (4, EXACT, 0.75, LEFT)
+
+    # But any result of a newer search does
+    table.new_search()
+    table.store(3 + 64, 2, LOWER, 0.5, UP)
+    assert table.probe(3) is None
+    assert table.probe(3 + 64) == (2, LOWER, 0.5, UP)
+
+
+def test_search_with_table():
+    simulator = build_test_simulator(
+        5,
+        3,
+        me=[(1, 1), (2, 1), (3, 1), (4, 1)],
+        opponents=[[(0, 2), (1, 2), (2, 2), (3, 2), (4, 2)]],
+    )
+    table = TranspositionTable(size=1024)
+    search = Search(SpaceEvaluator(), max_depth=4, table=table)
+
+    assert search.search(simulator, 1, perf_counter() + 1) == DOWN
+    assert table.probe(simulator.hash(1))[3] == DOWN
+    assert simulator.history == []
+
+    # The stored results of the previous search are reused
+    nodes = search.nodes
+    assert search.search(simulator, 1, perf_counter() + 1) == DOWN
+    assert search.nodes < nodes
@@ -0,0 +1,542 @@
+from argparse import ArgumentParser
+from json import dump as dump_json, load as load_json
+from multiprocessing import get_context
+from os import cpu_count, listdir, makedirs
+from os.path import exists, getsize, join
+from time import perf_counter
+
+from numpy import (
+    add,
+    arange,
+    asarray,
+    concatenate,
+    cumsum,
+    diff,
+    float32,
+    int8,
+    intp,
+    memmap,
+    repeat,
+    rint,
+    sqrt,
+    uint8,
+    uint16,
+    uint64,
+    unique,
+    zeros,
+)
+from numpy.random import default_rng
+
+from arena import create_player, play_game
+from features import FeatureSpace
+from mcts import NNUE_OUTPUTS
+from model_file import save_model
+from nnue import NNUE
+
+"""
+Battlesnake self-play records, and training of the efficiently updatable neural network.
+"""
+
+VERSION = 1
+RESULTS = {"loss": -1, "draw": 0, "win": 1}
+
+
+class RecordWriter:
+    """
+    Appends (active features, move, result) records to a shard of a dataset.
+
+    A shard is a directory of flat arrays that can be memory-mapped: the uint16 feature
+    indices of every record one after the other, the uint64 offsets of every record into
+    them, the uint8 move targets, in the network's output order, and the int8 results, 1
+    for a win, 0 for a draw and -1 for a loss. The shard is only read once close() writes
+    its meta.json.
+    """
+
+    def __init__(self, directory, feature_space):
+        """
+        directory: The directory of the shard, which must not exist yet.
+        feature_space: The FeatureSpace the features are indices of.
+        """
+        if len(feature_space) > 1 << 16:
+            raise ValueError("feature indices do not fit in uint16")
+
+        self.directory = directory
+        self.feature_space = feature_space
+        makedirs(directory)
+
+        self.indices = open(join(directory, "indices.u16"), "wb")
+        self.offsets = open(join(directory, "offsets.u64"), "wb")
+        self.targets = open(join(directory, "targets.u8"), "wb")
+        self.results = open(join(directory, "results.i8"), "wb")
+
+        self.records = 0
+        self.n_indices = 0
+        asarray([0], dtype=uint64).tofile(self.offsets)
+
+    def write(self, features, targets, results):
+        """
+        features: List of the arrays of active features of every record.
+        targets: The move of every record, in the network's output order.
+        results: The result of every record, 1, 0 or -1.
+        return: None.
+        """
+        if not features:
+            return
+
+        lengths = asarray([len(f) for f in features], dtype=uint64)
+        concatenate(features).astype(uint16).tofile(self.indices)
+        (self.n_indices + cumsum(lengths, dtype=uint64)).tofile(self.offsets)
+        asarray(targets, dtype=uint8).tofile(self.targets)
+        asarray(results, dtype=int8).tofile(self.results)
+
+        self.records += len(features)
+        self.n_indices += int(lengths.sum())
+
+    def close(self):
+        for file in (self.indices, self.offsets, self.targets, self.results):
+            file.close()
+
+        with open(join(self.directory, "meta.json"), "w") as meta:
+            dump_json(
+                {
+                    "version": VERSION,
+                    "records": self.records,
+                    "features": len(self.feature_space),
+                    "width": self.feature_space.width,
+                    "height": self.feature_space.height,
+                },
+                meta,
+            )
+
+
+class Dataset:
+    """
+    The records of every finished shard of a directory, memory-mapped so that only the
+    records of the current batches are ever read into memory.
+    """
+
+    def __init__(self, directory):
+        """
+        directory: The directory of the shards, as written by self_play().
+        """
+        self.shards = []
+        self.n_features = None
+
+        for name in sorted(listdir(directory)):
+            path = join(directory, name)
+            if not exists(join(path, "meta.json")):
+                continue
+            with open(join(path, "meta.json")) as meta:
+                meta = load_json(meta)
+
+            if meta["version"] != VERSION:
+                raise ValueError(f"{path} has version {meta['version']}, not {VERSION}")
+            if self.n_features is None:
+                self.n_features = meta["features"]
+            elif meta["features"] != self.n_features:
+                raise ValueError(f"{path} has a different feature space")
+            if meta["records"] == 0:
+                continue
+
+            self.shards.append(
+                (
+                    self._map(path, "indices.u16", uint16),
+                    self._map(path, "offsets.u64", uint64),
+                    self._map(path, "targets.u8", uint8),
+                    self._map(path, "results.i8", int8),
+                )
+            )
+
+    def __len__(self):
+        return sum(len(targets) for _, _, targets, _ in self.shards)
+
+    def batches(self, batch_size, rng, block_size=1 << 16):
+        """
+        batch_size: Number of records of every batch.
+        rng: A numpy Generator to shuffle with.
+        block_size: Number of consecutive records shuffled together.
+        return: Generator of (features, offsets, targets, results) batches, where the
+                features of record i are features[offsets[i]:offsets[i + 1]]
+
+        Shards, blocks of records within them, and records within blocks are shuffled, so
+        records are read nearly in order while batches still mix many games.
+        """
+        blocks = [
+            (shard, start)
+            for shard, (_, _, targets, _) in enumerate(self.shards)
+            for start in range(0, len(targets), block_size)
+        ]
+        for block in rng.permutation(len(blocks)):
+            shard, start = blocks[block]
+            indices, offsets, targets, results = self.shards[shard]
+
+            end = min(start + block_size, len(targets))
+            records = start + rng.permutation(end - start)
+            for batch in range(0, len(records), batch_size):
+                batch = records[batch : batch + batch_size]
+                yield self._gather(indices, offsets, batch) + (
+                    asarray(targets[batch], dtype=intp),
+                    asarray(results[batch], dtype=int8),
+                )
+
+    def _gather(self, indices, offsets, records):
+        starts = asarray(offsets[records], dtype=intp)
+        lengths = asarray(offsets[records + 1], dtype=intp) - starts
+
+        batch_offsets = zeros(len(records) + 1, dtype=intp)
+        cumsum(lengths, out=batch_offsets[1:])
+        positions = repeat(starts - batch_offsets[:-1], lengths) + arange(
+            batch_offsets[-1]
+        )
+        return asarray(indices[positions], dtype=intp), batch_offsets
+
+    def _map(self, path, name, dtype):
+        path = join(path, name)
+        # Empty files cannot be memory-mapped
+        if getsize(path) == 0:
+            return zeros(0, dtype=dtype)
+        return memmap(path, dtype=dtype, mode="r")
+
+
+class Trainer:
+    """
+    Trains the layers of an NNUE with Adam, as Q-values in WDL space over its 4 outputs.
+
+    Every output is the value of its move, where 0 is a loss, 0.5 a draw and 1 a win, as for
+    the shipped models and as the search reads them. The output of every played move is
+    regressed on the result of its game, and the outputs of the other moves are left alone.
+
+    The feature transformer only sees the few active features of every position, so its
+    gradient and Adam moments are only computed and updated for the rows of those features.
+    """
+
+    def __init__(self, n_features, hidden=256, learning_rate=1e-3, seed=0):
+        """
+        n_features: Number of input features.
+        hidden: Number of neurons of both hidden layers.
+        learning_rate: Step size of Adam.
+        seed: Seed of the initial weights.
+        """
+        rng = default_rng(seed)
+        self.learning_rate = learning_rate
+
+        # Feature-major like NNUE.feature_weights, so every feature's weights are one row
+        self.params = {
+            "feature_weights": rng.normal(0, 0.1, (n_features, hidden)),
+            "ft_bias": zeros(hidden),
+            "l1_weight": rng.normal(0, sqrt(2 / hidden), (hidden, hidden)),
+            "l1_bias": zeros(hidden),
+            "l2_weight": rng.normal(0, sqrt(1 / hidden), (4, hidden)),
+            "l2_bias": zeros(4),
+        }
+        self.params = {k: v.astype(float32) for k, v in self.params.items()}
+        self.moments = {
+            k: (zeros(v.shape, float32), zeros(v.shape, float32))
+            for k, v in self.params.items()
+        }
+        self.steps = 0
+
+    def step(self, features, offsets, targets, results):
+        """
+        features: The active features of every record of the batch, one after the other.
+        offsets: Where the features of every record start, and where the last one ends.
+        targets: The move of every record, in the network's output order.
+        results: The result of every record, 1, 0 or -1.
+        return: The (mean squared error, accuracy) of the batch, before the step, where
+                the accuracy is the fraction of moves whose value is nearest their result
+        """
+        p = self.params
+        n = len(targets)
+
+        accumulator = add.reduceat(p["feature_weights"][features], offsets[:-1], axis=0)
+        accumulator += p["ft_bias"]
+        l1_x = accumulator.clip(0)
+        l1_y = l1_x @ p["l1_weight"].T + p["l1_bias"]
+        l2_x = l1_y.clip(0)
+        outputs = l2_x @ p["l2_weight"].T + p["l2_bias"]
+
+        rows = arange(n)
+        errors = outputs[rows, targets] - _wdl(results)
+        loss = float((errors * errors).mean())
+        accuracy = _accuracy(outputs[rows, targets], results)
+
+        d_outputs = zeros(outputs.shape, dtype=outputs.dtype)
+        d_outputs[rows, targets] = 2 * errors / n
+
+        d_l2_x = d_outputs @ p["l2_weight"]
+        d_l1_y = d_l2_x * (l1_y > 0)
+        d_l1_x = d_l1_y @ p["l1_weight"]
+        d_accumulator = d_l1_x * (accumulator > 0)
+
+        # Every active feature's row gets the gradient of the accumulators it is part of
+        active, inverse = unique(features, return_inverse=True)
+        d_rows = zeros((len(active), d_accumulator.shape[1]), dtype=float32)
+        add.at(d_rows, inverse, repeat(d_accumulator, diff(offsets), axis=0))
+
+        self.steps += 1
+        self._adam("feature_weights", d_rows, active)
+        self._adam("ft_bias", d_accumulator.sum(axis=0))
+        self._adam("l1_weight", d_l1_y.T @ l1_x)
+        self._adam("l1_bias", d_l1_y.sum(axis=0))
+        self._adam("l2_weight", d_outputs.T @ l2_x)
+        self._adam("l2_bias", d_outputs.sum(axis=0))
+
+        return loss, accuracy
+
+    def model(self):
+        """
+        return: An NNUE with a copy of the current weights
+        """
+        p = self.params
+        return NNUE(
+            p["feature_weights"].T.copy(),
+            p["ft_bias"].copy(),
+            p["l1_weight"].copy(),
+            p["l1_bias"].copy(),
+            p["l2_weight"].copy(),
+            p["l2_bias"].copy(),
+        )
+
+    def _adam(self, name, gradient, rows=None, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        param = self.params[name]
+        m, v = self.moments[name]
+        if rows is not None:
+            # Lazily, only the rows of active features are moved
+            param, m, v = param[rows], m[rows], v[rows]
+
+        m *= beta1
+        m += (1 - beta1) * gradient
+        v *= beta2
+        v += (1 - beta2) * gradient * gradient
+        m_hat = m / (1 - beta1**self.steps)
+        v_hat = v / (1 - beta2**self.steps)
+        param -= self.learning_rate * m_hat / (sqrt(v_hat) + epsilon)
+
+        if rows is not None:
+            self.params[name][rows] = param
+            self.moments[name][0][rows] = m
+            self.moments[name][1][rows] = v
+
+
+def self_play(
+    directory,
+    specs=("search", "search"),
+    n_games=100,
+    processes=None,
+    games_per_shard=16,
+    max_turns=500,
+    seed=0,
+    model_path=None,
+    search_budget=20,
+):
+    """
+    directory: The directory of the dataset, to add shards to.
+    specs: The two players of every game, as given to arena.create_player.
+    n_games: Number of games.
+    processes: Number of worker processes, one for every core by default.
+    games_per_shard: Number of games of every shard, written by one worker.
+    max_turns: Turn after which a game is a draw.
+    seed: Seed of the first game, the others count up from it.
+    model_path: The path of the model of strategies that name none.
+    search_budget: Milliseconds Logic may search for.
+    return: Number of records written
+    """
+    # The network only plays standard 11x11 duels, so only those are recorded
+    if len(specs) != 2:
+        raise ValueError("self-play games are duels")
+    makedirs(directory, exist_ok=True)
+
+    shards = [
+        (directory, start, min(games_per_shard, seed + n_games - start))
+        for start in range(seed, seed + n_games, games_per_shard)
+    ]
+    # Models are loaded once, here, so that a bad one fails before any worker starts. The
+    # forked workers inherit the players instead of loading their own
+    players = [create_player(spec, model_path, search_budget) for spec in specs]
+
+    context = get_context("fork")
+    with context.Pool(
+        processes or cpu_count(),
+        initializer=_start_worker,
+        initargs=(players, max_turns),
+    ) as pool:
+        return sum(pool.imap_unordered(_play_shard, shards))
+
+
+def train(
+    dataset,
+    hidden=256,
+    epochs=1,
+    batch_size=1024,
+    learning_rate=1e-3,
+    validation=None,
+    seed=0,
+    log=print,
+):
+    """
+    dataset: The Dataset to train on.
+    hidden: Number of neurons of both hidden layers.
+    epochs: Number of passes over the dataset.
+    batch_size: Number of records of every step.
+    learning_rate: Step size of Adam.
+    validation: A Dataset to report the loss on after every epoch, or None.
+    seed: Seed of the weights and shuffling.
+    log: Function called with a line of progress after every epoch.
+    return: The trained NNUE
+    """
+    rng = default_rng(seed)
+    trainer = Trainer(dataset.n_features, hidden, learning_rate, seed=seed)
+
+    for epoch in range(epochs):
+        start = perf_counter()
+        total_loss = total_accuracy = 0.0
+        batches = 0
+        for batch in dataset.batches(batch_size, rng):
+            loss, accuracy = trainer.step(*batch)
+            total_loss += loss
+            total_accuracy += accuracy
+            batches += 1
+
+        line = (
+            f"epoch {epoch + 1}: loss {total_loss / max(batches, 1):.4f}, "
+            f"accuracy {total_accuracy / max(batches, 1):.3f}, "
+            f"{perf_counter() - start:.1f}s"
+        )
+        if validation is not None:
+            loss, accuracy = evaluate(trainer.model(), validation, batch_size)
+            line += f", validation loss {loss:.4f}, accuracy {accuracy:.3f}"
+        log(line)
+
+    return trainer.model()
+
+
+def evaluate(model, dataset, batch_size=1024):
+    """
+    model: An NNUE.
+    dataset: The Dataset to evaluate on.
+    batch_size: Number of records evaluated at once.
+    return: The (mean squared error, accuracy) of the values of the played moves, as
+            Trainer.step
+    """
+    total_loss = 0.0
+    correct = 0.0
+    n = 0
+    rng = default_rng(0)
+    for features, offsets, targets, results in dataset.batches(batch_size, rng):
+        hidden = add.reduceat(model.feature_weights[features], offsets[:-1], axis=0)
+        outputs = model._evaluate(hidden + model.ft_bias)
+        values = outputs[arange(len(targets)), targets]
+
+        errors = values - _wdl(results)
+        total_loss += float((errors * errors).sum())
+        correct += _accuracy(values, results) * len(targets)
+        n += len(targets)
+
+    return total_loss / max(n, 1), correct / max(n, 1)
+
+
+def _wdl(results):
+    # Results of 1, 0 and -1 are worth 1, 0.5 and 0
+    return (asarray(results, dtype=float32) + 1) / 2
+
+
+def _accuracy(values, results):
+    # The result nearest to every value, in steps of a draw
+    nearest = rint(values.clip(0, 1) * 2) - 1
+    return float((nearest == results).mean()) if len(results) else 0.0
+
+
+_worker = None
+
+
+def _start_worker(players, max_turns):
+    # Forked workers get the parent's players without pickling, and reuse them for every game
+    global _worker
+    _worker = (players, max_turns, FeatureSpace())
+
+
+def _play_shard(shard):
+    directory, start, n_games = shard
+    players, max_turns, feature_space = _worker
+
+    writer = RecordWriter(join(directory, f"shard-{start:08d}"), feature_space)
+    for seed in range(start, start + n_games):
+        features = []
+        targets = []
+        snakes = []
+
+        def observe(simulator, index, move):
+            features.append(feature_space.extract_simulator(simulator, index))
+            targets.append(NNUE_OUTPUTS[move])
+            snakes.append(index)
+
+        # Seats alternate, so that both players start from every square
+        seats = [seed % 2, 1 - seed % 2]
+        results = play_game(
+            [players[seat] for seat in seats],
+            [str(seat) for seat in seats],
+            f"self-play-{seed}",
+            feature_space.width,
+            max_turns,
+            seed,
+            observe,
+        )
+        outcomes = [RESULTS[outcome] for _, outcome, _ in results]
+        writer.write(features, targets, [outcomes[snake] for snake in snakes])
+
+    writer.close()
+    return writer.records
+
+
+if __name__ == "__main__":
+    # python src/training.py self-play data --games 1000
+    # python src/training.py train data src/model.nnue --epochs 4
+    parser = ArgumentParser(description="Generate self-play data and train a model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    play = commands.add_parser("self-play", help="add self-play games to a dataset")
+    play.add_argument("directory")
+    play.add_argument("--players", nargs=2, default=["search", "search"])
+    play.add_argument("--games", type=int, default=100)
+    play.add_argument("--processes", type=int, help="one for every core by default")
+    play.add_argument("--games-per-shard", type=int, default=16)
+    play.add_argument("--max-turns", type=int, default=500)
+    play.add_argument("--seed", type=int, default=0)
+    play.add_argument("--model", help="model of the players, none by default")
+    play.add_argument("--search-budget", type=float, default=20)
+
+    fit = commands.add_parser("train", help="train a model on a dataset")
+    fit.add_argument("directory")
+    fit.add_argument("output", help="path of the model file, e.g. src/model.nnue")
+    fit.add_argument("--hidden", type=int, default=256)
+    fit.add_argument("--epochs", type=int, default=1)
+    fit.add_argument("--batch-size", type=int, default=1024)
+    fit.add_argument("--learning-rate", type=float, default=1e-3)
+    fit.add_argument("--validation", help="dataset directory to report the loss on")
+    fit.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "self-play":
+        records = self_play(
+            args.directory,
+            args.players,
+            args.games,
+            args.processes,
+            args.games_per_shard,
+            args.max_turns,
+            args.seed,
+            args.model,
+            args.search_budget,
+        )
+        print(f"{records} records written to {args.directory}")
+    else:
+        model = train(
+            Dataset(args.directory),
+            args.hidden,
+            args.epochs,
+            args.batch_size,
+            args.learning_rate,
+            Dataset(args.validation) if args.validation else None,
+            args.seed,
+        )
+        save_model(model, args.output)
@@ -0,0 +1,80 @@
+from numpy import full, int8, float64, uint8, uint64, zeros
+
+"""
+Battlesnake transposition table.
+"""
+
+EXACT, LOWER, UPPER = range(1, 4)
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results, indexed by the Zobrist hash of a position.
+
+    Positions are hashed by Simulator.hash(), whose key make() and unmake() keep up to date
+    from the squares that changed: food, heads, segments and their directions, healths,
+    lengths, and which snake is ours. Every slot holds the full key, so colliding positions
+    are told apart. A slot is replaced by a result that was searched at least as deep, or by
+    any result of a newer search.
+    """
+
+    def __init__(self, size=1 << 16):
+        """
+        size: Number of slots, rounded down to a power of two.
+        """
+        size = 1 << max(size.bit_length() - 1, 0)
+        self.mask = size - 1
+        self.age = 0
+
+        self.keys = zeros(size, dtype=uint64)
+        self.depths = full(size, -1, dtype=int8)
+        self.bounds = zeros(size, dtype=uint8)
+        self.values = zeros(size, dtype=float64)
+        self.moves = full(size, -1, dtype=int8)
+        self.ages = zeros(size, dtype=uint8)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def new_search(self):
+        # Results of earlier searches stay usable, but are the first to be replaced
+        self.age = (self.age + 1) % 256
+
+    def probe(self, key):
+        """
+        key: Zobrist hash of a position.
+        return: The (depth, bound, value, move) stored for the position, or None
+        """
+        slot = key & self.mask
+        if self.depths[slot] < 0 or int(self.keys[slot]) != key:
+            return None
+        return (
+            int(self.depths[slot]),
+            int(self.bounds[slot]),
+            float(self.values[slot]),
+            int(self.moves[slot]),
+        )
+
+    def store(self, key, depth, bound, value, move):
+        """
+        key: Zobrist hash of a position.
+        depth: Number of turns the position was searched.
+        bound: EXACT, LOWER or UPPER, for how value relates to the true value.
+        value: Value of the position.
+        move: Best move found, or -1.
+        return: None.
+        """
+        slot = key & self.mask
+        if (
+            self.depths[slot] >= 0
+            and self.ages[slot] == self.age
+            and self.depths[slot] > depth
+        ):
+            return
+
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.bounds[slot] = bound
+        self.values[slot] = value
+        self.moves[slot] = move
+        self.ages[slot] = self.age
@@ -0,0 +1,41 @@
+from numpy import full, int32, zeros_like
+
+UNREACHABLE = 2 ** 31 - 1
+
+
+def calc_distance_maps(empty, starts):
+    """
+    empty: Boolean array of shape (height, width), True where a square can be travelled through.
+    starts: List of (x, y) squares to travel from, one per distance map.
+    return: Array of shape (len(starts), height, width) holding the number of turns needed
+            to reach every square from each start, or UNREACHABLE.
+
+    All starts are expanded together, one wavefront per turn, so the work is a handful of
+    whole-board array operations per turn instead of a Python loop per square.
+    """
+    height, width = empty.shape
+    distances = full((len(starts), height, width), UNREACHABLE, dtype=int32)
+    frontier = zeros_like(distances, dtype=bool)
+
+    for i, (x, y) in enumerate(starts):
+        if not (0 <= x < width and 0 <= y < height):
+            continue
+        distances[i, y, x] = 0
+        frontier[i, y, x] = True
+
+    reached = frontier.copy()
+    turns = 0
+    while frontier.any():
+        turns += 1
+
+        grown = zeros_like(frontier)
+        grown[:, 1:, :] |= frontier[:, :-1, :]
+        grown[:, :-1, :] |= frontier[:, 1:, :]
+        grown[:, :, 1:] |= frontier[:, :, :-1]
+        grown[:, :, :-1] |= frontier[:, :, 1:]
+
+        frontier = grown & empty & ~reached
+        reached |= frontier
+        distances[frontier] = turns
+
+    return distances
@@ -1,6 +1,8 @@
 from utils.vector import Vector, up, down, left, right
 from utils.snake import Snake
+from utils.distance_maps import UNREACHABLE, calc_distance_maps
 from copy import copy
+from numpy import nonzero, ones
 
 
 class GameState(object):
@@ -8,6 +10,7 @@ class GameState(object):
         self.data = data
         self._empty_squares = None
         self._empty_squares_with_tails = None
+        self._empty_grid = None
         self._food = None
         self._snakes = None
         self._all_snakes = None
@@ -62,6 +65,19 @@ class GameState(object):
         self._empty_squares = empty_squares
         return empty_squares
 
+    def empty_grid(self):
+        if self._empty_grid is not None:
+            return self._empty_grid
+
+        empty_grid = ones((self.board_height, self.board_width), dtype=bool)
+        for snake in [self.me] + self.opponents:
+            for p in snake.coords:
+                if self.on_board(p):
+                    empty_grid[p.y, p.x] = False
+
+        self._empty_grid = empty_grid
+        return empty_grid
+
     def first_empty_direction(self, start, options, default=up):
         for v in options:
             if self.is_empty(start + v):
@@ -113,20 +129,19 @@ class GameState(object):
             all_tails.append(s.tail)
         return all_tails
 
+    def travel_time_maps(self, starts):
+        return calc_distance_maps(self.empty_grid(), [(v.x, v.y) for v in starts])
+
     def travel_times(self, start):
-        shortest_travel_times = {start.key: 0}
+        if not self.on_board(start):
+            return {start.key: 0}
 
-        to_visit = [(start, 0)]
-        i = 0
-        while len(to_visit) > 0:
-            i += 1
-            if i > 1000:
-                print("broken travel times")
-            (curr, turns) = to_visit.pop(0)
-            for next in curr.neighbours():
-                if self.is_empty(next) and next.key not in shortest_travel_times:
-                    shortest_travel_times[next.key] = turns + 1
-                    to_visit.append((next, turns + 1))
+        distances = self.travel_time_maps([start])[0]
+        ys, xs = nonzero(distances != UNREACHABLE)
+
+        shortest_travel_times = {}
+        for x, y, turns in zip(xs.tolist(), ys.tolist(), distances[ys, xs].tolist()):
+            shortest_travel_times[Vector(x, y).key] = turns
         return shortest_travel_times
 
     def best_paths_to(self, start, goals, allow_length_1=False):
@@ -238,16 +253,25 @@ class GameState(object):
         return self._food
 
     def next_gamestate(self, moves):
+        # Snakes are copied as they move, so this game state is left untouched
         next_payload = copy(self.data)
-        for snake_id, direction in moves:
-            p = self.me.head + direction
-            next_coord = {"x": p.x, "y": p.y}
-            if snake_id == self.me.id:
-                next_payload["you"]["body"].insert(0, next_coord)
-                del next_payload["you"]["body"][-1]
-
-            for i in range(0, len(next_payload["board"]["snakes"])):
-                if next_payload["board"]["snakes"][i]["id"] == snake_id:
-                    next_payload["board"]["snakes"][i] = next_payload["you"]
-                    break
+        next_payload["board"] = copy(self.data["board"])
+
+        moves = dict(moves)
+        next_snakes = []
+        for snake in self.data["board"]["snakes"]:
+            if snake["id"] in moves:
+                head = snake["body"][0]
+                p = Vector(head["x"], head["y"]) + moves[snake["id"]]
+                next_coord = {"x": p.x, "y": p.y}
+
+                snake = copy(snake)
+                snake["body"] = [next_coord] + snake["body"][:-1]
+                snake["head"] = next_coord
+
+            if snake["id"] == self.me.id:
+                next_payload["you"] = snake
+            next_snakes.append(snake)
+
+        next_payload["board"]["snakes"] = next_snakes
         return GameState(next_payload)
@@ -1,3 +1,4 @@
+from simulator import Simulator
 from utils.game_state import GameState
 
 
@@ -5,6 +6,7 @@ def build_test_gamestate(width=3, height=3, me=[(0, 0)], opponents=[], food=[]):
     def _tuples_to_snake(tuples):
         return {
             "body": _tuples_to_coords(tuples),
+            "head": _tuples_to_coords(tuples[:1])[0],
             "health": 100,
             "id": "58a0142f-4cd7-4d35-9b17-815ec8ff8e70",
             "length": len(tuples),
@@ -29,3 +31,11 @@ def build_test_gamestate(width=3, height=3, me=[(0, 0)], opponents=[], food=[]):
     data["board"]["snakes"].append(data["you"])
     gs = GameState(data)
     return gs
+
+
+def build_test_simulator(*args, **kwargs):
+    # Snakes are told apart by their index, with the snake of "me" last
+    data = build_test_gamestate(*args, **kwargs).data
+    for i, snake in enumerate(data["board"]["snakes"]):
+        snake["id"] = str(i)
+    return Simulator.from_request(data)
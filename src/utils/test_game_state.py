@@ -1,5 +1,6 @@
 from utils.vector import Vector as V
 from utils.test import build_test_gamestate
+from utils.distance_maps import UNREACHABLE
 
 
 def test_empty():
@@ -44,3 +45,27 @@ def test_distance_to_turn_around():
     dists1 = gs1.best_paths_to(headV, [tailV])
     expected1 = [(tailV, 4, [headV, V(1, 1), V(1, 0), tailV])]
     assert dists1 == expected1
+
+
+def test_travel_times():
+    gs = build_test_gamestate(3, 2, me=[(1, 0), (1, 1)])
+    assert gs.travel_times(V(1, 0)) == {"1_0": 0, "0_0": 1, "2_0": 1, "0_1": 2, "2_1": 2}
+
+
+def test_travel_time_maps():
+    gs = build_test_gamestate(3, 1, me=[(0, 0)], opponents=[[(2, 0)]])
+    gs.data["board"]["snakes"][0]["id"] = "opponent"
+    maps = gs.travel_time_maps([V(0, 0), V(2, 0)])
+    assert maps.shape == (2, 1, 3)
+    assert maps[0].tolist() == [[0, 1, UNREACHABLE]]
+    assert maps[1].tolist() == [[UNREACHABLE, 1, 0]]
+
+
+def test_next_gamestate():
+    gs = build_test_gamestate(3, 3, me=[(1, 1), (1, 2)], opponents=[[(0, 0), (0, 1)]])
+    gs.data["board"]["snakes"][0]["id"] = "opponent"
+
+    next_gs = gs.next_gamestate([("opponent", V(1, 0))])
+    assert next_gs.all_snakes[0].coords == [V(1, 0), V(0, 0)]
+    assert next_gs.me.coords == [V(1, 1), V(1, 2)]
+    assert gs.all_snakes[0].coords == [V(0, 0), V(0, 1)]